@@ -1,10 +1,92 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
-from image_collage_maker import CollageGenerator
+from flask import Flask, Request, Response, render_template, request, jsonify
+from io import BytesIO
 import os
+import tempfile
+import time
+
+# The collage engine (Pillow and its codecs, ...) is imported by the routes that render, so
+# processes that only serve pages and files start without paying for it.
+
+
+class SpooledRequest(Request):
+    """A request whose uploaded files are kept in memory up to UPLOAD_SPOOL_BYTES each.
+
+    Werkzeug writes every file of a request larger than 500 KB to a temporary file;
+    here each file only spills to disk once it is itself larger than the threshold.
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=app.config['UPLOAD_SPOOL_BYTES'], mode='w+b')
+
 
 app = Flask(__name__)
+app.request_class = SpooledRequest
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['COLLAGE_FOLDER'] = 'collages'
+# Pre-warmed render workers: their number (0 renders in the request thread instead),
+# and the job count and resident memory (MB) after which a worker is replaced
+app.config['RENDER_WORKERS'] = int(os.environ.get('RENDER_WORKERS', os.cpu_count() or 1))
+app.config['RENDER_MAX_JOBS'] = int(os.environ.get('RENDER_MAX_JOBS', 200))
+app.config['RENDER_MAX_MEMORY_MB'] = int(os.environ.get('RENDER_MAX_MEMORY_MB', 1024))
+app.config['RENDER_TIMEOUT'] = 120
+app.config['DEFAULT_DIMENSIONS'] = (1200, 1200)
+# Uploads to /collage stay in memory up to this size per file
+app.config['UPLOAD_SPOOL_BYTES'] = int(os.environ.get('UPLOAD_SPOOL_BYTES', 8 * 1024 * 1024))
+# Storage budgets of uploads/ and collages/: size (MB), file count and time to live
+# since last access (hours), and the seconds between sweeps (see storage_manager)
+app.config['UPLOADS_MAX_MB'] = int(os.environ.get('UPLOADS_MAX_MB', 2048))
+app.config['UPLOADS_MAX_FILES'] = int(os.environ.get('UPLOADS_MAX_FILES', 20000))
+app.config['UPLOADS_TTL_HOURS'] = float(os.environ.get('UPLOADS_TTL_HOURS', 24))
+app.config['COLLAGES_MAX_MB'] = int(os.environ.get('COLLAGES_MAX_MB', 10240))
+app.config['COLLAGES_MAX_FILES'] = int(os.environ.get('COLLAGES_MAX_FILES', 200000))
+app.config['COLLAGES_TTL_HOURS'] = float(os.environ.get('COLLAGES_TTL_HOURS', 24 * 30))
+app.config['STORAGE_SWEEP_SECONDS'] = int(os.environ.get('STORAGE_SWEEP_SECONDS', 300))
+# Let the front-end server (nginx, Apache) send collage files itself, from X-Sendfile headers
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '') == '1'
+
+# Output formats of /collage: Pillow format, MIME type and file extension
+COLLAGE_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg'),
+    'png': ('PNG', 'image/png', 'png'),
+    'webp': ('WEBP', 'image/webp', 'webp'),
+}
+
+_render_pool = None
+
+def get_render_pool():
+    """Returns the render worker pool, starting it on first use.
+
+    Returns:
+        RenderPool: The pool, or None if RENDER_WORKERS is 0.
+    """
+    global _render_pool
+    if _render_pool is None and app.config['RENDER_WORKERS'] > 0:
+        from render_pool import RenderPool
+        _render_pool = RenderPool(app.config['COLLAGE_FOLDER'],
+                                  processes=app.config['RENDER_WORKERS'],
+                                  max_jobs_per_worker=app.config['RENDER_MAX_JOBS'],
+                                  max_memory_mb=app.config['RENDER_MAX_MEMORY_MB'],
+                                  warm_dimensions=[app.config['DEFAULT_DIMENSIONS']]).start()
+    return _render_pool
+
+_storage = None
+
+def get_storage():
+    """Returns the storage manager of uploads/ and collages/, starting its sweeper on first use.
+
+    Returns:
+        StorageManager: The manager.
+    """
+    global _storage
+    if _storage is None:
+        from storage_manager import StorageBudget, StorageManager
+        mb = 1024 * 1024
+        _storage = StorageManager({
+            'uploads': StorageBudget(app.config['UPLOAD_FOLDER'], app.config['UPLOADS_MAX_MB'] * mb,
+                                     app.config['UPLOADS_MAX_FILES'], app.config['UPLOADS_TTL_HOURS'] * 3600),
+            'collages': StorageBudget(app.config['COLLAGE_FOLDER'], app.config['COLLAGES_MAX_MB'] * mb,
+                                      app.config['COLLAGES_MAX_FILES'], app.config['COLLAGES_TTL_HOURS'] * 3600),
+        }, interval=app.config['STORAGE_SWEEP_SECONDS']).start()
+    return _storage
 
 @app.route('/')
 def index():
@@ -32,10 +114,12 @@ def upload_files():
         return jsonify({'error': 'No selected files'}), 400
 
     filepaths = []
+    storage = get_storage()
     for file in files:
         if file:
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
             file.save(filepath)
+            storage.record('uploads', os.path.getsize(filepath))
             filepaths.append(filepath)
 
     return jsonify({'filepaths': filepaths})
@@ -44,35 +128,330 @@ def upload_files():
 def generate_collage():
     """Generates a collage from the uploaded files.
 
-    Takes a list of filepaths, creates a collage using CollageGenerator,
-    and returns the URL of the generated collage.
+    Takes a list of filepaths (and optionally a style preset name and layout), renders
+    the collage on a pre-warmed render worker and returns the URL of the generated collage.
+    A "seed" gives the collage the layout of the preview rendered with the same seed
+    (see /preview_collage). With "reuse": true, a collage already made from the same
+    images and settings is returned without rendering again. With "stream": true (and
+    an optional "format"), the collage itself is returned instead, streamed as it is
+    encoded, and no file is written. With "latency_budget_ms", the render settings are
+    chosen to render and encode the collage within that many milliseconds (see
+    render_budget), and no HTML page is exported.
 
     Returns:
-        flask.Response: A JSON response containing the URL of the generated collage.
+        flask.Response: A JSON response containing the name of the generated collage
+                        ('collage_url') and its content-versioned URL ('immutable_url'),
+                        plus the chosen 'render_settings' and the predicted and measured
+                        'render_ms' with a latency budget, the streamed collage, or an error
+                        message if rendering failed.
     """
     data = request.get_json()
+    job = {
+        'image_files': data.get('filepaths', []),
+        'dimensions': app.config['DEFAULT_DIMENSIONS'],
+        'style': data.get('style', 'modern'),
+        'layout': data.get('layout'),
+        'seed': data.get('seed'),
+    }
+    from config import STYLE_PRESETS
+    if job['style'] not in STYLE_PRESETS:
+        return jsonify({'error': f"Unknown style '{job['style']}'"}), 400
+
+    pool = get_render_pool()
+    if data.get('stream'):
+        # The collage is streamed back as it is encoded, and never written to disk
+        output_format = data.get('format') or default_format(STYLE_PRESETS[job['style']])
+        if output_format not in COLLAGE_FORMATS:
+            return jsonify({'error': f"Unknown format '{output_format}'"}), 400
+        return stream_collage(pool, job.pop('image_files'), job, output_format)
+    # A collage already made from the same images and settings is returned as is
+    job['reuse'] = bool(data.get('reuse'))
+    method = 'create_single_collage'
+    if data.get('latency_budget_ms') is not None:
+        try:
+            job['latency_budget'] = float(data['latency_budget_ms']) / 1000
+        except (TypeError, ValueError):
+            job['latency_budget'] = 0
+        if job['latency_budget'] <= 0:
+            return jsonify({'error': 'latency_budget_ms must be a positive number'}), 400
+        method = 'create_budgeted_collage'
+    started = time.time()
+    try:
+        if pool is not None:
+            result = pool.render(method, timeout=app.config['RENDER_TIMEOUT'], **job)
+        else:
+            from image_collage_maker import CollageGenerator
+            generator = CollageGenerator(images_dir=None, output_dir=app.config['COLLAGE_FOLDER'])
+            job['style'] = generator.style_presets[job['style']]
+            result = getattr(generator, method)(**job)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    collage_path = result['path'] if isinstance(result, dict) else result
+
+    from http_cache import file_version
+    storage = get_storage()
+    for filepath in job['image_files']:
+        storage.touch(filepath)
+    # A reused (or content-identical) collage was counted when it was written; the
+    # second of slack covers filesystems that store whole-second mtimes
+    if os.path.getmtime(collage_path) >= started - 1:
+        storage.record('collages', os.path.getsize(collage_path))
+    name = os.path.relpath(collage_path, app.config['COLLAGE_FOLDER']).replace(os.sep, '/')
+    response = {'collage_url': name, 'immutable_url': f"/c/{file_version(collage_path)}/{name}"}
+    if isinstance(result, dict):
+        response['render_settings'] = result['settings']
+        response['render_ms'] = {'budget': round(job['latency_budget'] * 1000),
+                                 'predicted': round(sum(result['predicted'].values()) * 1000),
+                                 'measured': round(result['seconds'] * 1000)}
+    return jsonify(response)
+
+@app.route('/preview_collage', methods=['POST'])
+def preview_collage():
+    """Renders a quick, low-resolution preview of a collage.
+
+    Takes the same JSON as /generate_collage (filepaths, style, layout, seed). The
+    preview is rendered in the request thread, so it never waits behind full renders
+    queued on the pool, and returned directly. Rendering /generate_collage with the same
+    seed then gives the full-quality version of the same layout, which replaces it.
+
+    Returns:
+        flask.Response: The preview (JPEG, or PNG for transparent styles), with its seed in
+                        the X-Collage-Seed header, or a JSON error message.
+    """
+    import random
+    from config import PREVIEW, STYLE_PRESETS
+    from output_sinks import encode_collage
+
+    data = request.get_json()
+    style_name = data.get('style', 'modern')
+    if style_name not in STYLE_PRESETS:
+        return jsonify({'error': f"Unknown style '{style_name}'"}), 400
     filepaths = data.get('filepaths', [])
+    if not filepaths:
+        return jsonify({'error': 'No filepaths'}), 400
+    # Small enough to survive a round trip through a JavaScript number
+    seed = data.get('seed')
+    if seed is None:
+        seed = random.getrandbits(52)
+
+    try:
+        from image_collage_maker import CollageGenerator
+        generator = CollageGenerator(images_dir=None, output_dir=app.config['COLLAGE_FOLDER'])
+        preview = generator.render_preview(filepaths, app.config['DEFAULT_DIMENSIONS'], STYLE_PRESETS[style_name],
+                                           layout=data.get('layout'), seed=seed)
+        buffer = BytesIO()
+        if default_format(STYLE_PRESETS[style_name]) == 'png':
+            encode_collage(preview, buffer, 'PNG', compress_level=PREVIEW['png_compress_level'])
+            mimetype = 'image/png'
+        else:
+            encode_collage(preview, buffer, 'JPEG', quality=PREVIEW['jpeg_quality'])
+            mimetype = 'image/jpeg'
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    return Response(buffer.getvalue(), mimetype=mimetype,
+                    headers={'X-Collage-Seed': str(seed), 'Cache-Control': 'no-store'})
+
+@app.route('/collage', methods=['POST'])
+def collage():
+    """Renders a collage from uploaded images in a single request.
+
+    The images are decoded straight from the upload buffers, which stay in memory up to
+    UPLOAD_SPOOL_BYTES per file. The collage is streamed back while it is encoded, so
+    nothing is written to disk. Form fields: 'files' (the images), and optional 'style',
+    'layout', 'title' and 'format' ('jpeg', 'png' or 'webp'; defaults to PNG for
+    transparent styles and JPEG otherwise).
+
+    Returns:
+        flask.Response: The encoded collage, or a JSON error message.
+    """
+    import random
+    from PIL import Image, UnidentifiedImageError
+    from config import STYLE_PRESETS, TRANSFORM_QUALITY
+    from grid_layouts import compile_layout
+    from image_collage_maker import CollageGenerator
+    from tile_transform import TileTransform, prepare_source
+
+    files = [file for file in request.files.getlist('files') if file]
+    if not files:
+        return jsonify({'error': 'No files part'}), 400
+    style_name = request.form.get('style', 'modern')
+    if style_name not in STYLE_PRESETS:
+        return jsonify({'error': f"Unknown style '{style_name}'"}), 400
+    output_format = request.form.get('format') or default_format(STYLE_PRESETS[style_name])
+    if output_format not in COLLAGE_FORMATS:
+        return jsonify({'error': f"Unknown format '{output_format}'"}), 400
+    dimensions = app.config['DEFAULT_DIMENSIONS']
+    style = STYLE_PRESETS[style_name]
+
+    # The layout is drawn here, from a seed the render draws it from again, so each
+    # image can be decoded for the cell it lands in
+    seed = random.getrandbits(52)
+    try:
+        layout_config = CollageGenerator.choose_layout(len(files), request.form.get('layout'), dimensions, style,
+                                                       random.Random(seed))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    cells = compile_layout(tuple(layout_config['layout'][:len(files)]), tuple(dimensions), style['border_size'])
+    gap = TRANSFORM_QUALITY['quality']['reducing_gap']
+
+    images = []
+    try:
+        for i, file in enumerate(files):
+            image = Image.open(file.stream)
+            if i < len(cells):
+                # JPEGs are decoded at the smallest DCT scale that still leaves their tile
+                # its full resampling headroom, other images are box reduced to it
+                tile_size = TileTransform.for_cell(image.size, cells[i], style['border_size'], 0).tile_size
+                image = prepare_source(image, tile_size, gap)
+            # Decoded now, so a corrupt or truncated upload is a 400 rather than a failed render
+            image.load()
+            images.append(image)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError, ValueError) as e:
+        return jsonify({'error': f"Cannot decode {file.filename}: {e}"}), 400
+
+    job = {'dimensions': dimensions, 'style': style_name, 'layout': request.form.get('layout'),
+           'title': request.form.get('title') or None, 'seed': seed}
+    return stream_collage(get_render_pool(), images, job, output_format)
+
+def default_format(style: dict) -> str:
+    """Returns the output format of a style: PNG if its background is transparent, JPEG otherwise."""
+    return 'png' if style['background_color'] == 'transparent' else 'jpeg'
+
+def stream_collage(pool, images, job: dict, output_format: str):
+    """Renders a collage and streams it back while it is encoded.
+
+    The collage is rendered before the response starts, so rendering errors still get
+    an error status. Encoding then runs in a thread writing to an
+    output_sinks.StreamingSink, and the response is sent chunked as the encoder
+    produces bytes.
+
+    Args:
+        pool (RenderPool): The render pool, or None to render in this thread.
+        images (list): The decoded images, or the filenames of the images.
+        job (dict): The other arguments of render_collage (dimensions, style name, layout, title).
+        output_format (str): A key of COLLAGE_FORMATS.
+
+    Returns:
+        flask.Response: The streamed collage, or a JSON error message.
+    """
+    from output_sinks import encode_collage, stream_encoding
+
+    pillow_format, mimetype, extension = COLLAGE_FORMATS[output_format]
+    try:
+        if pool is not None:
+            handles = [pool.share_image(image) if hasattr(image, 'mode') else image for image in images]
+            future = pool.submit_image('render_collage', job['dimensions'], mode='RGBA', image_files=handles, **job)
+            # The sources are freed when the job ends, even if this request stops waiting first
+            future.add_done_callback(lambda _: [pool.release_image(handle) for handle in handles
+                                                if not isinstance(handle, str)])
+            try:
+                shared = future.result(timeout=app.config['RENDER_TIMEOUT'])
+            except TimeoutError:
+                future.add_done_callback(lambda done: done.exception() or done.result().release())
+                raise
+            # The encoder thread frees the shared buffer once it is done with it
+            chunks = stream_encoding(encode_shared, shared, pillow_format)
+        else:
+            from image_collage_maker import CollageGenerator
+            from config import STYLE_PRESETS
+            generator = CollageGenerator(images_dir=None, output_dir=app.config['COLLAGE_FOLDER'])
+            result = generator.render_collage(images, **dict(job, style=STYLE_PRESETS[job['style']]))
+            chunks = stream_encoding(encode_collage, result, image_format=pillow_format)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    return Response(chunks, mimetype=mimetype,
+                    headers={'Content-Disposition': f'inline; filename="collage.{extension}"'})
+
+def encode_shared(shared, pillow_format: str, output):
+    """Encodes a collage received from a render worker, then releases its shared buffer.
+
+    Args:
+        shared (SharedImage): The collage.
+        pillow_format (str): 'JPEG', 'PNG' or 'WEBP'.
+        output: A writable binary sink.
+    """
+    from output_sinks import encode_collage
+
+    # The image wraps the shared buffer, so it must be gone before the buffer is released
+    image = shared.image()
+    try:
+        encode_collage(image, output, pillow_format)
+    finally:
+        del image
+        shared.release()
 
-    generator = CollageGenerator(images_dir=None, output_dir=app.config['COLLAGE_FOLDER'])
-    collage_path = generator.create_single_collage(filepaths, (1200, 1200))
+@app.route('/render_stats')
+def render_stats():
+    """Reports the state of the render worker pool.
 
-    return jsonify({'collage_url': os.path.basename(collage_path)})
+    Returns:
+        flask.Response: A JSON response with the pool's counters.
+    """
+    pool = get_render_pool()
+    return jsonify(pool.stats() if pool is not None else {'workers': 0})
+
+@app.route('/storage_stats')
+def storage_stats():
+    """Reports the usage, budgets and evictions of uploads/ and collages/.
+
+    Returns:
+        flask.Response: A JSON response with the storage manager's counters.
+    """
+    return jsonify(get_storage().stats())
 
-@app.route('/collages/<filename>')
+@app.route('/collages/<path:filename>')
 def serve_collage(filename):
-    """Serves a generated collage file.
+    """Serves a generated collage file, or one of the image assets of its HTML page.
+
+    The response carries the file's content hash as a strong ETag and must be
+    revalidated, which costs a 304 while the file is unchanged.
+
+    Args:
+        filename (str): The path of the file, relative to COLLAGE_FOLDER.
+
+    Returns:
+        flask.Response: The requested collage file, or 304 Not Modified.
+    """
+    from http_cache import send_cached_file
+    from werkzeug.security import safe_join
+    get_storage().touch(safe_join(app.config['COLLAGE_FOLDER'], filename))
+    return send_cached_file(app.config['COLLAGE_FOLDER'], filename)
+
+@app.route('/c/<version>/<path:filename>')
+def serve_versioned_collage(version, filename):
+    """Serves a collage file from its immutable URL, which contains its content hash.
+
+    Such URLs ('immutable_url' of /generate_collage) never change content, so the
+    response may be cached without revalidation: for a year, or for COLLAGES_TTL_HOURS
+    if that is shorter. Serving the file refreshes its access time (at most TOUCH_INTERVAL
+    late), so the sweeper keeps the file at least as long as clients may cache it.
 
     Args:
-        filename (str): The name of the collage file to serve.
+        version (str): The start of the file's content hash (see http_cache.file_version).
+        filename (str): The path of the file, relative to COLLAGE_FOLDER.
 
     Returns:
-        flask.Response: The requested collage file.
+        flask.Response: The requested collage file, or 304 Not Modified.
     """
-    return send_from_directory(app.config['COLLAGE_FOLDER'], filename)
+    from http_cache import IMMUTABLE_MAX_AGE, send_cached_file
+    from storage_manager import TOUCH_INTERVAL
+    from werkzeug.security import safe_join
+    get_storage().touch(safe_join(app.config['COLLAGE_FOLDER'], filename))
+    ttl = int(app.config['COLLAGES_TTL_HOURS'] * 3600) - TOUCH_INTERVAL
+    max_age = max(0, min(IMMUTABLE_MAX_AGE, ttl))
+    return send_cached_file(app.config['COLLAGE_FOLDER'], filename, version, max_age)
 
 if __name__ == '__main__':
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
         os.makedirs(app.config['UPLOAD_FOLDER'])
     if not os.path.exists(app.config['COLLAGE_FOLDER']):
         os.makedirs(app.config['COLLAGE_FOLDER'])
-    app.run(debug=True)
+    # Calibrate the latency budget cost model and warm the workers before accepting
+    # traffic; the reloader would start a second pool
+    from render_budget import calibrate_cost_model
+    calibrate_cost_model()
+    get_render_pool()
+    get_storage()
+    app.run(debug=True, use_reloader=False)
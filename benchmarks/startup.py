@@ -0,0 +1,156 @@
+"""Cold-start benchmark for the collage generator's entry points.
+
+Every measurement runs in a fresh interpreter, so nothing is cached in sys.modules.
+For each entry point this reports the median wall time of importing it and the
+slowest modules it pulls in (from `python -X importtime`). Results can be saved as
+JSON and compared against a saved baseline to catch start-up regressions:
+
+    python3 benchmarks/startup.py
+    python3 benchmarks/startup.py --save startup.json
+    python3 benchmarks/startup.py --compare startup.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Entry point name -> module imported to start it
+ENTRY_POINTS = {
+    'library': 'image_collage_maker',
+    'cli': 'cli',
+    'web': 'app',
+    'watcher': 'watcher',
+}
+
+# Modules that must not be loaded just by importing an entry point
+LAZY_MODULES = ('requests', 'imageio_ffmpeg', 'pillow_heif', 'sqlite3')
+
+_TIMER = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, ",".join(m for m in {lazy!r} if m in sys.modules))
+'''
+
+
+def time_import(module: str) -> Tuple[float, List[str]]:
+    """Imports a module in a fresh interpreter.
+
+    Args:
+        module (str): The module to import.
+
+    Returns:
+        Tuple[float, List[str]]: The import time in seconds, and the LAZY_MODULES that got loaded.
+    """
+    output = subprocess.run([sys.executable, '-c', _TIMER.format(module=module, lazy=LAZY_MODULES)],
+                            cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout
+    elapsed, loaded = output.split()[0], output.split()[1:]
+    return float(elapsed), loaded[0].split(',') if loaded else []
+
+
+def slowest_imports(module: str, top: int = 5) -> List[Tuple[str, float]]:
+    """Lists the slowest top-level dependencies of a module.
+
+    Args:
+        module (str): The module to import.
+        top (int, optional): The number of dependencies to list. Defaults to 5.
+
+    Returns:
+        List[Tuple[str, float]]: (module, cumulative milliseconds) pairs, slowest first.
+    """
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=REPO_DIR, capture_output=True, text=True, check=True).stderr
+    entries = []
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and 'cumulative' not in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            entries.append((len(name) - len(name.lstrip(' ')), name.strip(), int(cumulative) / 1000))
+
+    # importtime lists a module after everything it imported, so the entry point's own
+    # subtree is the run of nested lines right before it (earlier lines belong to site)
+    timings = []
+    end = max(i for i, (depth, name, _) in enumerate(entries) if depth == 1 and name == module)
+    for depth, name, cumulative in reversed(entries[:end]):
+        if depth == 1:
+            break
+        if depth == 3:
+            timings.append((name, cumulative))
+    return sorted(timings, key=lambda item: item[1], reverse=True)[:top]
+
+
+def run(repeat: int) -> Dict[str, dict]:
+    """Measures every entry point.
+
+    Args:
+        repeat (int): The number of fresh interpreters per entry point.
+
+    Returns:
+        Dict[str, dict]: Per entry point: module, median/min milliseconds, eagerly loaded
+        lazy modules and slowest imports.
+    """
+    results = {}
+    for name, module in ENTRY_POINTS.items():
+        samples, loaded = [], []
+        for _ in range(repeat):
+            elapsed, loaded = time_import(module)
+            samples.append(elapsed * 1000)
+        results[name] = {
+            'module': module,
+            'median_ms': round(statistics.median(samples), 2),
+            'min_ms': round(min(samples), 2),
+            'eager_heavy_imports': loaded,
+            'slowest_imports': slowest_imports(module),
+        }
+    return results
+
+
+def main(argv: List[str] = None) -> int:
+    """The entry point of the benchmark.
+
+    Returns:
+        int: 1 if --compare found a regression or a heavy module was imported eagerly, else 0.
+    """
+    parser = argparse.ArgumentParser(description="Measure import (cold-start) time of each entry point.")
+    parser.add_argument('--repeat', type=int, default=7, help="fresh interpreters per entry point (default: 7)")
+    parser.add_argument('--save', metavar='JSON', help="write the results to this file")
+    parser.add_argument('--compare', metavar='JSON', help="compare against results saved with --save")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed relative slow-down when comparing (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat)
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    status = 0
+    print(f"{'entry point':<12} {'median':>9} {'min':>9}  slowest imports")
+    for name, result in results.items():
+        slowest = ", ".join(f"{module} {ms:.0f}ms" for module, ms in result['slowest_imports'])
+        line = f"{name:<12} {result['median_ms']:>7.1f}ms {result['min_ms']:>7.1f}ms  {slowest}"
+        if name in baseline:
+            before = baseline[name]['median_ms']
+            change = (result['median_ms'] - before) / before
+            line += f"  ({change:+.0%} vs baseline)"
+            if change > args.tolerance:
+                status = 1
+        print(line)
+        if result['eager_heavy_imports']:
+            print(f"{'':<12} eagerly imports: {', '.join(result['eager_heavy_imports'])}")
+            status = 1
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
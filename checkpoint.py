@@ -0,0 +1,172 @@
+"""Persistent, resumable state for long collage runs.
+
+This file keeps track of which images have been used and which collages have been
+finished, in a SQLite database that survives crashes. Images are keyed by content
+hash, so two files with the same name in different directories do not collide and
+a renamed copy of a used image is still recognised.
+- content_key: The content hash of a local image (or of the URL for remote images).
+- collage_key: A stable key for a collage made of given images with given settings.
+- CheckpointStore: The durable store of used images and finished collages.
+"""
+import hashlib
+import json
+import os
+import time
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+
+@lru_cache(maxsize=4096)
+def _hash_file(path: str, size: int, mtime_ns: int) -> str:
+    """Hashes a file's content. Cached per (path, size, mtime) so unchanged files are read once."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_key(source: str) -> str:
+    """Computes the key of an image.
+
+    Local files are keyed by the SHA-256 of their content. Remote images are keyed by
+    their URL, so checking whether one was used does not require downloading it.
+
+    Args:
+        source (str): The path or URL of the image.
+
+    Returns:
+        str: The key of the image.
+    """
+    if source.startswith(('http://', 'https://')):
+        return 'url:' + hashlib.sha256(source.encode('utf-8')).hexdigest()
+    stat = os.stat(source)
+    return _hash_file(os.path.abspath(source), stat.st_size, stat.st_mtime_ns)
+
+
+def collage_key(image_keys: List[str], **settings) -> str:
+    """Computes a stable key for a collage.
+
+    Args:
+        image_keys (List[str]): The keys of the collage's images, in order.
+        **settings: Any JSON-serializable render settings (dimensions, style, layout...).
+
+    Returns:
+        str: The key of the collage.
+    """
+    spec = json.dumps({'images': list(image_keys), 'settings': settings}, sort_keys=True, default=list)
+    return hashlib.sha256(spec.encode('utf-8')).hexdigest()
+
+
+class CheckpointStore:
+    """A durable record of used images and finished collages.
+
+    Each finished collage is recorded together with its images in a single
+    transaction, so after a crash the store describes exactly the collages that were
+    completed and a rerun picks up with the next one.
+
+    Attributes:
+        path (str): The path to the SQLite database.
+    """
+    def __init__(self, path: str):
+        """Initializes the CheckpointStore, creating the database if needed.
+
+        Args:
+            path (str): The path to the SQLite database.
+        """
+        import sqlite3
+
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS images (
+                    key TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    collage_key TEXT,
+                    used_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS collages (
+                    key TEXT PRIMARY KEY,
+                    output TEXT,
+                    images TEXT NOT NULL,
+                    completed_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS file_hashes (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    key TEXT NOT NULL
+                );
+            ''')
+
+    def image_key(self, source: str) -> str:
+        """Computes the key of an image, reusing hashes stored by earlier runs.
+
+        Args:
+            source (str): The path or URL of the image.
+
+        Returns:
+            str: The key of the image (see content_key).
+        """
+        if source.startswith(('http://', 'https://')):
+            return content_key(source)
+
+        path = os.path.abspath(source)
+        stat = os.stat(path)
+        row = self._conn.execute('SELECT size, mtime_ns, key FROM file_hashes WHERE path = ?',
+                                 (path,)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+
+        key = content_key(path)
+        with self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?)',
+                               (path, stat.st_size, stat.st_mtime_ns, key))
+        return key
+
+    def used_image_keys(self) -> set:
+        """Loads the keys of every image used so far.
+
+        Returns:
+            set: The image keys.
+        """
+        return {key for (key,) in self._conn.execute('SELECT key FROM images')}
+
+    def find_collage(self, key: str) -> Optional[str]:
+        """Looks up a finished collage.
+
+        Args:
+            key (str): The collage key (see collage_key).
+
+        Returns:
+            str: The output path of the collage, or None if it was not finished.
+        """
+        row = self._conn.execute('SELECT output FROM collages WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def record_collage(self, key: str, output: Optional[str], image_keys: Iterable[str],
+                       sources: Iterable[str]):
+        """Records a finished collage and marks its images as used, atomically.
+
+        Args:
+            key (str): The collage key (see collage_key).
+            output (str): The output path of the collage (None if rendering failed and the
+                images should simply not be retried).
+            image_keys (Iterable[str]): The keys of the collage's images.
+            sources (Iterable[str]): The paths or URLs of the collage's images.
+        """
+        image_keys = list(image_keys)
+        now = time.time()
+        with self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO collages VALUES (?, ?, ?, ?)',
+                               (key, output, json.dumps(image_keys), now))
+            self._conn.executemany('INSERT OR IGNORE INTO images VALUES (?, ?, ?, ?)',
+                                   [(image_key, source, key, now)
+                                    for image_key, source in zip(image_keys, sources)])
+
+    def close(self):
+        """Closes the database."""
+        self._conn.close()
@@ -0,0 +1,552 @@
+"""Non-interactive command-line interface for the collage generator.
+
+Unlike `image_collage_maker.main()`, which asks for every choice through `input()`,
+this interface takes everything from flags so it can be scripted and used for
+batch backfills:
+
+    python3 cli.py single images/ --style modern --dimension Square
+    python3 cli.py batch "shoot/*.jpg" --per-collage 6 --jobs 4
+    python3 cli.py batch manifest.json --jobs 8
+    python3 cli.py animated images/ --format gif --frames 12
+    python3 cli.py mosaic photos/ --target portrait.jpg --columns 120
+
+Inputs can be directories, glob patterns, image paths or URLs, or JSON/CSV manifests.
+- A JSON manifest is either a list of image paths or a list of collages, each an
+  object with "images" and optional "style", "dimension", "layout" and "title" keys
+  (a {"collages": [...]} wrapper is also accepted).
+- A CSV manifest has an "image" column and optional "collage", "style", "dimension",
+  "layout" and "title" columns. Rows sharing a "collage" value form one collage.
+Relative paths in a manifest are resolved against the manifest's directory.
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from typing import List, Tuple
+
+from config import DIMENSIONS, STYLE_PRESETS, TRANSFORM_QUALITY, VIDEO_QUALITY
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.heic')
+MANIFEST_EXTENSIONS = ('.json', '.csv')
+JOB_KEYS = ('style', 'dimension', 'layout', 'title')
+
+
+def parse_dimension(value: str) -> Tuple[int, int]:
+    """Parses a dimension flag.
+
+    Args:
+        value (str): A DIMENSIONS preset name (case-insensitive) or "WIDTHxHEIGHT".
+
+    Returns:
+        Tuple[int, int]: The width and height of the collage.
+
+    Raises:
+        argparse.ArgumentTypeError: If the value is neither a preset nor a valid size.
+    """
+    for name, dims in DIMENSIONS.items():
+        if name.lower() == value.lower():
+            return dims
+
+    try:
+        width, height = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        presets = ", ".join(DIMENSIONS)
+        raise argparse.ArgumentTypeError(f"invalid dimension '{value}' (use WIDTHxHEIGHT or one of: {presets})")
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError("dimensions must be positive integers")
+    return (width, height)
+
+
+def expand_input(value: str) -> List[str]:
+    """Expands a directory, glob pattern, path or URL into image sources.
+
+    Args:
+        value (str): The input as given on the command line.
+
+    Returns:
+        List[str]: The image paths or URLs, sorted for directories and globs.
+
+    Raises:
+        FileNotFoundError: If the input matches nothing.
+    """
+    if value.startswith(('http://', 'https://')):
+        return [value]
+    if os.path.isdir(value):
+        return sorted(os.path.join(value, f) for f in os.listdir(value)
+                      if f.lower().endswith(IMAGE_EXTENSIONS))
+    if glob.has_magic(value):
+        matches = sorted(f for f in glob.glob(value) if f.lower().endswith(IMAGE_EXTENSIONS))
+        if not matches:
+            raise FileNotFoundError(f"No images match '{value}'")
+        return matches
+    if os.path.isfile(value):
+        return [value]
+    raise FileNotFoundError(f"No such file or directory: '{value}'")
+
+
+def _resolve(path: str, base_dir: str) -> str:
+    """Resolves a manifest entry against the manifest's directory."""
+    if path.startswith(('http://', 'https://')) or os.path.isabs(path):
+        return path
+    return os.path.join(base_dir, path)
+
+
+def load_manifest(path: str) -> Tuple[List[dict], List[str]]:
+    """Loads a JSON or CSV manifest.
+
+    Args:
+        path (str): The path to the manifest.
+
+    Returns:
+        Tuple[List[dict], List[str]]: The collages defined explicitly by the manifest
+        (dicts with "images" and optional JOB_KEYS), and loose images that still have
+        to be grouped.
+
+    Raises:
+        ValueError: If the manifest is malformed.
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    if path.lower().endswith('.json'):
+        with open(path) as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get('collages', [])
+        if not isinstance(data, list):
+            raise ValueError(f"{path}: expected a list of images or collages")
+
+        jobs, loose = [], []
+        for entry in data:
+            if isinstance(entry, str):
+                loose.append(_resolve(entry, base_dir))
+            elif isinstance(entry, dict) and entry.get('images'):
+                job = {key: entry[key] for key in JOB_KEYS if entry.get(key)}
+                job['images'] = [_resolve(image, base_dir) for image in entry['images']]
+                jobs.append(job)
+            else:
+                raise ValueError(f"{path}: invalid manifest entry {entry!r}")
+        return jobs, loose
+
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    if rows and 'image' not in rows[0]:
+        raise ValueError(f"{path}: CSV manifest needs an 'image' column")
+
+    groups, loose = {}, []
+    for row in rows:
+        image = _resolve(row['image'], base_dir)
+        group_id = row.get('collage')
+        if not group_id:
+            loose.append(image)
+            continue
+        # The first row of a group carries its settings
+        job = groups.setdefault(group_id, {key: row[key] for key in JOB_KEYS if row.get(key)})
+        job.setdefault('images', []).append(image)
+    return list(groups.values()), loose
+
+
+def collect_jobs(inputs: List[str], per_collage: int = None) -> List[dict]:
+    """Turns command-line inputs into render jobs.
+
+    Args:
+        inputs (List[str]): Directories, globs, paths, URLs or manifests.
+        per_collage (int, optional): How many loose images go into each collage.
+            Defaults to None, which puts all loose images into a single collage.
+
+    Returns:
+        List[dict]: The jobs, each with "images" and optional JOB_KEYS overrides.
+    """
+    jobs, loose = [], []
+    for value in inputs:
+        if value.lower().endswith(MANIFEST_EXTENSIONS) and os.path.isfile(value):
+            manifest_jobs, manifest_loose = load_manifest(value)
+            jobs.extend(manifest_jobs)
+            loose.extend(manifest_loose)
+        else:
+            loose.extend(expand_input(value))
+
+    if loose:
+        size = per_collage or len(loose)
+        jobs.extend({'images': loose[i:i + size]} for i in range(0, len(loose), size))
+    return jobs
+
+
+def render_job(job: dict) -> dict:
+    """Renders one collage job. Runs in a worker process when --jobs is above 1.
+
+    Args:
+        job (dict): The job, with "images", "output_dir", "style", "dimension" and
+            optional "layout", "title", "quality", "html", "html_mode", "sizes", "latency_budget_ms",
+            "animated" (and "tween") settings.
+
+    Returns:
+        dict: The job result, with "output", "seconds" and "megapixels".
+    """
+    from image_collage_maker import CollageGenerator
+
+    start = time.perf_counter()
+    generator = CollageGenerator(images_dir=None, output_dir=job['output_dir'],
+                                 transform_quality=job.get('quality', 'quality'))
+    style = STYLE_PRESETS[job['style']]
+    dimensions = tuple(job['dimension'])
+
+    if job.get('animated'):
+        encoding = {'colors': job.get('colors', 256), 'quantizer': job.get('quantizer', 'mediancut'),
+                    'max_fps': job.get('max_fps'), 'video_quality': job.get('video_quality', 'balanced'),
+                    'video_options': job.get('video_options')}
+        if job.get('tween'):
+            output = generator.create_tween_animation(
+                job['images'], dimensions, style, layouts=job.get('layouts'), keyframes=job.get('keyframes', 3),
+                transition_frames=job.get('transition_frames', 24), hold_frames=job.get('hold_frames', 12),
+                duration=job['duration'], output_format=job['format'], seed=job.get('seed'), **encoding)
+            keyframes = len(job.get('layouts') or []) or job.get('keyframes', 3)
+            transitions = keyframes if keyframes > 1 else 0  # looping back to the first layout
+            n_frames = (keyframes * max(1, job.get('hold_frames', 12))
+                        + transitions * job.get('transition_frames', 24))
+        else:
+            output = generator.create_animated_collage(
+                job['images'], dimensions, title=job.get('title') or "Animated Collage",
+                num_frames=job['frames'], duration=job['duration'], style=style,
+                output_format=job['format'], layout=job.get('layout'), workers=job.get('workers', 1),
+                seed=job.get('seed'), **encoding)
+            n_frames = job['frames']
+        pixels = dimensions[0] * dimensions[1] * n_frames
+    elif job.get('sizes'):
+        # Every size from a single decode of each image
+        results = generator.create_collage_sizes(job['images'], [tuple(size) for size in job['sizes']], style,
+                                                 layout=job.get('layout'), title=job.get('title'), seed=job.get('seed'))
+        output = ', '.join(result['path'] for result in results)
+        pixels = sum(width * height for width, height in (result['dimensions'] for result in results))
+    elif job.get('latency_budget_ms'):
+        # Settings chosen to render within the budget, instead of --quality
+        result = generator.create_budgeted_collage(
+            job['images'], dimensions, job['latency_budget_ms'] / 1000, style, layout=job.get('layout'),
+            title=job.get('title'), html=job.get('html', True), html_mode=job.get('html_mode', 'images'))
+        output = result['path']
+        pixels = dimensions[0] * dimensions[1]
+    else:
+        output = generator.create_single_collage(
+            job['images'], dimensions, title=job.get('title'), style=style,
+            layout=job.get('layout'), html=job.get('html', True), html_mode=job.get('html_mode', 'images'))
+        pixels = dimensions[0] * dimensions[1]
+
+    return {'output': output, 'seconds': time.perf_counter() - start, 'megapixels': pixels / 1e6}
+
+
+def run_jobs(jobs: List[dict], n_jobs: int = 1, checkpoint=None) -> int:
+    """Renders jobs, reporting progress and throughput.
+
+    Args:
+        jobs (List[dict]): The fully resolved jobs (see render_job).
+        n_jobs (int, optional): The number of worker processes. Defaults to 1 (in-process).
+        checkpoint (CheckpointStore, optional): Where each finished job is recorded, as
+            soon as it completes. Jobs must then carry "key" and "image_keys". Defaults to None.
+
+    Returns:
+        int: The number of failed jobs.
+    """
+    total = len(jobs)
+    done = failed = 0
+    megapixels = 0.0
+    start = time.perf_counter()
+
+    def report(job, result=None, error=None):
+        nonlocal done, failed, megapixels
+        done += 1
+        if error is not None:
+            failed += 1
+            print(f"[{done}/{total}] FAILED {job['images'][0]} (+{len(job['images']) - 1}): {error}")
+            return
+        megapixels += result['megapixels']
+        if checkpoint is not None:
+            checkpoint.record_collage(job['key'], result['output'], job['image_keys'], job['images'])
+        print(f"[{done}/{total}] {result['output']} ({result['seconds']:.2f}s)")
+
+    if n_jobs <= 1:
+        for job in jobs:
+            try:
+                report(job, render_job(job))
+            except Exception as e:
+                report(job, error=e)
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = {executor.submit(render_job, job): job for job in jobs}
+            for future in as_completed(futures):
+                try:
+                    report(futures[future], future.result())
+                except Exception as e:
+                    report(futures[future], error=e)
+
+    elapsed = time.perf_counter() - start
+    succeeded = total - failed
+    print(f"Rendered {succeeded}/{total} collages in {elapsed:.2f}s "
+          f"({succeeded / elapsed:.2f} collages/s, {megapixels / elapsed:.2f} MP/s)")
+    return failed
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the argument parser.
+
+    Returns:
+        argparse.ArgumentParser: The parser with the single, batch, animated, watch and mosaic subcommands.
+    """
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument('--style', choices=list(STYLE_PRESETS), default='modern',
+                        help="style preset (default: modern)")
+    options.add_argument('--dimension', type=parse_dimension, default=DIMENSIONS['Square'],
+                        help="a preset (" + ", ".join(DIMENSIONS) + ") or WIDTHxHEIGHT (default: Square)")
+    options.add_argument('--layout', help="grid layout name, e.g. 'Grid 2x3', or 'Scatter' (default: random)")
+    options.add_argument('--title', help="title drawn on the collage")
+    options.add_argument('--quality', choices=list(TRANSFORM_QUALITY), default='quality',
+                        help="tile resampling preset (default: quality)")
+    options.add_argument('-o', '--output-dir', default='collages',
+                        help="directory for the generated collages (default: collages)")
+
+    inputs = argparse.ArgumentParser(add_help=False, parents=[options])
+    inputs.add_argument('inputs', nargs='+',
+                        help="image files, URLs, directories, glob patterns or JSON/CSV manifests")
+
+    parser = argparse.ArgumentParser(description="Generate image collages without interactive prompts.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    single = subparsers.add_parser('single', parents=[inputs], help="render one collage from all inputs")
+    single.add_argument('--no-html', dest='html', action='store_false', help="skip the HTML export")
+    single.add_argument('--sizes', type=parse_dimension, nargs='+', metavar='SIZE',
+                        help="render several sizes (presets or WIDTHxHEIGHT) from one decode of each image, "
+                             "instead of --dimension; no HTML export")
+    single.add_argument('--latency-budget-ms', type=float, metavar='MS',
+                        help="choose the resampling filters, shadows and encoder effort to render and encode "
+                             "within this many milliseconds, instead of --quality (see render_budget)")
+    single.add_argument('--html-mode', choices=['images', 'sprite'], default='images',
+                       help="HTML export: one file per image, or one sprite atlas per page (default: images)")
+
+    batch = subparsers.add_parser('batch', parents=[inputs], help="render many collages")
+    batch.add_argument('--per-collage', type=int, default=6,
+                       help="images per collage for inputs outside a manifest collage (default: 6)")
+    batch.add_argument('-j', '--jobs', type=int, default=1,
+                       help="number of parallel worker processes (default: 1)")
+    batch.add_argument('--no-html', dest='html', action='store_false', help="skip the HTML export")
+    batch.add_argument('--html-mode', choices=['images', 'sprite'], default='images',
+                       help="HTML export: one file per image, or one sprite atlas per page (default: images)")
+    batch.add_argument('--checkpoint', metavar='DB',
+                       help="SQLite file recording finished collages; rerunning with it skips them")
+
+    animated = subparsers.add_parser('animated', parents=[inputs], help="render an animated collage")
+    animated.add_argument('--format', choices=['gif', 'mp4'], default='gif', help="output format (default: gif)")
+    animated.add_argument('--frames', type=int, default=10, help="number of frames (default: 10)")
+    animated.add_argument('--duration', type=float,
+                          help="seconds per frame (default: 0.5, or 1/30 with --tween)")
+    animated.add_argument('-j', '--jobs', type=int, default=1,
+                          help="processes rendering frames in parallel (default: 1)")
+    animated.add_argument('--seed', type=int, help="seed of the random frames, to reproduce an animation")
+    animated.add_argument('--tween', action='store_true',
+                          help="move the tiles smoothly between layouts instead of showing unrelated random frames")
+    animated.add_argument('--layouts', nargs='+', metavar='NAME',
+                          help="with --tween: the layouts to move through, in order (default: random)")
+    animated.add_argument('--keyframes', type=int, default=3,
+                          help="with --tween: the number of random layouts (default: 3)")
+    animated.add_argument('--transition-frames', type=int, default=24,
+                          help="with --tween: frames of each transition (default: 24)")
+    animated.add_argument('--hold-frames', type=int, default=12,
+                          help="with --tween: frames each layout is held for (default: 12)")
+    animated.add_argument('--colors', type=int, default=256, help="GIF palette size, 2-256 (default: 256)")
+    animated.add_argument('--quantizer', choices=['mediancut', 'fast'], default='mediancut',
+                          help="GIF palette quantizer: best colors or faster (default: mediancut)")
+    animated.add_argument('--max-fps', type=float,
+                          help="highest GIF frame rate; faster animations drop frames (default: 50)")
+    animated.add_argument('--video-quality', choices=list(VIDEO_QUALITY), default='balanced',
+                          help="MP4 encoding preset, from fastest to smallest (default: balanced)")
+    animated.add_argument('--x264-preset', dest='preset', help="override the libx264 preset, e.g. veryfast or slow")
+    animated.add_argument('--crf', type=int, help="override the MP4 constant rate factor (lower is better, 0-51)")
+    animated.add_argument('--pix-fmt', help="override the MP4 pixel format, e.g. yuv444p")
+    animated.add_argument('--threads', type=int, help="MP4 encoder threads (default: chosen by ffmpeg)")
+    animated.add_argument('--no-faststart', dest='faststart', action='store_false', default=None,
+                          help="leave the MP4 index at the end of the file")
+
+    watch = subparsers.add_parser('watch', parents=[options],
+                                  help="render collages from new images as they arrive in a directory")
+    watch.add_argument('directory', help="the directory to watch")
+    watch.add_argument('--group-size', type=int, default=6, help="images per collage (default: 6)")
+    watch.add_argument('--window', type=float, default=60.0,
+                       help="seconds an image waits for its group to fill before a smaller collage is made (default: 60)")
+    watch.add_argument('--debounce', type=float, default=2.0,
+                       help="seconds a new file must stay unchanged before it is used (default: 2)")
+    watch.add_argument('--process-existing', action='store_true',
+                       help="also use images already in the directory when the watch starts")
+    watch.add_argument('--no-html', dest='html', action='store_false', help="skip the HTML export")
+    watch.add_argument('--html-mode', choices=['images', 'sprite'], default='images',
+                       help="HTML export: one file per image, or one sprite atlas per page (default: images)")
+    watch.add_argument('--checkpoint', metavar='DB',
+                       help="SQLite file recording used images, so a restarted watch never reuses them")
+
+    mosaic = subparsers.add_parser('mosaic', help="render a photo mosaic or contact sheet from a tile atlas")
+    mosaic.add_argument('inputs', nargs='*',
+                        help="images to add to the atlas (directories, glob patterns, files or manifests); "
+                             "may be omitted to reuse the atlas as is")
+    mosaic.add_argument('--atlas', default='tile_atlas', help="tile atlas directory (default: tile_atlas)")
+    mosaic.add_argument('--cell', type=parse_dimension, default=(64, 64),
+                        help="thumbnail size as WIDTHxHEIGHT (default: 64x64)")
+    mosaic.add_argument('--target', help="image to recreate as a mosaic (default: render a contact sheet)")
+    mosaic.add_argument('--columns', type=int, help="thumbnails across (default: 100 for a mosaic, square sheet)")
+    mosaic.add_argument('--tint', type=float, default=0.2,
+                        help="blend of each mosaic tile towards its target color, 0-1 (default: 0.2)")
+    mosaic.add_argument('--spacing', type=int, help="gap between thumbnails (default: 0 for a mosaic, 2 for a sheet)")
+    mosaic.add_argument('-o', '--output-dir', default='collages',
+                        help="directory for the generated image (default: collages)")
+
+    return parser
+
+
+def mosaic(args: argparse.Namespace, parser: argparse.ArgumentParser) -> int:
+    """Runs the mosaic subcommand.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+        parser (argparse.ArgumentParser): The parser, used to report errors.
+
+    Returns:
+        int: The process exit code.
+    """
+    from image_collage_maker import CollageGenerator
+
+    generator = CollageGenerator(images_dir=None, output_dir=args.output_dir)
+    if args.inputs:
+        try:
+            jobs = collect_jobs(args.inputs)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    elif not os.path.exists(os.path.join(args.atlas, 'index.json')):
+        parser.error(f"no tile atlas in {args.atlas}; pass images to build one")
+
+    try:
+        if args.inputs:
+            generator.build_tile_atlas([image for job in jobs for image in job['images']], args.atlas, args.cell)
+        if args.target:
+            generator.create_mosaic(args.target, args.atlas, columns=args.columns or 100, tint=args.tint,
+                                    spacing=args.spacing or 0)
+        else:
+            generator.create_contact_sheet(args.atlas, columns=args.columns,
+                                           spacing=2 if args.spacing is None else args.spacing)
+    except ValueError as e:
+        parser.error(str(e))
+    return 0
+
+
+def watch(args: argparse.Namespace) -> int:
+    """Runs the watch subcommand until interrupted.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+        int: The process exit code.
+    """
+    from image_collage_maker import CollageGenerator
+    from watcher import FolderWatcher
+
+    generator = CollageGenerator(images_dir=args.directory, output_dir=args.output_dir,
+                                 transform_quality=args.quality, checkpoint=args.checkpoint)
+    watcher = FolderWatcher(generator, args.dimension, STYLE_PRESETS[args.style],
+                            group_size=args.group_size, window=args.window, debounce=args.debounce,
+                            process_existing=args.process_existing,
+                            title=args.title, layout=args.layout, html=args.html, html_mode=args.html_mode)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main(argv: List[str] = None) -> int:
+    """The entry point of the command-line interface.
+
+    Args:
+        argv (List[str], optional): The arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: The process exit code.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command == 'watch':
+        return watch(args)
+    if args.command == 'mosaic':
+        return mosaic(args, parser)
+
+    try:
+        jobs = collect_jobs(args.inputs, args.per_collage if args.command == 'batch' else None)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if not jobs:
+        parser.error("no images found")
+    if args.command != 'batch':
+        # single and animated render everything into one collage
+        jobs = [{'images': [image for job in jobs for image in job['images']]}]
+
+    defaults = {
+        'output_dir': args.output_dir,
+        'style': args.style,
+        'dimension': args.dimension,
+        'layout': args.layout,
+        'title': args.title,
+        'quality': args.quality,
+        'html': getattr(args, 'html', True),
+        'html_mode': getattr(args, 'html_mode', 'images'),
+        'sizes': getattr(args, 'sizes', None),
+        'latency_budget_ms': getattr(args, 'latency_budget_ms', None),
+    }
+    if args.command == 'animated':
+        duration = args.duration or (1 / 30 if args.tween else 0.5)
+        defaults.update(animated=True, format=args.format, frames=args.frames, duration=duration,
+                        workers=args.jobs, seed=args.seed, tween=args.tween, layouts=args.layouts, keyframes=args.keyframes,
+                        transition_frames=args.transition_frames, hold_frames=args.hold_frames,
+                        colors=args.colors, quantizer=args.quantizer, max_fps=args.max_fps,
+                        video_quality=args.video_quality,
+                        video_options={key: getattr(args, key)
+                                       for key in ('preset', 'crf', 'pix_fmt', 'threads', 'faststart')
+                                       if getattr(args, key) is not None})
+
+    for job in jobs:
+        for key, value in defaults.items():
+            if job.get(key) is None:
+                job[key] = value
+        if job['style'] not in STYLE_PRESETS:
+            parser.error(f"unknown style '{job['style']}' in manifest")
+        if isinstance(job['dimension'], str):
+            try:
+                job['dimension'] = parse_dimension(job['dimension'])
+            except argparse.ArgumentTypeError as e:
+                parser.error(f"{e} in manifest")
+
+    checkpoint = None
+    if getattr(args, 'checkpoint', None):
+        from checkpoint import CheckpointStore, collage_key
+        checkpoint = CheckpointStore(args.checkpoint)
+        for job in jobs:
+            # Every setting that changes the output, so changing any option renders again
+            settings = {key: value for key, value in job.items() if key not in ('images', 'workers')}
+            job['image_keys'] = [checkpoint.image_key(image) for image in job['images']]
+            job['key'] = collage_key(job['image_keys'], **settings)
+        remaining = [job for job in jobs if checkpoint.find_collage(job['key']) is None]
+        if len(remaining) < len(jobs):
+            print(f"Resuming: {len(jobs) - len(remaining)} of {len(jobs)} collages already finished")
+        jobs = remaining
+
+    if any(job.get('latency_budget_ms') for job in jobs):
+        # Measured once, before any render is timed and before the workers start
+        from render_budget import calibrate_cost_model
+        calibrate_cost_model()
+
+    # An animation is one job; its --jobs render frames in parallel instead
+    n_jobs = 1 if args.command == 'animated' else getattr(args, 'jobs', 1)
+    failed = run_jobs(jobs, n_jobs, checkpoint) if jobs else 0
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
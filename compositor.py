@@ -0,0 +1,149 @@
+"""Batched NumPy compositing of axis-aligned tiles.
+
+For presets without rotation every tile is an upright rectangle. Instead of one
+Pillow paste per tile, the tiles are composited into a single NumPy array of the
+canvas, a batch at a time. A batch is a run of tiles (in drawing order) that do not
+overlap each other, so the order of its tiles does not matter. Opaque tiles of the
+batch are copied by slice assignment, as whole 32-bit pixels. The canvas regions
+under its alpha tiles are gathered into one buffer and blended with them in a single
+vectorized pass, in premultiplied form: each tile's color times its alpha is
+computed once, and the canvas only needs scaling by the remaining coverage. The
+fixed-point rounding is that of Pillow's masked paste, so the result is
+pixel-identical to pasting the tiles one by one.
+- composite_tiles: Composites tiles onto an RGBA canvas, in place.
+- batch_tiles: Splits tiles into runs of non-overlapping tiles.
+"""
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+def _array(image: Image.Image) -> np.ndarray:
+    """Copies an image into a new (height, width, 4) array, converting it to RGBA.
+
+    Pillow writes straight into the array's memory, through an image sharing it, which
+    is several times faster than numpy.array(image) (which goes through tobytes).
+    """
+    pixels = np.empty((image.height, image.width, 4), np.uint8)
+    view = Image.frombuffer('RGBA', image.size, pixels, 'raw', 'RGBA', 0, 1)
+    view.readonly = 0  # frombuffer images are marked read-only, though the memory is ours
+    view.paste(image)
+    return pixels
+
+
+def _clip(size: Tuple[int, int], position: Tuple[int, int], canvas_size: Tuple[int, int]):
+    """Clips a tile to the canvas.
+
+    Returns:
+        Tuple[tuple, tuple]: The (rows, columns) slices of the canvas and of the tile,
+        or None if the tile is entirely outside the canvas.
+    """
+    left, top = position
+    x0, y0 = max(left, 0), max(top, 0)
+    x1, y1 = min(left + size[0], canvas_size[0]), min(top + size[1], canvas_size[1])
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return ((slice(y0, y1), slice(x0, x1)),
+            (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left)))
+
+
+def batch_tiles(boxes: Sequence[Tuple[int, int, int, int]]) -> List[List[int]]:
+    """Splits tiles, in drawing order, into runs in which no two tiles overlap.
+
+    Args:
+        boxes (Sequence[Tuple[int, int, int, int]]): The (x1, y1, x2, y2) box of each
+            tile, right and bottom edges excluded.
+
+    Returns:
+        List[List[int]]: The indices of the tiles of each batch, in order.
+    """
+    if not boxes:
+        return []
+    x1, y1, x2, y2 = np.asarray(boxes).reshape(-1, 4).T
+    # Every pair tested at once; empty boxes overlap nothing
+    overlaps = ((x1[:, None] < x2) & (x1 < x2[:, None]) & (y1[:, None] < y2) & (y1 < y2[:, None]))
+    batches, start = [], 0
+    for i in range(1, len(boxes)):
+        if overlaps[i, start:i].any():
+            batches.append(list(range(start, i)))
+            start = i
+    batches.append(list(range(start, len(boxes))))
+    return batches
+
+
+def _blend(regions: np.ndarray, tiles: np.ndarray) -> np.ndarray:
+    """Blends RGBA tile pixels over canvas pixels, both (n, 4) uint8, like Pillow's masked paste.
+
+    Pillow blends every channel, alpha included, as (dst * (255 - a) + src * a) / 255,
+    dividing with rounding as (t + 128 + ((t + 128) >> 8)) >> 8. Every step fits in 16 bits.
+    That gives the tile where it is opaque and the canvas where it is transparent, so
+    only the partly transparent pixels (antialiased edges, shadows) are computed.
+    """
+    alpha = tiles[:, 3]
+    # Whole pixels, as 32-bit words
+    words = np.where(alpha == 255, tiles.view(np.uint32)[:, 0], regions.view(np.uint32)[:, 0])
+    blended = words.view(np.uint8).reshape(-1, 4)
+    partial = np.flatnonzero(alpha - np.uint8(1) < 254)  # 0 < alpha < 255
+    if partial.size:
+        mask = alpha[partial, None].astype(np.uint16)
+        values = regions[partial] * (255 - mask)
+        values += tiles[partial] * mask  # The premultiplied tile
+        values += 128
+        values += values >> 8
+        values >>= 8
+        blended[partial] = values
+    return blended
+
+
+def composite_tiles(canvas: Image.Image, tiles: Sequence[Tuple[Image.Image, Tuple[int, int]]]):
+    """Composites tiles onto a canvas, in place.
+
+    The result is the same as calling canvas.paste(tile, position, tile if tile.mode ==
+    'RGBA' else None) for each tile in order.
+
+    Args:
+        canvas (Image): The RGBA canvas.
+        tiles (Sequence[Tuple[Image, Tuple[int, int]]]): The tiles and the canvas position
+            of their top-left corner, in drawing order.
+    """
+    size = canvas.size
+    pixels = _array(canvas)
+    # The same memory as one 32-bit word per pixel, for copying opaque tiles
+    words = pixels.view(np.uint32)[..., 0]
+
+    clipped = [_clip(tile.size, position, size) for tile, position in tiles]
+    # The (x1, y1, x2, y2) box each tile covers; tiles outside the canvas cover nothing
+    boxes = [(clip[0][1].start, clip[0][0].start, clip[0][1].stop, clip[0][0].stop) if clip else (0, 0, 0, 0)
+             for clip in clipped]
+
+    for batch in batch_tiles(boxes):
+        blended = []
+        for i in batch:
+            if clipped[i] is None:
+                continue
+            tile, (dest, source) = tiles[i][0], clipped[i]
+            if tile.mode == 'RGBA':
+                low, high = tile.getextrema()[3]
+                if high == 0:
+                    continue  # Fully transparent: the paste leaves the canvas unchanged
+                if low < 255:
+                    blended.append((dest, _array(tile)[source]))
+                    continue
+                # Fully opaque: blending with alpha 255 gives the tile itself
+            # Opaque: copy whole pixels, with alpha set to 255
+            words[dest] = _array(tile).view(np.uint32)[..., 0][source]
+        if not blended:
+            continue
+
+        # Every alpha tile of the batch in one pass: gather, blend, scatter back
+        regions = np.concatenate([pixels[dest].reshape(-1, 4) for dest, _ in blended])
+        colors = np.concatenate([tile.reshape(-1, 4) for _, tile in blended])
+        result = _blend(regions, colors)
+        offset = 0
+        for dest, tile in blended:
+            count = tile.shape[0] * tile.shape[1]
+            pixels[dest] = result[offset:offset + count].reshape(tile.shape)
+            offset += count
+
+    canvas.paste(Image.frombuffer('RGBA', size, pixels, 'raw', 'RGBA', 0, 1))
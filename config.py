@@ -3,6 +3,10 @@
 This file contains presets for styles and dimensions.
 - DIMENSIONS: A dictionary of predefined aspect ratios and their corresponding pixel dimensions.
 - STYLE_PRESETS: A dictionary of style presets, each with its own set of visual options.
+- TRANSFORM_QUALITY: Resampling presets trading tile quality against speed.
+- VIDEO_QUALITY: MP4 encoding presets trading encoding speed against file size.
+- PREVIEW: The settings of fast, low-resolution collage previews.
+- AUTOTUNE: The settings renders with a latency budget choose from, and the quality each gives up.
 """
 
 # Available dimensions with name and pixel values
@@ -13,7 +17,10 @@ DIMENSIONS = {
     "iPad": (768, 1024)
 }
 
-# Style presets with various visual options
+# Style presets with various visual options. Besides the keys below, a style may set
+# 'effects' (see tile_effects), 'layout_mode': 'scatter' (see scatter_layout) and
+# 'compositor': 'auto' (default: NumPy for styles without rotation), 'numpy' or 'pillow'
+# (see compositor)
 STYLE_PRESETS = {
     'modern': {
         'background_color': 'transparent',  # Original: white
@@ -77,6 +84,101 @@ STYLE_PRESETS = {
         'border_size': 0,  # Already 0, no change needed
         'spacing': 0.06,  # More space between images
         'shadow': True,
-        'border_color': 'white'
+        'border_color': 'white',
+        'layout_mode': 'scatter'  # Randomly scattered photos instead of a fixed grid
+    }
+}
+
+# Resampling presets for the fused tile transform
+# - resize_filter: filter used when a tile is placed without rotation (plain resize)
+# - affine_filter: filter used for the rotation + placement affine pass of rotated tiles
+# - reducing_gap: sources larger than this multiple of the target are first shrunk
+#   with a cheap JPEG draft / box reduce before the final resample
+TRANSFORM_QUALITY = {
+    'quality': {
+        'resize_filter': 'LANCZOS',
+        'affine_filter': 'BICUBIC',
+        'reducing_gap': 3.0
+    },
+    'balanced': {
+        'resize_filter': 'BICUBIC',
+        'affine_filter': 'BICUBIC',
+        'reducing_gap': 2.0
+    },
+    'fast': {
+        'resize_filter': 'BILINEAR',
+        'affine_filter': 'BILINEAR',
+        'reducing_gap': 1.0
     }
 }
+
+# Encoding presets for MP4 animations (see video_encoder.encode_mp4)
+# - preset: libx264 preset; slower presets make smaller files at the same quality
+# - crf: constant rate factor, lower is better quality and larger files
+# - pix_fmt: yuv420p plays everywhere; yuv444p keeps full color resolution
+VIDEO_QUALITY = {
+    'fast': {
+        'preset': 'veryfast',
+        'crf': 23,
+        'pix_fmt': 'yuv420p'
+    },
+    'balanced': {
+        'preset': 'medium',
+        'crf': 23,
+        'pix_fmt': 'yuv420p'
+    },
+    'small': {
+        'preset': 'slower',
+        'crf': 26,
+        'pix_fmt': 'yuv420p'
+    }
+}
+
+# Low-resolution previews shown while the full render runs (see CollageGenerator.render_preview)
+# - max_side: the longest side of a preview in pixels
+# - quality: the TRANSFORM_QUALITY preset of its tiles
+# - shadow: whether drop shadows are drawn (blurring them is the costliest effect)
+# - jpeg_quality / png_compress_level: the encoding effort of opaque / transparent previews
+PREVIEW = {
+    'max_side': 480,
+    'quality': 'fast',
+    'shadow': False,
+    'jpeg_quality': 70,
+    'png_compress_level': 1
+}
+
+# The settings a render with a latency budget chooses from (see render_budget). Each
+# setting gives up some quality (its loss); the combination with the lowest total loss
+# that is predicted to fit the budget is used
+# - filters: tile resize filter -> (filter of rotated tiles, loss); BOX after the integer
+#   reduce is the cheapest
+# - reducing_gaps: how many times larger than its tile a source is decoded and reduced
+#   (this sets the JPEG draft scale) -> loss
+# - shadows: drop shadow -> (Gaussian blur radius, or None for no shadow, loss)
+# - encoder_efforts: per format, effort -> (encoder options, loss); 'default' is the
+#   encoding of renders without a budget
+# - margin: the fraction of the budget the prediction may fill, for measurement noise
+AUTOTUNE = {
+    'filters': {
+        'LANCZOS': ('BICUBIC', 0),
+        'BICUBIC': ('BICUBIC', 1),
+        'BILINEAR': ('BILINEAR', 3),
+        'BOX': ('NEAREST', 6)
+    },
+    'reducing_gaps': {
+        3.0: 0,
+        2.0: 1,
+        1.0: 3
+    },
+    'shadows': {
+        'soft': (3, 0),
+        'hard': (0, 1),
+        'none': (None, 2)
+    },
+    'encoder_efforts': {
+        'JPEG': {'default': ({}, 0)},
+        'PNG': {'default': ({}, 0), 'fast': ({'compress_level': 3}, 0.5), 'fastest': ({'compress_level': 1}, 1)},
+        'WEBP': {'default': ({}, 0), 'fast': ({'method': 2}, 0.5), 'fastest': ({'method': 0}, 1)}
+    },
+    'margin': 0.85
+}
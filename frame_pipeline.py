@@ -0,0 +1,135 @@
+"""Parallel rendering of animation frames.
+
+Frames of a random animation do not depend on each other, so they are rendered by
+a pool of processes and handed back in order. Each frame gets its own seed, drawn
+from the animation's seed, which fixes its layout and rotations. The animation
+is therefore the same however many processes render it, and the same seed always
+gives the same animation. Workers write each frame into a shared memory buffer of
+the parent (see shm_transport) and return only its handle, so frames are not
+pickled through a pipe. The encoder receives frames in order through a reorder
+buffer that never holds more than max_pending frames, in flight or finished, so
+memory stays bounded however long the animation is.
+- frame_seeds: Derives the seed of every frame from the seed of an animation.
+- render_seeded_frame: Renders one frame from its seed.
+- ordered_map: Runs a function over a pool, yielding results in order with bounded buffering.
+- render_frames: Renders the frames of an animation, serially or in parallel.
+"""
+import random
+from collections import deque
+from typing import Iterator, List, Tuple
+
+from PIL import Image
+
+# The generators of the worker processes, by constructor arguments
+_generators = {}
+
+
+def frame_seeds(seed, n_frames: int) -> List[int]:
+    """Derives one seed per frame from the seed of an animation.
+
+    Args:
+        seed: The animation seed (any hashable value), or None for a random animation.
+        n_frames (int): The number of frames.
+
+    Returns:
+        List[int]: The seed of each frame.
+    """
+    if seed is None:
+        seed = random.getrandbits(64)
+    rng = random.Random(seed)
+    return [rng.getrandbits(64) for _ in range(n_frames)]
+
+
+def render_seeded_frame(generator, frame_seed: int, image_files: List[str], dimensions: Tuple[int, int],
+                        style: dict, layout: str = None) -> Image.Image:
+    """Renders one frame of a random animation, with the layout and rotations its seed gives.
+
+    Args:
+        generator (CollageGenerator): The generator drawing the frame.
+        frame_seed (int): The seed of the frame.
+        image_files (List[str]): The filenames or URLs of the images.
+        dimensions (Tuple[int, int]): The width and height of the frame.
+        style (dict): The style properties of the collage.
+        layout (str, optional): The name of the layout. Defaults to None (a random layout).
+
+    Returns:
+        Image: The RGB frame.
+    """
+    return generator.create_single_collage_frame(image_files, dimensions, style, layout=layout, seed=frame_seed)
+
+
+def _render_in_worker(generator_args: tuple, frame_seed: int, kwargs: dict, buffer: str):
+    """Renders a frame in a worker process into a shared buffer, with a generator kept for the process' lifetime."""
+    from shm_transport import write_image
+
+    if generator_args not in _generators:
+        from image_collage_maker import CollageGenerator
+        images_dir, output_dir, transform_quality = generator_args
+        _generators[generator_args] = CollageGenerator(images_dir, output_dir, transform_quality)
+    return write_image(render_seeded_frame(_generators[generator_args], frame_seed, **kwargs), buffer)
+
+
+def ordered_map(executor, fn, iterable, max_pending: int) -> Iterator:
+    """Maps a function over an executor, yielding the results in input order.
+
+    At most max_pending calls are submitted ahead of the result being yielded, so
+    finished results waiting for a slower earlier one never pile up.
+
+    Args:
+        executor (Executor): The pool running the calls.
+        fn (Callable): The function, called with each item's arguments.
+        iterable (Iterable[tuple]): The argument tuple of each call.
+        max_pending (int): The most calls submitted but not yet yielded (at least 1).
+
+    Yields:
+        The results, in order.
+    """
+    pending = deque()
+    for args in iterable:
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= max(1, max_pending):
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def render_frames(generator, seeds: List[int], workers: int = 1, max_pending: int = None,
+                  **kwargs) -> Iterator[Image.Image]:
+    """Renders the frames of a random animation, one per seed, in order.
+
+    Args:
+        generator (CollageGenerator): The generator whose settings the frames use.
+        seeds (List[int]): The seed of each frame (see frame_seeds).
+        workers (int, optional): The number of processes; 1 renders in this process. Defaults to 1.
+        max_pending (int, optional): The most frames in flight or waiting to be yielded.
+            Defaults to twice the number of workers.
+        **kwargs: The arguments of render_seeded_frame (image_files, dimensions, style, layout).
+
+    Yields:
+        Image: The RGB frames, in order.
+    """
+    if workers <= 1:
+        for frame_seed in seeds:
+            yield render_seeded_frame(generator, frame_seed, **kwargs)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    from shm_transport import SharedBufferPool, image_nbytes, read_image
+
+    generator_args = (generator.images_dir, generator.output_dir, generator.transform_quality)
+    max_pending = max_pending or 2 * workers
+    # One buffer per frame in flight; a frame's buffer is reused once it is copied out
+    buffers = SharedBufferPool(max_idle=max_pending)
+    nbytes = image_nbytes('RGB', tuple(kwargs['dimensions']))
+    executor = ProcessPoolExecutor(max_workers=min(workers, len(seeds)) or 1)
+    try:
+        for handle in ordered_map(executor, _render_in_worker,
+                                  ((generator_args, frame_seed, kwargs, buffers.acquire(nbytes))
+                                   for frame_seed in seeds), max_pending):
+            frame = read_image(handle, copy=True)
+            buffers.release(handle.buffer)
+            yield frame
+    finally:
+        # Also reached when the consumer stops early: drop the frames not started yet
+        executor.shutdown(wait=True, cancel_futures=True)
+        buffers.close()
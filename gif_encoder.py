@@ -0,0 +1,140 @@
+"""Animated GIF encoding with one global palette.
+
+Saving RGB frames one by one makes the writer quantize every frame separately, and
+each frame then carries its own color table and is stored whole. Here the palette
+is computed once, from a sample of all frames, and every frame is mapped to it.
+Because all frames share the palette, a pixel that does not change keeps the same
+palette index. Each frame after the first is then cropped to the box that changed
+since the previous one. Inside that box, unchanged pixels are written as a reserved
+transparent index, which compresses to almost nothing. Identical consecutive
+frames are merged into one longer frame.
+- QUANTIZERS: The available palette quantizers.
+- limit_frame_rate: Drops frames so that an animation does not exceed a frame rate.
+- build_palette: Computes the shared palette of a sequence of frames.
+- encode_gif: Writes frames as an animated GIF.
+"""
+import math
+from typing import List, Sequence, Tuple
+
+from PIL import Image, features
+
+# Palette quantizers: median cut gives the best colors, fast octree is several times
+# faster to build; libimagequant is only offered when Pillow was built with it
+QUANTIZERS = {
+    'mediancut': Image.Quantize.MEDIANCUT,
+    'fast': Image.Quantize.FASTOCTREE,
+}
+if features.check('libimagequant'):
+    QUANTIZERS['libimagequant'] = Image.Quantize.LIBIMAGEQUANT
+
+# GIF delays are stored in hundredths of a second, and browsers slow down frames
+# shorter than 20 ms, so 50 fps is the highest rate that plays as written
+MAX_GIF_FPS = 50
+
+# The width and height each sampled frame is shrunk to for building the palette
+PALETTE_SAMPLE_SIZE = (256, 256)
+
+
+def limit_frame_rate(frames: Sequence[Image.Image], duration: float,
+                     max_fps: float = MAX_GIF_FPS) -> Tuple[List[Image.Image], float]:
+    """Keeps every n-th frame, and lengthens each frame to match, so the rate stays below max_fps.
+
+    Args:
+        frames (Sequence[Image]): The frames.
+        duration (float): The duration of each frame in seconds.
+        max_fps (float, optional): The highest frame rate. Defaults to MAX_GIF_FPS.
+
+    Returns:
+        Tuple[List[Image], float]: The kept frames and their duration in seconds.
+    """
+    if not max_fps or duration <= 0 or 1 / duration <= max_fps:
+        return list(frames), duration
+    step = math.ceil(1 / (duration * max_fps))
+    return list(frames[::step]), duration * step
+
+
+def build_palette(frames: Sequence[Image.Image], colors: int = 255, quantizer: str = 'mediancut',
+                  sample_frames: int = 8) -> Image.Image:
+    """Computes one palette for all frames.
+
+    Up to sample_frames frames, spread over the animation, are shrunk and quantized
+    together, so the palette covers the colors of the whole animation.
+
+    Args:
+        frames (Sequence[Image]): The RGB frames.
+        colors (int, optional): The number of palette colors (at most 256). Defaults to 255.
+        quantizer (str, optional): A key of QUANTIZERS. Defaults to 'mediancut'.
+        sample_frames (int, optional): The number of frames sampled. Defaults to 8.
+
+    Returns:
+        Image: A 'P' image whose palette is the shared palette.
+
+    Raises:
+        ValueError: If the quantizer is not available.
+    """
+    if quantizer not in QUANTIZERS:
+        raise ValueError(f"Unknown quantizer '{quantizer}'. Available: {', '.join(QUANTIZERS)}")
+    step = max(1, len(frames) / sample_frames)
+    samples = [frames[int(i * step)] for i in range(min(sample_frames, len(frames)))]
+
+    width, height = PALETTE_SAMPLE_SIZE
+    strip = Image.new('RGB', (width * len(samples), height))
+    for i, frame in enumerate(samples):
+        strip.paste(frame.convert('RGB').resize((width, height), Image.Resampling.BOX), (i * width, 0))
+    return strip.quantize(colors=colors, method=QUANTIZERS[quantizer], dither=Image.Dither.NONE)
+
+
+def encode_gif(frames: Sequence[Image.Image], output_path: str, duration: float, colors: int = 256,
+               quantizer: str = 'mediancut', max_fps: float = MAX_GIF_FPS, dither: bool = True,
+               loop: int = 0) -> dict:
+    """Writes frames as an animated GIF with a shared palette and delta frames.
+
+    Dithering hides banding in gradients. It spreads quantization errors to the pixels
+    to the right and below, though, so a change can alter dithered pixels outside it
+    and enlarge the delta frames. Turn it off when frames differ only in small areas.
+
+    Args:
+        frames (Sequence[Image]): The frames, all the same size.
+        output_path (str): The path of the GIF.
+        duration (float): The duration of each frame in seconds.
+        colors (int, optional): The number of colors, 2 to 256; one is kept for
+            transparency. Defaults to 256.
+        quantizer (str, optional): A key of QUANTIZERS. Defaults to 'mediancut'.
+        max_fps (float, optional): The highest frame rate; frames are dropped above it.
+            Defaults to MAX_GIF_FPS.
+        dither (bool, optional): Whether to use Floyd-Steinberg dithering. Defaults to True.
+        loop (int, optional): The number of loops, 0 for forever. Defaults to 0.
+
+    Returns:
+        dict: The number of frames written, the frame duration in seconds and the
+        number of palette colors.
+
+    Raises:
+        ValueError: If there are no frames or colors is out of range.
+    """
+    if not frames:
+        raise ValueError("An animation needs at least one frame")
+    if not 2 <= colors <= 256:
+        raise ValueError("colors must be between 2 and 256")
+    frames, duration = limit_frame_rate(frames, duration, max_fps)
+
+    # Frames are mapped to the palette colors only, so no pixel can land on the
+    # transparent index, however far its color is from the sampled frames
+    palette_image = build_palette(frames, colors - 1, quantizer)
+    dither_mode = Image.Dither.FLOYDSTEINBERG if dither else Image.Dither.NONE
+    indexed = [frame.convert('RGB').quantize(palette=palette_image, dither=dither_mode) for frame in frames]
+
+    # The first index after the palette colors marks pixels that did not change. The
+    # table is padded with copies of a real color, so a viewer that ignores the
+    # transparency still shows nothing out of place
+    palette = palette_image.getpalette()
+    transparency = len(palette) // 3
+    palette = palette + palette[:3] * (256 - transparency)
+
+    # With a palette given, the writer keeps every frame's indices as they are, writes a
+    # single global color table, crops each frame to its changed box and (with
+    # optimize) fills unchanged pixels in that box with the transparent index
+    indexed[0].save(output_path, format='GIF', save_all=True, append_images=indexed[1:],
+                    palette=bytes(palette), optimize=True, transparency=transparency, disposal=1,
+                    duration=max(20, round(duration * 1000)), loop=loop)
+    return {'frames': len(indexed), 'duration': duration, 'colors': transparency}
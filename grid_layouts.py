@@ -5,7 +5,10 @@ This file defines the grid layouts for different numbers of images.
   - Each layout configuration is a dictionary with a name, a description, and a layout.
   - The layout is a list of tuples, where each tuple represents an image and contains four values: (x_ratio, y_ratio, width_ratio, height_ratio).
 - DEFAULT_LAYOUT_CONFIG: A default layout configuration to be used as a fallback.
+- compile_layout: Converts a layout into cached pixel cells for a given canvas size.
 """
+from functools import lru_cache
+from typing import Tuple
 
 GRID_LAYOUTS = {
     1: [
@@ -192,3 +195,28 @@ DEFAULT_LAYOUT_CONFIG = {
     "layout": [(0.1, 0.1, 0.8, 0.8)],
     "description": "Single image centered with even margins"
 }
+
+
+@lru_cache(maxsize=1024)
+def compile_layout(layout: Tuple[Tuple[float, float, float, float], ...], dimensions: Tuple[int, int],
+                   border_size: int = 0) -> Tuple[Tuple[int, int, int, int], ...]:
+    """Converts a layout's ratios into pixel cells for a canvas size.
+
+    Results are cached, so each (layout, dimensions, border) combination is only computed once
+    per process.
+
+    Args:
+        layout (Tuple[Tuple[float, float, float, float], ...]): The (x_ratio, y_ratio, width_ratio, height_ratio)
+            of each image, as a tuple so it can be cached.
+        dimensions (Tuple[int, int]): The width and height of the canvas.
+        border_size (int, optional): The border around each image, removed from the cell size. Defaults to 0.
+
+    Returns:
+        Tuple[Tuple[int, int, int, int], ...]: The (x, y, w, h) pixel cell of each image, border excluded.
+    """
+    base_width, base_height = dimensions
+    return tuple((int(x_ratio * base_width),
+                  int(y_ratio * base_height),
+                  int(w_ratio * base_width) - (2 * border_size),
+                  int(h_ratio * base_height) - (2 * border_size))
+                 for x_ratio, y_ratio, w_ratio, h_ratio in layout)
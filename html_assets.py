@@ -0,0 +1,255 @@
+"""Web-sized image derivatives for the HTML export.
+
+Instead of pointing the page at full-resolution originals, every image is resized to
+the size it is displayed at (1x) and twice that (2x, for high-density screens), and
+saved as WebP plus a JPEG fallback (PNG for images with transparency). The page
+then picks the right file through `<picture>`/`srcset`.
+- DERIVATIVE_DENSITIES: The pixel densities generated per image.
+- SOURCE_SCALE: How many times its display size a source is decoded at for its derivatives.
+- write_derivatives: Writes the derivatives of one image.
+- picture_tag: Builds the `<picture>` element for a set of derivatives.
+- pack_sprites: Packs tile sizes into one sprite atlas (shelf packing).
+- write_sprite_atlas: Writes the 1x/2x sprite atlases of a set of images.
+- sprite_css: Builds the CSS rule that loads a sprite atlas.
+- write_manifest: Records the generated assets in a JSON manifest.
+"""
+import hashlib
+import json
+import os
+from html import escape
+from io import BytesIO
+from typing import List, Tuple
+
+from PIL import Image
+
+from tile_transform import has_alpha, prepare_source
+
+DERIVATIVE_DENSITIES = (1, 2)
+# Derivatives are resized from a source kept this many times larger than the largest one
+REDUCING_GAP = 2.0
+SOURCE_SCALE = max(DERIVATIVE_DENSITIES) * REDUCING_GAP
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+
+def write_derivatives(image: Image, display_size: Tuple[int, int], asset_dir: str, stem: str,
+                      densities: Tuple[int, ...] = DERIVATIVE_DENSITIES) -> List[dict]:
+    """Writes the resized versions of an image.
+
+    A density is skipped when the source is too small for it, since upscaling would
+    only add bytes; the largest available size is used instead.
+
+    Args:
+        image (Image): The opened source image.
+        display_size (Tuple[int, int]): The CSS pixel size the image is shown at.
+        asset_dir (str): The directory the files are written to.
+        stem (str): The file name prefix, e.g. '03'.
+        densities (Tuple[int, ...], optional): The pixel densities to generate. Defaults to (1, 2).
+
+    Returns:
+        List[dict]: One entry per file: 'file' (name within asset_dir), 'format',
+        'density', 'width', 'height' and 'bytes'.
+    """
+    os.makedirs(asset_dir, exist_ok=True)
+    transparent = has_alpha(image)
+    fallback = 'png' if transparent else 'jpeg'
+    largest = max(display_size[0] * max(densities), 1), max(display_size[1] * max(densities), 1)
+    source = prepare_source(image, largest, reducing_gap=REDUCING_GAP)
+    source = source.convert('RGBA' if transparent else 'RGB')
+
+    variants, previous_size = [], None
+    for density in sorted(densities):
+        size = (max(1, round(display_size[0] * density)), max(1, round(display_size[1] * density)))
+        if size[0] > source.width or size[1] > source.height:
+            scale = min(source.width / size[0], source.height / size[1])
+            size = (max(1, int(size[0] * scale)), max(1, int(size[1] * scale)))
+        if size == previous_size:
+            continue
+        previous_size = size
+        resized = source.resize(size, Image.Resampling.LANCZOS) if size != source.size else source
+
+        for image_format in ('webp', fallback):
+            name = f"{stem}_{size[0]}x{size[1]}.{'jpg' if image_format == 'jpeg' else image_format}"
+            path = os.path.join(asset_dir, name)
+            if image_format == 'webp':
+                resized.save(path, format='WEBP', quality=WEBP_QUALITY, method=4)
+            elif image_format == 'jpeg':
+                resized.save(path, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            else:
+                resized.save(path, format='PNG', optimize=True)
+            variants.append({'file': name, 'format': image_format, 'density': density,
+                             'width': size[0], 'height': size[1], 'bytes': os.path.getsize(path)})
+    return variants
+
+
+def _srcset(variants: List[dict], image_format: str, base_url: str) -> str:
+    """Builds a density-descriptor srcset for one format."""
+    return ", ".join(f"{base_url}{variant['file']} {variant['density']}x"
+                     for variant in variants if variant['format'] == image_format)
+
+
+def picture_tag(variants: List[dict], base_url: str, alt: str, size: Tuple[int, int], css: str,
+                css_class: str = None, loading: str = 'lazy', indent: str = '') -> str:
+    """Builds the `<picture>` element for the derivatives of one image.
+
+    Args:
+        variants (List[dict]): The entries returned by write_derivatives.
+        base_url (str): The URL prefix of the asset files, e.g. 'collage_x_assets/'.
+        alt (str): The alternative text.
+        size (Tuple[int, int]): The intrinsic (CSS pixel) width and height, so the browser
+            reserves the space before the file arrives.
+        css (str): The inline style of the `<img>`.
+        css_class (str, optional): The class of the `<img>`. Defaults to None.
+        loading (str, optional): 'lazy' or 'eager'. Defaults to 'lazy'.
+        indent (str, optional): The indentation of the element. Defaults to ''.
+
+    Returns:
+        str: The HTML of the element.
+    """
+    fallback = next(variant['format'] for variant in variants if variant['format'] != 'webp')
+    src = next(variant['file'] for variant in variants if variant['format'] == fallback)
+    class_attribute = f'class="{escape(css_class)}" ' if css_class else ''
+    return '\n'.join([
+        f'{indent}<picture>',
+        f'{indent}    <source type="image/webp" srcset="{escape(_srcset(variants, "webp", base_url))}">',
+        f'{indent}    <img {class_attribute}src="{escape(base_url + src)}" srcset="{escape(_srcset(variants, fallback, base_url))}" '
+        f'width="{size[0]}" height="{size[1]}" loading="{loading}" decoding="async" '
+        f'alt="{escape(alt)}" style="{escape(css)}">',
+        f'{indent}</picture>',
+    ])
+
+
+def pack_sprites(sizes: List[Tuple[int, int]], padding: int = 1) -> Tuple[List[Tuple[int, int]], Tuple[int, int]]:
+    """Packs rectangles into an atlas, row by row (shelf packing), tallest first.
+
+    The atlas is made roughly square; `padding` pixels separate sprites so that
+    filtering never bleeds a neighbour into a sprite's edge.
+
+    Args:
+        sizes (List[Tuple[int, int]]): The width and height of each sprite.
+        padding (int, optional): The gap between sprites. Defaults to 1.
+
+    Returns:
+        Tuple[List[Tuple[int, int]], Tuple[int, int]]: The (x, y) of each sprite, in the
+        input order, and the width and height of the atlas.
+    """
+    if not sizes:
+        return [], (1, 1)
+    area = sum((width + padding) * (height + padding) for width, height in sizes)
+    row_width = max(max(width for width, _ in sizes), int(area ** 0.5))
+
+    positions = [None] * len(sizes)
+    x = y = shelf_height = atlas_width = 0
+    for i in sorted(range(len(sizes)), key=lambda i: sizes[i][1], reverse=True):
+        width, height = sizes[i]
+        if x and x + width > row_width:
+            x, y, shelf_height = 0, y + shelf_height + padding, 0
+        positions[i] = (x, y)
+        x += width + padding
+        shelf_height = max(shelf_height, height)
+        atlas_width = max(atlas_width, x - padding)
+    return positions, (atlas_width, y + shelf_height)
+
+
+def write_sprite_atlas(images: List[Image.Image], display_sizes: List[Tuple[int, int]], asset_dir: str,
+                       densities: Tuple[int, ...] = DERIVATIVE_DENSITIES) -> Tuple[List[Tuple[int, int]], List[dict]]:
+    """Packs images, resized to their display sizes, into one atlas per density and format.
+
+    Each atlas is named after a hash of its content, so it can be cached as an
+    immutable asset.
+
+    Args:
+        images (List[Image]): The opened source images.
+        display_sizes (List[Tuple[int, int]]): The CSS pixel size each image is shown at.
+        asset_dir (str): The directory the files are written to.
+        densities (Tuple[int, ...], optional): The pixel densities to generate. Defaults to (1, 2).
+
+    Returns:
+        Tuple[List[Tuple[int, int]], List[dict]]: The CSS pixel position of each image in
+        the atlas, and one entry per atlas file, like those of write_derivatives.
+    """
+    os.makedirs(asset_dir, exist_ok=True)
+    positions, atlas_size = pack_sprites(display_sizes)
+    transparent = any(has_alpha(image) for image in images)
+    fallback = 'png' if transparent else 'jpeg'
+    mode = 'RGBA' if transparent else 'RGB'
+
+    largest = max(densities)
+    sources = [prepare_source(image, (width * largest, height * largest), reducing_gap=REDUCING_GAP).convert(mode)
+               for image, (width, height) in zip(images, display_sizes)]
+
+    variants = []
+    for density in sorted(densities):
+        atlas = Image.new(mode, (atlas_size[0] * density, atlas_size[1] * density), 0)
+        for source, (x, y), (width, height) in zip(sources, positions, display_sizes):
+            atlas.paste(source.resize((width * density, height * density), Image.Resampling.LANCZOS),
+                        (x * density, y * density))
+
+        for image_format in ('webp', fallback):
+            buffer = BytesIO()
+            if image_format == 'webp':
+                atlas.save(buffer, format='WEBP', quality=WEBP_QUALITY, method=4)
+            elif image_format == 'jpeg':
+                atlas.save(buffer, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            else:
+                atlas.save(buffer, format='PNG', optimize=True)
+            data = buffer.getvalue()
+            extension = 'jpg' if image_format == 'jpeg' else image_format
+            name = f"sprite_{hashlib.sha256(data).hexdigest()[:12]}@{density}x.{extension}"
+            with open(os.path.join(asset_dir, name), 'wb') as f:
+                f.write(data)
+            variants.append({'file': name, 'format': image_format, 'density': density,
+                             'width': atlas.width, 'height': atlas.height, 'bytes': len(data)})
+    return positions, variants
+
+
+def sprite_css(selector: str, variants: List[dict], base_url: str) -> str:
+    """Builds the CSS rule that loads a sprite atlas.
+
+    Browsers that support image-set() download only the best format and density;
+    the others fall back to the 1x JPEG (or PNG).
+
+    Args:
+        selector (str): The CSS selector of the sprite elements.
+        variants (List[dict]): The entries returned by write_sprite_atlas.
+        base_url (str): The URL prefix of the atlas files.
+
+    Returns:
+        str: The CSS rule.
+    """
+    fallback = min((variant for variant in variants if variant['format'] != 'webp'),
+                   key=lambda variant: variant['density'])
+    candidates = ", ".join(
+        f'url("{base_url}{variant["file"]}") {variant["density"]}x type("image/{variant["format"]}")'
+        for variant in sorted(variants, key=lambda variant: variant['format'] != 'webp'))
+    width = fallback['width'] // fallback['density']
+    height = fallback['height'] // fallback['density']
+    return (f'{selector} {{ background-image: url("{base_url}{fallback["file"]}"); '
+            f'background-image: image-set({candidates}); background-repeat: no-repeat; '
+            f'background-size: {width}px {height}px; }}')
+
+
+def write_manifest(path: str, page: str, images: List[dict], sprites: List[dict] = None) -> dict:
+    """Writes the JSON manifest of a page's generated assets.
+
+    Args:
+        path (str): The path of the manifest file.
+        page (str): The file name of the HTML page.
+        images (List[dict]): One entry per image: its 'source', 'alt' and either its
+            derivative 'variants' or its 'sprite' position.
+        sprites (List[dict], optional): The sprite atlas files, in sprite mode. Defaults to None.
+
+    Returns:
+        dict: The manifest, including the total size of the assets in bytes.
+    """
+    files = [variant for image in images for variant in image.get('variants', [])] + (sprites or [])
+    manifest = {
+        'page': page,
+        'images': images,
+        'total_bytes': sum(variant['bytes'] for variant in files),
+    }
+    if sprites is not None:
+        manifest['sprites'] = sprites
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
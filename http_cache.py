@@ -0,0 +1,106 @@
+"""HTTP caching of served collages.
+
+A collage file never changes once written, so it can be served from a URL that
+contains its content hash. Browsers and CDNs may then keep it for a year without
+asking again (Cache-Control: immutable), or at least for as long as the file is
+sure to be kept when storage expires it. The plain URL of a file is served with a
+strong ETag, the hash of its content, and must be revalidated (no-cache); a
+revalidation costs a 304 without a body. Both accept Range requests. The file is
+handed to the server's wsgi.file_wrapper (sendfile under gunicorn or uWSGI), or to
+the front-end server with X-Sendfile when USE_X_SENDFILE is set.
+- IMMUTABLE_MAX_AGE: The longest clients keep a versioned file, in seconds.
+- VERSION_LENGTH: The number of hex digits of the hash in a versioned URL.
+- file_digest: The content hash of a file, cached while the file is unchanged.
+- file_version: The version of a file in its immutable URL.
+- send_cached_file: Serves a file with ETag, Range and cache headers.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from flask import abort, send_file
+from werkzeug.security import safe_join
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+VERSION_LENGTH = 16
+
+# Digests of recently served files, by path, with the size and mtime they were computed for
+DIGEST_CACHE_SIZE = 4096
+_digests = OrderedDict()
+_digests_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """Computes the SHA-256 of a file, reusing the last result while its size and mtime are unchanged.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        str: The hex digest.
+
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    stat = os.stat(path)
+    signature = (stat.st_size, stat.st_mtime_ns)
+    with _digests_lock:
+        cached = _digests.get(path)
+        if cached is not None and cached[0] == signature:
+            _digests.move_to_end(path)
+            return cached[1]
+
+    with open(path, 'rb') as file:
+        digest = hashlib.file_digest(file, 'sha256').hexdigest()
+    with _digests_lock:
+        _digests[path] = (signature, digest)
+        _digests.move_to_end(path)
+        if len(_digests) > DIGEST_CACHE_SIZE:
+            _digests.popitem(last=False)
+    return digest
+
+
+def file_version(path: str) -> str:
+    """Returns the version of a file in its immutable URL: the start of its content hash.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        str: VERSION_LENGTH hex digits.
+    """
+    return file_digest(path)[:VERSION_LENGTH]
+
+
+def send_cached_file(directory: str, filename: str, version: str = None, max_age: int = IMMUTABLE_MAX_AGE):
+    """Serves a file with a strong ETag, conditional GET and Range support.
+
+    Args:
+        directory (str): The directory served.
+        filename (str): The path of the file, relative to the directory.
+        version (str, optional): The version from an immutable URL. When it matches the
+            file's content, the response may be cached forever; when it does not (the
+            file changed, or a relative link lost it), the response must be revalidated.
+            Defaults to None (a plain URL).
+        max_age (int, optional): How long a versioned response may be cached, in seconds.
+            It must not outlive the file: a client holding the URL would keep it after
+            the file is deleted. Defaults to IMMUTABLE_MAX_AGE.
+
+    Returns:
+        flask.Response: The file (200 or 206), 304 Not Modified, or 416 for a bad range.
+    """
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    digest = file_digest(path)
+
+    response = send_file(os.path.abspath(path), etag=digest, conditional=True, max_age=None)
+    if version is not None and digest.startswith(version) and len(version) >= VERSION_LENGTH:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
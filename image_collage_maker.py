@@ -1,22 +1,78 @@
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
 import os
 from datetime import datetime
 import random
+import shutil
+import time
+import uuid
 from typing import Tuple, List
-import math
-from pillow_heif import register_heif_opener
-from PIL import ImageDraw, ImageFilter, ImageFont
-import requests
+from functools import lru_cache
+from PIL import ImageDraw, ImageFilter
 from io import BytesIO
-import urllib.parse
-import imageio
 
 # Import grid layouts and configuration
-from grid_layouts import GRID_LAYOUTS, DEFAULT_LAYOUT_CONFIG
-from config import STYLE_PRESETS, DIMENSIONS
+from grid_layouts import GRID_LAYOUTS, DEFAULT_LAYOUT_CONFIG, compile_layout
+from scatter_layout import rectangles_overlap, scatter_layout
+from config import STYLE_PRESETS, DIMENSIONS, PREVIEW, VIDEO_QUALITY
+from tile_transform import TileTransform, has_alpha, prepare_source, resample_tile, transform_settings
+from tile_effects import EffectPipeline, shadow_mask
+from output_sinks import TeeSink, encode_collage
+from output_store import OutputFile, SpecIndex, atomic_write
+from html_assets import SOURCE_SCALE
 
-# Register HEIF opener to support HEIC images
-register_heif_opener()
+# Heavy optional dependencies are imported on first use to keep start-up fast:
+# pillow_heif when a HEIC/HEIF image shows up, requests for URLs, imageio for animations.
+HEIF_EXTENSIONS = ('.heic', '.heif')
+_heif_registered = False
+
+
+def register_heif_support():
+    """Registers the HEIF opener with Pillow so HEIC images can be opened.
+
+    Safe to call repeatedly; pillow_heif is only imported the first time.
+    """
+    global _heif_registered
+    if not _heif_registered:
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+        _heif_registered = True
+
+
+@lru_cache(maxsize=32)
+def load_font(font_size: int):
+    """Loads the title font, falling back to Pillow's default font.
+
+    Fonts are cached per size, so the font file is only resolved and parsed once.
+
+    Args:
+        font_size (int): The font size.
+
+    Returns:
+        ImageFont: The loaded font.
+    """
+    from PIL import ImageFont
+    try:
+        return ImageFont.truetype("arial.ttf", font_size)
+    except IOError:
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=16)
+def _gradient_overlay(dimensions: Tuple[int, int], base_color: str) -> Image:
+    """Draws the background gradient overlay. Cached; see CollageGenerator.create_gradient_overlay."""
+    # Skip gradient for transparent backgrounds
+    if base_color == 'transparent':
+        return Image.new('RGBA', dimensions, (0, 0, 0, 0))
+
+    gradient = Image.new('RGBA', dimensions, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(gradient)
+
+    # Create subtle diagonal gradient
+    for i in range(dimensions[1]):
+        alpha = int(255 * (1 - i/dimensions[1]) * 0.1)  # 10% maximum opacity
+        draw.line([(0, i), (dimensions[0], i)],
+                 fill=(255, 255, 255, alpha))
+    return gradient
 
 class CollageGenerator:
     """A class to generate image collages.
@@ -24,24 +80,37 @@ class CollageGenerator:
     Attributes:
         images_dir (str): The directory containing the images to be used in the collage.
         output_dir (str): The directory where the generated collages will be saved.
-        used_images (set): A set of image filenames that have already been used in a collage.
+        used_images (set): The content keys (see checkpoint.content_key) of the images that have
+            already been used in a collage.
         style_presets (dict): A dictionary of style presets for the collages.
+        transform_quality (str): The default TRANSFORM_QUALITY preset used to resample tiles.
+        checkpoint (CheckpointStore): The durable store of used images and finished collages, if any.
     """
-    def __init__(self, images_dir: str, output_dir: str):
+    def __init__(self, images_dir: str, output_dir: str, transform_quality: str = 'quality', checkpoint=None):
         """Initializes the CollageGenerator.
 
         Args:
             images_dir (str): The directory containing the images to be used in the collage.
             output_dir (str): The directory where the generated collages will be saved.
+            transform_quality (str, optional): The default TRANSFORM_QUALITY preset used to
+                resample tiles ('quality', 'balanced' or 'fast'). Defaults to 'quality'.
+            checkpoint (Union[str, CheckpointStore], optional): A CheckpointStore, or the path of
+                its database, used to persist progress and resume interrupted runs. Defaults to None.
         """
         self.images_dir = images_dir
         self.output_dir = output_dir
-        self.used_images = set()
         self.style_presets = STYLE_PRESETS  # Use imported style presets
+        self.transform_quality = transform_quality
 
-        # Create output directory if it doesn't exist
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        # Resume from the checkpoint if there is one
+        if isinstance(checkpoint, str):
+            from checkpoint import CheckpointStore
+            checkpoint = CheckpointStore(checkpoint)
+        self.checkpoint = checkpoint
+        self.used_images = self.checkpoint.used_image_keys() if self.checkpoint else set()
+
+        # Create output directory if it doesn't exist (other processes may be creating it too)
+        os.makedirs(output_dir, exist_ok=True)
 
     def get_dimension_choice(self) -> Tuple[int, int]:
         """Gets the user's choice of collage dimensions.
@@ -98,28 +167,78 @@ class CollageGenerator:
         """
         all_images = [f for f in os.listdir(self.images_dir)
                      if f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp', '.heic'))]
-        return [img for img in all_images if img not in self.used_images]
+        return [img for img in all_images if not self.is_image_used(img)]
+
+    def image_key(self, image_file: str) -> str:
+        """Computes the content key of an image.
 
-    def create_collages(self, image_urls: List[str]):
+        Args:
+            image_file (str): The filename, path or URL of the image.
+
+        Returns:
+            str: The content hash of a local image, or the URL hash of a remote one.
+        """
+        if not image_file.startswith(('http://', 'https://')) and self.images_dir:
+            image_file = os.path.join(self.images_dir, image_file)
+        if self.checkpoint:
+            return self.checkpoint.image_key(image_file)
+        from checkpoint import content_key
+        return content_key(image_file)
+
+    def is_image_used(self, image_file: str) -> bool:
+        """Checks whether an image (or an identical copy of it) was already used.
+
+        Args:
+            image_file (str): The filename, path or URL of the image.
+
+        Returns:
+            bool: True if the image was already used in a collage.
+        """
+        return self.image_key(image_file) in self.used_images
+
+    def mark_images_used(self, image_files: List[str], output_path: str = None, **settings):
+        """Marks images as used, recording the finished collage in the checkpoint if any.
+
+        Args:
+            image_files (List[str]): The filenames, paths or URLs of the collage's images.
+            output_path (str, optional): The path of the finished collage. Defaults to None.
+            **settings: Render settings that identify the collage (see checkpoint.collage_key).
+        """
+        keys = [self.image_key(image_file) for image_file in image_files]
+        if self.checkpoint:
+            from checkpoint import collage_key
+            self.checkpoint.record_collage(collage_key(keys, **settings), output_path, keys, image_files)
+        self.used_images.update(keys)
+
+    def create_collages(self, image_urls: List[str], dimensions: Tuple[int, int] = None, style: dict = None):
         """Creates collages from a list of image URLs.
 
+        Images that were already used (by this generator or, with a checkpoint, by an
+        earlier interrupted run) are skipped, so a rerun resumes with the next collage.
+
         Args:
             image_urls (List[str]): A list of URLs of the images to be used in the collages.
+            dimensions (Tuple[int, int], optional): The width and height of the collages.
+                Defaults to None, which asks the user.
+            style (dict, optional): The style properties for the collages. Defaults to None,
+                which asks the user for every collage.
         """
-        dimensions = self.get_dimension_choice()
-        available_images = image_urls  # Use the provided image URLs directly
+        if dimensions is None:
+            dimensions = self.get_dimension_choice()
+        available_images = [img for img in image_urls if not self.is_image_used(img)]
+        if len(available_images) < len(image_urls):
+            print(f"Resuming: skipping {len(image_urls) - len(available_images)} already used images")
 
         while available_images:
             # Take up to 6 images for each collage
             collage_images = available_images[:6]
-            self.create_single_collage(collage_images, dimensions)
+            output_path = self.create_single_collage(collage_images, dimensions, style=style)
 
-            # Mark these images as used
-            for img in collage_images:
-                self.used_images.add(img)
+            # Mark these images as used (and checkpoint the finished collage)
+            self.mark_images_used(collage_images, output_path, dimensions=dimensions)
 
             # Update available images
-            available_images = [img for img in image_urls if img not in self.used_images]
+            available_images = [img for img in available_images if not self.is_image_used(img)]
 
     def get_style_choice(self) -> dict:
         """Gets the user's choice of collage style.
@@ -139,17 +258,318 @@ class CollageGenerator:
             except (ValueError, IndexError):
                 print("Invalid choice. Please try again.")
 
-    def create_single_collage(self, image_files: List[str], dimensions: Tuple[int, int], title=None):
+    @staticmethod
+    def choose_layout(n_images: int, layout_name: str = None, dimensions: Tuple[int, int] = None,
+                      style: dict = None, rng: random.Random = None) -> dict:
+        """Picks a layout for a number of images.
+
+        The layout named 'Scatter' (see scatter_layout) is generated for the canvas
+        and works for any number of images. It is also used when the style sets
+        'layout_mode': 'scatter', and when no grid layout exists for that many images.
+        Scatter layouts need the dimensions; without them the grid fallback is used.
+
+        Args:
+            n_images (int): The number of images in the collage.
+            layout_name (str, optional): The name of the layout to use (case-insensitive).
+                Defaults to None, which picks a random layout.
+            dimensions (Tuple[int, int], optional): The width and height of the collage. Defaults to None.
+            style (dict, optional): The style properties of the collage. Defaults to None.
+            rng (random.Random, optional): The random generator the layout is drawn from.
+                Defaults to None (the shared `random` generator).
+
+        Returns:
+            dict: The layout configuration (name, layout and description).
+
+        Raises:
+            ValueError: If no layout with that name exists for this number of images.
+        """
+        style = style or {}
+        rng = rng or random
+        scatter = (layout_name.lower() == 'scatter' if layout_name is not None
+                   else style.get('layout_mode') == 'scatter' or n_images not in GRID_LAYOUTS)
+        if scatter and dimensions is not None:
+            return scatter_layout(n_images, dimensions, style.get('rotation_range', (0, 0)),
+                                  spacing=style.get('spacing', 0.0), seed=rng.getrandbits(64))
+
+        candidates = GRID_LAYOUTS.get(n_images, [DEFAULT_LAYOUT_CONFIG])
+        if layout_name is None:
+            return rng.choice(candidates)
+
+        for layout_config in candidates:
+            if layout_config["name"].lower() == layout_name.lower():
+                return layout_config
+
+        available = ", ".join([layout_config["name"] for layout_config in candidates] + ["Scatter"])
+        raise ValueError(f"No layout named '{layout_name}' for {n_images} images (available: {available})")
+
+    @staticmethod
+    def use_numpy_compositor(style: dict) -> bool:
+        """Checks whether a style's tiles are composited with NumPy (see compositor).
+
+        A style selects its compositor with its 'compositor' key: 'auto' (the default)
+        uses NumPy when the style has no rotation, so every tile is axis-aligned;
+        'numpy' and 'pillow' force one or the other. Without NumPy, Pillow is used.
+
+        Args:
+            style (dict): A dictionary containing the style properties for the collage.
+
+        Returns:
+            bool: True if the NumPy compositor should be used.
+        """
+        compositor = style.get('compositor', 'auto')
+        if compositor == 'auto':
+            compositor = 'numpy' if tuple(style['rotation_range']) == (0, 0) else 'pillow'
+        if compositor != 'numpy':
+            return False
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def create_single_collage(self, image_files: List[str], dimensions: Tuple[int, int], title=None, quality: str = None,
+                              style: dict = None, layout: str = None, html: bool = True,
+                              html_mode: str = 'images', output=None, output_format: str = None,
+                              persist: bool = True, reuse: bool = False, seed: int = None,
+                              encoder_options: dict = None, timings: dict = None, sources: dict = None,
+                              index: bool = False) -> str:
         """Creates a single collage from a list of image files.
 
+        The collage is encoded once. The bytes go to output_dir, to the output sink, or
+        to both, so a caller streaming the collage elsewhere does not need local disk.
+        Persisted collages are named after their content hash, in sharded subdirectories
+        of output_dir (see output_store). With reuse or index, they are also recorded in
+        its spec index; the key of that index hashes the content of every image, so it is
+        only computed then.
+
         Args:
             image_files (List[str]): A list of filenames or URLs of the images to be used in the collage.
             dimensions (Tuple[int, int]): A tuple containing the width and height of the collage.
             title (str, optional): The title of the collage. Defaults to None.
+            quality (str or dict, optional): The TRANSFORM_QUALITY preset used to resample tiles,
+                or custom settings (see tile_transform.transform_settings). Defaults to the
+                generator's transform_quality.
+            style (dict, optional): The style properties for the collage. Defaults to None, which asks the user.
+            layout (str, optional): The name of the grid layout to use. Defaults to None (random layout).
+            html (bool, optional): Whether to also export the collage as HTML. Defaults to True.
+            html_mode (str, optional): 'images' or 'sprite', see convert_collage_to_html. Defaults to 'images'.
+            output (optional): A writable binary sink (open file, BytesIO, socket stream,
+                output_sinks.StreamingSink or ObjectStoreSink...) the encoded collage is
+                written to. Defaults to None.
+            output_format (str, optional): The Pillow format of the collage. Defaults to None
+                (PNG for transparent backgrounds, JPEG otherwise).
+            persist (bool, optional): Whether to write the collage (and its HTML) to output_dir.
+                Defaults to True.
+            reuse (bool, optional): Whether to return the collage already made from the same
+                images and settings, if there is one, instead of rendering again (see
+                find_collage). Defaults to False.
+            seed (int, optional): The seed of the random layout and rotations, so a preview
+                (see render_preview) and the full render match. Defaults to None (random).
+            encoder_options (dict, optional): Options of the encoder (compress_level, method...).
+                Defaults to None (the format's defaults).
+            timings (dict, optional): Filled with the seconds spent rendering ('render') and
+                encoding ('encode'). Defaults to None.
+            sources (dict, optional): Images already opened, by image file, used instead of
+                opening them again (see render_tiles), and by the HTML export. Defaults to None.
+            index (bool, optional): Whether to record the collage in the spec index, for
+                find_collage and later reuse. Defaults to False (True with reuse).
+
+        Returns:
+            str: The path to the generated collage image, or None if it was not persisted.
         """
-        base_width, base_height = dimensions
-        style = self.get_style_choice()
+        if style is None:
+            style = self.get_style_choice()
+        if output is None and not persist:
+            raise ValueError("A collage that is not persisted needs an output sink")
+        # Use PNG for transparent backgrounds, JPEG otherwise
+        if output_format is None:
+            output_format = 'PNG' if style['background_color'] == 'transparent' else 'JPEG'
+        extension = 'jpg' if output_format == 'JPEG' else output_format.lower()
+
+        spec_key = None
+        if reuse or index:
+            spec_key = self.collage_spec_key(image_files, dimensions, style, layout, title, quality, output_format,
+                                             seed, encoder_options)
+        if reuse and spec_key is not None:
+            existing = SpecIndex(self.output_dir).lookup(spec_key)
+            if existing is not None:
+                if output is not None:
+                    with open(existing, 'rb') as file:
+                        shutil.copyfileobj(file, output)
+                print(f"Reused collage: {existing}")
+                return existing
+
+        # The HTML export reuses the images the render decodes, at the size its derivatives
+        # need; sources passed in (a budgeted render) are only decoded as large as the render needs
+        owned = html and persist and sources is None
+        if owned:
+            sources = {}
+        try:
+            start = time.perf_counter()
+            background, grid, placements = self._compose_collage(image_files, dimensions, style, layout, title, quality,
+                                                                 seed=seed, sources=sources,
+                                                                 source_scale=SOURCE_SCALE if owned else 0)
+            rendered = time.perf_counter()
+            encoder_options = encoder_options or {}
+
+            if not persist:
+                encode_collage(background, output, output_format, **encoder_options)
+                if timings is not None:
+                    timings.update(render=rendered - start, encode=time.perf_counter() - rendered)
+                print(f"Created collage ({output_format}, not persisted)")
+                return None
+
+            with OutputFile(self.output_dir, extension) as output_file:
+                encode_collage(background, TeeSink(output_file, output) if output is not None else output_file,
+                               output_format, **encoder_options)
+            output_path = output_file.path
+            if timings is not None:
+                timings.update(render=rendered - start, encode=time.perf_counter() - rendered)
+
+            print(f"Created collage: {output_path}")
+
+            # Generate a default title if none provided
+            if title is None:
+                title = f"Photo Collage - {datetime.now().strftime('%B %d, %Y')}"
+
+            # Convert collage to HTML with title; the page and its assets are named after the image
+            output_name = os.path.splitext(os.path.relpath(output_path, self.output_dir))[0]
+            html_path = None
+            if html:
+                html_path = self.convert_collage_to_html(
+                    image_files,
+                    dimensions,
+                    grid,
+                    style,
+                    output_name=output_name,
+                    title=title,
+                    placements=placements,
+                    html_mode=html_mode,
+                    sources=sources
+                )
+
+            if spec_key is not None:
+                SpecIndex(self.output_dir).record(spec_key, output_path,
+                                                  html=os.path.relpath(html_path, self.output_dir) if html_path else None)
+            return output_path
+        finally:
+            if owned:
+                for image in sources.values():
+                    image.close()
+
+    def collage_spec_key(self, image_files: List[str], dimensions: Tuple[int, int], style: dict,
+                         layout: str = None, title: str = None, quality: str = None,
+                         output_format: str = None, seed: int = None, encoder_options: dict = None) -> str:
+        """Computes the key identifying a collage's images and settings in the spec index.
 
+        Args:
+            image_files (List[str]): The filenames or URLs of the images.
+            dimensions (Tuple[int, int]): The width and height of the collage.
+            style (dict): The style properties of the collage.
+            layout (str, optional): The name of the layout. Defaults to None (random layout).
+            title (str, optional): The title drawn on the collage. Defaults to None.
+            quality (str, optional): The TRANSFORM_QUALITY preset. Defaults to the generator's transform_quality.
+            output_format (str, optional): The Pillow format. Defaults to None (PNG for
+                transparent backgrounds, JPEG otherwise).
+            seed (int, optional): The seed of the random layout and rotations. Defaults to None.
+            encoder_options (dict, optional): The options of the encoder. Defaults to None.
+
+        Returns:
+            str: The key, or None if an image is not a file or URL (a decoded image).
+        """
+        if not all(isinstance(image_file, str) for image_file in image_files):
+            return None
+        from checkpoint import collage_key
+        if output_format is None:
+            output_format = 'PNG' if style['background_color'] == 'transparent' else 'JPEG'
+        # Encoder options are only part of keys that have some, so earlier keys stay valid
+        extra = {'encoder_options': encoder_options} if encoder_options else {}
+        return collage_key([self.image_key(image_file) for image_file in image_files],
+                           dimensions=list(dimensions), style=style, layout=layout, title=title,
+                           quality=quality or self.transform_quality, format=output_format, seed=seed, **extra)
+
+    def find_collage(self, image_files: List[str], dimensions: Tuple[int, int], style: dict, layout: str = None,
+                     title: str = None, quality: str = None, output_format: str = None, seed: int = None) -> str:
+        """Finds the collage already made from the same images and settings.
+
+        Args:
+            image_files (List[str]): The filenames or URLs of the images.
+            dimensions (Tuple[int, int]): The width and height of the collage.
+            style (dict): The style properties of the collage.
+            layout (str, optional): The name of the layout. Defaults to None.
+            title (str, optional): The title drawn on the collage. Defaults to None.
+            quality (str, optional): The TRANSFORM_QUALITY preset. Defaults to the generator's transform_quality.
+            output_format (str, optional): The Pillow format. Defaults to None (PNG for
+                transparent backgrounds, JPEG otherwise).
+            seed (int, optional): The seed of the random layout and rotations. Defaults to None.
+
+        Returns:
+            str: The path of the collage, or None if there is none (left) or it was not
+            indexed (see create_single_collage).
+        """
+        key = self.collage_spec_key(image_files, dimensions, style, layout, title, quality, output_format, seed)
+        return SpecIndex(self.output_dir).lookup(key) if key is not None else None
+
+    def render_collage(self, image_files: List[str], dimensions: Tuple[int, int], style: dict,
+                       layout: str = None, title: str = None, quality: str = None, seed: int = None) -> Image:
+        """Renders a collage in memory, without writing any file.
+
+        Args:
+            image_files (List[str]): The filenames or URLs of the images, or decoded Images.
+            dimensions (Tuple[int, int]): A tuple containing the width and height of the collage.
+            style (dict): A dictionary containing the style properties for the collage.
+            layout (str, optional): The name of the grid layout to use. Defaults to None (random layout).
+            title (str, optional): The title drawn on the collage. Defaults to None.
+            quality (str, optional): The TRANSFORM_QUALITY preset used to resample tiles.
+                Defaults to the generator's transform_quality.
+            seed (int, optional): The seed of the random layout and rotations. Defaults to None (random).
+
+        Returns:
+            Image: The RGBA collage.
+        """
+        return self._compose_collage(image_files, dimensions, style, layout, title, quality, seed=seed)[0]
+
+    def render_preview(self, image_files: List[str], dimensions: Tuple[int, int], style: dict,
+                       layout: str = None, title: str = None, seed: int = None) -> Image:
+        """Renders a quick, low-resolution preview of a collage.
+
+        The preview is drawn at most PREVIEW['max_side'] pixels wide or high, with the
+        cheap resampling filters of PREVIEW['quality']. That preset also decodes JPEGs at
+        the smallest DCT scale the tiles allow. Drop shadows are skipped unless
+        PREVIEW['shadow'] is set. With the same seed, the preview has the same layout and
+        rotations as the full render (render_collage or create_single_collage), which can
+        then replace it.
+
+        Args:
+            image_files (List[str]): The filenames or URLs of the images, or decoded Images.
+            dimensions (Tuple[int, int]): The width and height of the full collage.
+            style (dict): The style properties of the collage.
+            layout (str, optional): The name of the grid layout to use. Defaults to None (random layout).
+            title (str, optional): The title drawn on the collage. Defaults to None.
+            seed (int, optional): The seed of the random layout and rotations. Defaults to None.
+
+        Returns:
+            Image: The RGBA preview, scaled down from dimensions.
+        """
+        scale = min(1.0, PREVIEW['max_side'] / max(dimensions))
+        size = (max(1, round(dimensions[0] * scale)), max(1, round(dimensions[1] * scale)))
+        preview_style = dict(style, border_size=round(style['border_size'] * scale),
+                             shadow=style['shadow'] and PREVIEW['shadow'])
+        image = self._compose_collage(image_files, size, preview_style, layout, None, PREVIEW['quality'], seed=seed)[0]
+        if title:
+            margin = max(1, round(10 * scale))
+            image = self.add_text_to_collage(image, title, font_size=max(8, round(50 * scale)),
+                                             position=(margin, margin))
+        return image
+
+    def _compose_collage(self, image_files: List[str], dimensions: Tuple[int, int], style: dict,
+                         layout: str = None, title: str = None, quality: str = None,
+                         layout_config: dict = None, seed: int = None, sources: dict = None,
+                         source_scale: float = 0) -> Tuple[Image.Image, List, List[dict]]:
+        """Draws a collage; returns the RGBA image, its layout ratios and its tile placements."""
+        # The layout and rotations are drawn from a generator of this render only, so a
+        # seed fixes them without touching the shared `random` state of other threads
+        rng = random.Random(seed)
         # Create background with transparency if selected
         if style['background_color'] == 'transparent':
             background = Image.new('RGBA', dimensions, (0, 0, 0, 0))  # Fully transparent
@@ -162,10 +582,10 @@ class CollageGenerator:
             background = Image.alpha_composite(background, gradient)
 
         n_images = len(image_files)
-        border_size = style['border_size']
 
         # Use imported grid layouts
-        layout_config = random.choice(GRID_LAYOUTS.get(n_images, [DEFAULT_LAYOUT_CONFIG]))
+        if layout_config is None:
+            layout_config = self.choose_layout(n_images, layout, dimensions, style, rng)
         grid = layout_config["layout"]
         layout_name = layout_config["name"]
         layout_description = layout_config["description"]
@@ -176,123 +596,446 @@ class CollageGenerator:
         grid = grid[:n_images]
 
         # Process each image with enhanced styling
-        for idx, (image_file, (x_ratio, y_ratio, w_ratio, h_ratio)) in enumerate(zip(image_files, grid)):
-            # Calculate actual pixel coordinates
-            x = int(x_ratio * base_width)
-            y = int(y_ratio * base_height)
-            w = int(w_ratio * base_width) - (2 * border_size)
-            h = int(h_ratio * base_height) - (2 * border_size)
-
-            # Load image from file path
-            try:
-                img = Image.open(image_file)
-            except Exception as e:
-                print(f"Error loading image from path {image_file}: {e}")
-                continue
+        placements = self.render_tiles(background, image_files, grid, dimensions, style, quality, rng, sources,
+                                       source_scale)
 
-            # Calculate aspect ratios
-            img_aspect = img.width / img.height
-            target_aspect = w / h
-
-            # Determine if we need to scale down (only scale if image is larger than cell)
-            scale_needed = img.width > w or img.height > h
+        # Add text overlay if provided
+        if title:
+            background = self.add_text_to_collage(background, title)
 
-            if scale_needed:
-                # Only scale down, preserving aspect ratio
-                if img.width / w > img.height / h:
-                    # Width is the limiting factor
-                    scale_factor = w / img.width
-                else:
-                    # Height is the limiting factor
-                    scale_factor = h / img.height
+        return background, grid, placements
 
-                # Resize using the calculated scale factor
-                new_size = (int(img.width * scale_factor), int(img.height * scale_factor))
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
+    def render_collage_sizes(self, image_files: List[str], dimensions_list: List[Tuple[int, int]], style: dict,
+                             layout: str = None, title: str = None, quality: str = None, seed: int = None) -> dict:
+        """Renders the same images as collages of several sizes, decoding each image once.
 
-            # Apply style effects
-            if style['shadow']:
-                img = self.add_drop_shadow(img, opacity=40)
+        The layout of every size is chosen first, which gives the largest tile each
+        image is shown at. Each image is then decoded once at the reduced scale that
+        tile needs (see tile_transform.prepare_source), and every size is drawn from
+        that decoded image; smaller sizes only reduce it further. Every size gets the
+        same layout and rotations, so they are all the same collage.
 
-            # Add border with style color
-            if style['border_size'] > 0:
-                img = self.add_border(img, style['border_size'], style['border_color'])
+        Args:
+            image_files (List[str]): The filenames or URLs of the images, or decoded Images.
+            dimensions_list (List[Tuple[int, int]]): The width and height of each collage.
+            style (dict): The style properties of the collages.
+            layout (str, optional): The name of the grid layout to use. Defaults to None (random layout).
+            title (str, optional): The title drawn on the collages. Defaults to None.
+            quality (str, optional): The TRANSFORM_QUALITY preset used to resample tiles.
+                Defaults to the generator's transform_quality.
+            seed (int, optional): The seed of the random layout and rotations. Defaults to None (random).
 
-            # Apply rotation based on style preset
-            rotation = random.uniform(*style['rotation_range'])
-            img = img.rotate(rotation, expand=True, resample=Image.Resampling.BICUBIC)
+        Returns:
+            dict: The 'decode_seconds' shared by all sizes, and the 'targets', one dict per
+            size with its 'dimensions', 'layout' name, RGBA 'image' and render 'seconds'.
+        """
+        quality = quality or self.transform_quality
+        reducing_gap = transform_settings(quality)['reducing_gap']
+        start = time.perf_counter()
+        sources = []
+        for image_file in image_files:
+            try:
+                sources.append(self.open_image(image_file))
+            except Exception as e:
+                print(f"Error loading image {image_file}: {e}")
+        n_images = len(sources)
+        # Each size draws its layout from the same state, which picks the same grid or
+        # the same scatter seed for all, and its rotations from the same seed
+        rng = random.Random(seed)
+        layout_seed, render_seed = rng.getrandbits(64), rng.getrandbits(64)
+
+        # The largest tile each image is shown at, over every size
+        layout_configs, largest = [], [(1, 1)] * n_images
+        for dimensions in dimensions_list:
+            layout_config = self.choose_layout(n_images, layout, dimensions, style, random.Random(layout_seed))
+            layout_configs.append(layout_config)
+            cells = compile_layout(tuple(layout_config["layout"][:n_images]), tuple(dimensions), style['border_size'])
+            for i, (source, cell) in enumerate(zip(sources, cells)):
+                tile_size = TileTransform.for_cell(source.size, cell, style['border_size'], 0).tile_size
+                largest[i] = (max(largest[i][0], tile_size[0]), max(largest[i][1], tile_size[1]))
+
+        decoded = []
+        for source, tile_size in zip(sources, largest):
+            image = prepare_source(source, tile_size, reducing_gap)
+            image.load()
+            decoded.append(image)
+        decode_seconds = time.perf_counter() - start
+
+        targets = []
+        for dimensions, layout_config in zip(dimensions_list, layout_configs):
+            start = time.perf_counter()
+            image = self._compose_collage(decoded, tuple(dimensions), style, layout, title, quality, layout_config,
+                                          render_seed)[0]
+            targets.append({'dimensions': tuple(dimensions), 'layout': layout_config['name'], 'image': image,
+                            'seconds': time.perf_counter() - start})
+        return {'decode_seconds': decode_seconds, 'targets': targets}
+
+    def create_collage_sizes(self, image_files: List[str], dimensions_list: List[Tuple[int, int]], style: dict,
+                             layout: str = None, title: str = None, quality: str = None,
+                             output_format: str = None, seed: int = None) -> List[dict]:
+        """Creates collages of several sizes from the same images, decoding each image once.
+
+        See render_collage_sizes. The collages are saved in output_dir like those of
+        create_single_collage, without HTML export.
 
-            # Calculate new position after rotation
-            paste_x = x + (w - img.width) // 2
-            paste_y = y + (h - img.height) // 2
+        Args:
+            image_files (List[str]): The filenames or URLs of the images.
+            dimensions_list (List[Tuple[int, int]]): The width and height of each collage.
+            style (dict): The style properties of the collages.
+            layout (str, optional): The name of the grid layout to use. Defaults to None (random layout).
+            title (str, optional): The title drawn on the collages. Defaults to None.
+            quality (str, optional): The TRANSFORM_QUALITY preset used to resample tiles.
+                Defaults to the generator's transform_quality.
+            output_format (str, optional): The Pillow format of the collages. Defaults to None
+                (PNG for transparent backgrounds, JPEG otherwise).
+            seed (int, optional): The seed of the random layout and rotations. Defaults to None (random).
 
-            # Create mask for smooth edges
-            mask = Image.new('L', img.size, 255)
+        Returns:
+            List[dict]: For each size, its 'dimensions', 'layout' name and 'path', and the
+            'decode_seconds' (shared), 'render_seconds' and 'encode_seconds' it took.
+        """
+        if output_format is None:
+            output_format = 'PNG' if style['background_color'] == 'transparent' else 'JPEG'
+        extension = 'jpg' if output_format == 'JPEG' else output_format.lower()
+
+        rendered = self.render_collage_sizes(image_files, dimensions_list, style, layout, title, quality, seed)
+        results = []
+        for target in rendered['targets']:
+            start = time.perf_counter()
+            with OutputFile(self.output_dir, extension) as output_file:
+                encode_collage(target.pop('image'), output_file, output_format)
+            results.append({'dimensions': target['dimensions'], 'layout': target['layout'],
+                            'path': output_file.path, 'decode_seconds': rendered['decode_seconds'],
+                            'render_seconds': target['seconds'], 'encode_seconds': time.perf_counter() - start})
+            width, height = target['dimensions']
+            print(f"Created {width}x{height} collage: {output_file.path} "
+                  f"(render {results[-1]['render_seconds']:.2f}s, encode {results[-1]['encode_seconds']:.2f}s)")
+        print(f"Decoded {len(image_files)} images once for {len(results)} sizes in {rendered['decode_seconds']:.2f}s")
+        return results
+
+    def create_budgeted_collage(self, image_files: List[str], dimensions: Tuple[int, int], latency_budget: float,
+                                style: dict, layout: str = None, title: str = None, output_format: str = None,
+                                seed: int = None, html: bool = False, **options) -> dict:
+        """Creates a collage within a latency budget, choosing its render settings to fit.
+
+        The resampling filters, reducing gap (and with it the JPEG draft scale), drop
+        shadows and encoder effort are chosen by the cost model of this machine (see
+        render_budget): of the settings predicted to fit the budget, those giving up the
+        least quality, or the fastest if none fits. The measured times then correct the
+        model. The model is not calibrated here; until render_budget.calibrate_cost_model
+        has run, the 'fast' preset is used. Downloading images from URLs and exporting
+        HTML are not part of the budget.
 
-            # Paste with rotation and transparency
-            background.paste(img, (paste_x, paste_y), mask)
+        Args:
+            image_files (List[str]): The filenames or URLs of the images, or decoded Images.
+            dimensions (Tuple[int, int]): The width and height of the collage.
+            latency_budget (float): The seconds rendering and encoding the collage may take.
+            style (dict): The style properties of the collage.
+            layout (str, optional): The name of the grid layout to use. Defaults to None (random layout).
+            title (str, optional): The title drawn on the collage. Defaults to None.
+            output_format (str, optional): The Pillow format of the collage. Defaults to None
+                (PNG for transparent backgrounds, JPEG otherwise).
+            seed (int, optional): The seed of the random layout and rotations. Defaults to None
+                (a random one, which is returned).
+            html (bool, optional): Whether to also export the collage as HTML. Defaults to False.
+            **options: Other arguments of create_single_collage (html_mode, output, persist, reuse).
 
-        # Add text overlay if provided
-        if title:
-            background = self.add_text_to_collage(background, title)
+        Returns:
+            dict: The 'path' of the collage (None if it was not persisted), its 'seed', the
+            chosen 'settings' (see render_budget.CostModel.choose), the 'predicted' seconds
+            of each stage, the 'measured' render and encode seconds, and the total 'seconds'.
+        """
+        from render_budget import get_cost_model
+
+        start = time.perf_counter()
+        if output_format is None:
+            output_format = 'PNG' if style['background_color'] == 'transparent' else 'JPEG'
+        # The layout is drawn once to plan the render and once to render it: a seed makes it the same
+        if seed is None:
+            seed = random.getrandbits(52)
+        model = get_cost_model()
+        # The sources opened to plan the render are the ones it draws
+        sources = {}
+        try:
+            plan = self._plan_collage(image_files, dimensions, style, layout, output_format, seed, sources)
+            settings, predicted = model.choose(plan, latency_budget - (time.perf_counter() - start))
 
-        # Update the save operation to use PNG for transparency support
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        # Use PNG for transparent backgrounds, JPEG otherwise
-        if style['background_color'] == 'transparent':
-            output_path = os.path.join(self.output_dir, f"collage_{timestamp}.png")
-            background.save(output_path, format='PNG')
-        else:
-            output_path = os.path.join(self.output_dir, f"collage_{timestamp}.jpg")
-            # Convert to RGB before saving as JPEG
-            background_rgb = background.convert('RGB')
-            background_rgb.save(output_path)
-
-        print(f"Created collage: {output_path}")
-
-        # Generate a default title if none provided
-        if title is None:
-            title = f"Photo Collage - {datetime.now().strftime('%B %d, %Y')}"
-
-        # Convert collage to HTML with title
-        self.convert_collage_to_html(
-            image_files,
-            dimensions,
-            grid,
-            style,
-            output_name=f"collage_{timestamp}",
-            title=title
-        )
-
-    def create_animated_collage(self, image_files: List[str], dimensions: Tuple[int, int], title: str = "Animated Collage", num_frames: int = 10, duration: float = 0.5):
+            quality = {key: settings[key] for key in ('resize_filter', 'affine_filter', 'reducing_gap')}
+            if style['shadow']:
+                style = dict(style, shadow=settings['shadow_blur'] is not None,
+                             shadow_blur=settings['shadow_blur'] or 0)
+            timings = {}
+            path = self.create_single_collage(image_files, dimensions, title=title, quality=quality, style=style,
+                                              layout=layout, html=html, output_format=output_format, seed=seed,
+                                              encoder_options=settings['encoder_options'], timings=timings,
+                                              sources=sources, **options)
+        finally:
+            for image in sources.values():
+                image.close()
+        model.observe(predicted, timings)
+        seconds = time.perf_counter() - start
+        prediction = (f"predicted {sum(predicted.values()) * 1000:.0f} ms" if model.calibrated
+                      else "cost model not calibrated")
+        print(f"Latency budget {latency_budget * 1000:.0f} ms: {settings['resize_filter']}/"
+              f"{settings['affine_filter']} filters, reducing gap {settings['reducing_gap']}, "
+              f"{settings['shadow']} shadows, {settings['encoder_effort']} encoding; "
+              f"{prediction}, took {seconds * 1000:.0f} ms")
+        return {'path': path, 'seed': seed, 'settings': settings, 'predicted': predicted, 'measured': timings,
+                'seconds': seconds}
+
+    def _plan_collage(self, image_files: List[str], dimensions: Tuple[int, int], style: dict, layout: str,
+                      output_format: str, seed: int, sources: dict = None):
+        """Describes the work of a seeded render for the cost model: its canvas and the source and cell of each tile.
+
+        The images opened for it are added to sources, when given, for the render to use.
+        """
+        from render_budget import DEFAULT_SOURCE_SIZE, RenderPlan, TilePlan
+
+        # The same draws as _compose_collage makes with this seed give the same layout
+        layout_config = self.choose_layout(len(image_files), layout, dimensions, style, random.Random(seed))
+        cells = compile_layout(tuple(layout_config["layout"][:len(image_files)]), tuple(dimensions),
+                               style['border_size'])
+        tiles = []
+        for image_file, (_, _, w, h) in zip(image_files, cells):
+            if isinstance(image_file, str) and image_file.startswith(('http://', 'https://')):
+                # Only the header is needed, but fetching it is a download of its own
+                tiles.append(TilePlan(DEFAULT_SOURCE_SIZE, (w, h)))
+                continue
+            try:
+                image = self.open_image(image_file)
+            except Exception:
+                continue  # Skipped by the render too
+            tiles.append(TilePlan(image.size, (w, h), jpeg=image.format == 'JPEG', decoded=image.format is None,
+                                  alpha=has_alpha(image)))
+            if image is image_file:
+                continue
+            if sources is not None:
+                sources[image_file] = image
+            else:
+                image.close()
+        return RenderPlan(tuple(dimensions), tiles, output_format,
+                          rotation=max(abs(angle) for angle in style['rotation_range']), shadow=bool(style['shadow']))
+
+    def create_animated_collage(self, image_files: List[str], dimensions: Tuple[int, int], title: str = "Animated Collage", num_frames: int = 10, duration: float = 0.5,
+                                style: dict = None, output_format: str = None, layout: str = None, colors: int = 256,
+                                quantizer: str = 'mediancut', max_fps: float = None, video_quality: str = 'balanced',
+                                video_options: dict = None, workers: int = 1, seed=None) -> str:
         """Creates an animated collage (GIF or MP4) from a list of images.
 
+        Frames are independent, so they can be rendered by several processes. Each frame
+        has its own seed derived from `seed`, so the animation does not depend on the
+        number of workers (see frame_pipeline).
+
         Args:
             image_files (List[str]): A list of filenames or URLs of the images to be used in the collage.
             dimensions (Tuple[int, int]): A tuple containing the width and height of the collage.
             title (str, optional): The title of the collage. Defaults to "Animated Collage".
             num_frames (int, optional): The number of frames in the animation. Defaults to 10.
             duration (float, optional): The duration of each frame in seconds. Defaults to 0.5.
+            style (dict, optional): The style properties for the collage. Defaults to None, which asks the user.
+            output_format (str, optional): 'gif' or 'mp4'. Defaults to None, which asks the user.
+            layout (str, optional): The name of the grid layout to use for every frame.
+                Defaults to None (a random layout per frame).
+            colors (int, optional): The number of GIF palette colors, 2 to 256. Defaults to 256.
+            quantizer (str, optional): The GIF palette quantizer, a key of gif_encoder.QUANTIZERS
+                ('mediancut' or the faster 'fast'). Defaults to 'mediancut'.
+            max_fps (float, optional): The highest GIF frame rate; frames are dropped above it.
+                Defaults to None (gif_encoder.MAX_GIF_FPS).
+            video_quality (str, optional): The VIDEO_QUALITY preset of MP4 encoding. Defaults to 'balanced'.
+            video_options (dict, optional): MP4 settings overriding the preset: 'preset', 'crf',
+                'pix_fmt', 'threads' and 'faststart' (see video_encoder.encode_mp4). Defaults to None.
+            workers (int, optional): The number of processes rendering frames. Defaults to 1.
+            seed (optional): The seed of the animation, to reproduce it. Defaults to None (random).
+
+        Returns:
+            str: The path to the generated animation.
         """
-        style = self.get_style_choice()
-        output_format = self.get_animation_format_choice()
+        if style is None:
+            style = self.get_style_choice()
+        if output_format is None:
+            output_format = self.get_animation_format_choice()
 
-        frames = []
-        for _ in range(num_frames):
-            # Create a single frame of the collage
-            frame = self.create_single_collage_frame(image_files, dimensions, style)
-            frames.append(frame)
+        # Frames are created as they are consumed, in order: MP4 encodes each one as it
+        # arrives, the GIF palette needs them all
+        from frame_pipeline import frame_seeds, render_frames
+        frames = render_frames(self, frame_seeds(seed, num_frames), workers=workers,
+                               image_files=image_files, dimensions=dimensions, style=style, layout=layout)
 
-        # Save the animated collage
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        if output_format == 'gif':
-            output_path = os.path.join(self.output_dir, f"animated_collage_{timestamp}.gif")
-            imageio.mimsave(output_path, frames, duration=duration)
-        else: # mp4
-            output_path = os.path.join(self.output_dir, f"animated_collage_{timestamp}.mp4")
-            imageio.mimwrite(output_path, frames, fps=1/duration)
+        return self.save_animation(frames, duration, output_format, colors=colors, quantizer=quantizer,
+                                   max_fps=max_fps, video_quality=video_quality, video_options=video_options)
+
+    def save_animation(self, frames, duration: float, output_format: str, colors: int = 256,
+                       quantizer: str = 'mediancut', max_fps: float = None, video_quality: str = 'balanced',
+                       video_options: dict = None) -> str:
+        """Encodes the frames of an animated collage.
+
+        Args:
+            frames (Iterable[Image]): The frames. MP4 encodes a generator as it yields them.
+            duration (float): The duration of each frame in seconds.
+            output_format (str): 'gif' or 'mp4'.
+            colors (int, optional): The number of GIF palette colors, 2 to 256. Defaults to 256.
+            quantizer (str, optional): The GIF palette quantizer, a key of gif_encoder.QUANTIZERS.
+                Defaults to 'mediancut'.
+            max_fps (float, optional): The highest GIF frame rate. Defaults to None (gif_encoder.MAX_GIF_FPS).
+            video_quality (str, optional): The VIDEO_QUALITY preset of MP4 encoding. Defaults to 'balanced'.
+            video_options (dict, optional): MP4 settings overriding the preset. Defaults to None.
+
+        Returns:
+            str: The path to the generated animation.
+        """
+        # The encoders write to a temporary path, published under the content hash
+        with OutputFile(self.output_dir, output_format, 'animated_collage') as output_file:
+            if output_format == 'gif':
+                from gif_encoder import MAX_GIF_FPS, encode_gif
+                encode_gif(list(frames), output_file.temp_path, duration, colors=colors, quantizer=quantizer,
+                           max_fps=max_fps or MAX_GIF_FPS)
+            else: # mp4
+                from video_encoder import encode_mp4
+                settings = dict(VIDEO_QUALITY[video_quality], **(video_options or {}))
+                encoded = encode_mp4(frames, output_file.temp_path, fps=1 / duration, **settings)
+                print(f"Encoded {encoded['frames']} frames at {encoded['fps']:.1f} fps "
+                      f"({settings['preset']}, crf {settings['crf']}, {encoded['bytes'] / 1024:.0f} KB)")
+        output_path = output_file.path
 
         print(f"Created animated collage: {output_path}")
+        return output_path
+
+    def create_tween_animation(self, image_files: List[str], dimensions: Tuple[int, int], style: dict,
+                               layouts: List[str] = None, keyframes: int = 3, transition_frames: int = 24,
+                               hold_frames: int = 12, duration: float = 1 / 30, output_format: str = 'mp4',
+                               quality: str = None, loop: bool = True, seed: int = None, **encoding) -> str:
+        """Creates an animation in which the tiles move smoothly from one layout to the next.
+
+        Every source is decoded once and each frame only resamples the tiles that move,
+        which makes smooth, high frame-rate transitions affordable (see layout_tween).
+
+        Args:
+            image_files (List[str]): A list of filenames or URLs of the images to be used in the collage.
+            dimensions (Tuple[int, int]): A tuple containing the width and height of the collage.
+            style (dict): A dictionary containing the style properties for the collage.
+            layouts (List[str], optional): The layout names of the keyframes, in order (a layout may
+                repeat, e.g. 'Scatter'). Defaults to None (keyframes random layouts).
+            keyframes (int, optional): The number of random layouts when layouts is None. Defaults to 3.
+            transition_frames (int, optional): The in-between frames of each transition. Defaults to 24.
+            hold_frames (int, optional): The frames each layout is held for. Defaults to 12.
+            duration (float, optional): The duration of each frame in seconds. Defaults to 1/30.
+            output_format (str, optional): 'gif' or 'mp4'. Defaults to 'mp4'.
+            quality (str, optional): The TRANSFORM_QUALITY preset used to resample tiles.
+                Defaults to the generator's transform_quality.
+            loop (bool, optional): Whether to end with a transition back to the first layout. Defaults to True.
+            seed (int, optional): The seed of the random layouts and rotations. Defaults to None (random).
+            **encoding: The encoding settings of save_animation (colors, quantizer, max_fps,
+                video_quality, video_options).
+
+        Returns:
+            str: The path to the generated animation.
+        """
+        from layout_tween import LayoutTween
+
+        images, opened = [], []
+        for image_file in image_files:
+            try:
+                images.append(self.open_image(image_file))
+                opened.append(image_file)
+            except Exception as e:
+                print(f"Error loading image {image_file}: {e}")
+        if not images:
+            raise ValueError("None of the images could be opened")
+
+        n_images = len(images)
+        names = layouts or [None] * keyframes
+        rng = random.Random(seed)
+        cells, rotations = [], []
+        for name in names:
+            grid = self.choose_layout(n_images, name, dimensions, style, rng=rng)["layout"][:n_images]
+            cells.append(compile_layout(tuple(grid), tuple(dimensions), style['border_size']))
+            rotations.append([rng.uniform(*style['rotation_range']) for _ in range(n_images)])
+
+        if style['background_color'] == 'transparent':
+            background = Image.new('RGBA', dimensions, (0, 0, 0, 0))
+        else:
+            background = Image.new('RGBA', dimensions, style['background_color'])
+            background = Image.alpha_composite(background, self.create_gradient_overlay(dimensions, style['background_color']))
+
+        tween = LayoutTween.for_layouts(images, cells, rotations, background, style,
+                                        quality or self.transform_quality)
+        frames = tween.frames(transition_frames, hold_frames, loop=loop)
+        output_path = self.save_animation(frames, duration, output_format, **encoding)
+        stats = tween.stats
+        print(f"Tweened {len(opened)} images through {len(cells)} layouts: {stats['frames']} frames, "
+              f"{stats['rendered']} tiles rendered, {stats['reused']} reused, {stats['repeated']} frames repeated")
+        return output_path
+
+    def build_tile_atlas(self, image_files: List[str], atlas_dir: str, cell_size: Tuple[int, int] = (64, 64)):
+        """Shrinks a corpus of images once into a memory-mapped tile atlas.
+
+        Rebuilding an existing atlas only decodes new or changed files (see tile_atlas).
+
+        Args:
+            image_files (List[str]): The filenames or paths of the images.
+            atlas_dir (str): The directory of the atlas.
+            cell_size (Tuple[int, int], optional): The width and height of each thumbnail. Defaults to (64, 64).
+
+        Returns:
+            TileAtlas: The atlas.
+        """
+        from tile_atlas import TileAtlas
+
+        paths = [os.path.join(self.images_dir, image_file) if self.images_dir else image_file
+                 for image_file in image_files]
+        return TileAtlas.build(atlas_dir, paths, cell_size, open_image=self.open_image)
+
+    def create_contact_sheet(self, atlas_dir: str, columns: int = None, spacing: int = 2,
+                             background_color: str = 'white') -> str:
+        """Creates a contact sheet of every thumbnail of a tile atlas.
+
+        Args:
+            atlas_dir (str): The directory of an atlas made by build_tile_atlas.
+            columns (int, optional): The number of columns. Defaults to a roughly square sheet.
+            spacing (int, optional): The gap between thumbnails, in pixels. Defaults to 2.
+            background_color (str, optional): The color of the gaps. Defaults to 'white'.
+
+        Returns:
+            str: The path to the generated contact sheet.
+        """
+        from PIL import ImageColor
+        from tile_atlas import TileAtlas, contact_sheet
+
+        atlas = TileAtlas(atlas_dir)
+        columns = columns or max(1, round(len(atlas) ** 0.5))
+        sheet = contact_sheet(atlas, columns, spacing=spacing, background=ImageColor.getrgb(background_color))
+
+        with OutputFile(self.output_dir, 'jpg', 'contact_sheet') as output_file:
+            sheet.save(output_file, format='JPEG', quality=90)
+        output_path = output_file.path
+        print(f"Created contact sheet of {len(atlas)} images: {output_path}")
+        return output_path
+
+    def create_mosaic(self, target_file: str, atlas_dir: str, columns: int = 100, tint: float = 0.2,
+                      spacing: int = 0) -> str:
+        """Creates a photo mosaic: a target image recreated from the thumbnails of a tile atlas.
+
+        Args:
+            target_file (str): The filename, path or URL of the image to recreate.
+            atlas_dir (str): The directory of an atlas made by build_tile_atlas.
+            columns (int, optional): The number of thumbnails across. Defaults to 100.
+            tint (float, optional): How much each thumbnail is blended with the color it
+                stands for (0 to 1). Defaults to 0.2.
+            spacing (int, optional): The gap between thumbnails, in pixels. Defaults to 0.
+
+        Returns:
+            str: The path to the generated mosaic.
+        """
+        from tile_atlas import TileAtlas, photo_mosaic
+
+        atlas = TileAtlas(atlas_dir)
+        mosaic = photo_mosaic(atlas, self.open_image(target_file), columns, tint=tint, spacing=spacing)
+
+        with OutputFile(self.output_dir, 'jpg', 'mosaic') as output_file:
+            mosaic.save(output_file, format='JPEG', quality=90)
+        output_path = output_file.path
+        print(f"Created mosaic ({mosaic.width}x{mosaic.height}, {len(atlas)} tiles available): {output_path}")
+        return output_path
 
     def get_animation_format_choice(self) -> str:
         """Lets the user choose the animation output format.
@@ -326,25 +1069,27 @@ class CollageGenerator:
             Image: The collage image with the text overlay.
         """
         draw = ImageDraw.Draw(collage_image)
-        try:
-            font = ImageFont.truetype("arial.ttf", font_size)
-        except IOError:
-            font = ImageFont.load_default()
+        font = load_font(font_size)
         draw.text(position, text, font=font, fill=font_color)
         return collage_image
 
-    def create_single_collage_frame(self, image_files: List[str], dimensions: Tuple[int, int], style: dict) -> Image:
+    def create_single_collage_frame(self, image_files: List[str], dimensions: Tuple[int, int], style: dict, quality: str = None,
+                                    layout: str = None, seed: int = None) -> Image:
         """Creates a single frame for an animated collage.
 
         Args:
             image_files (List[str]): A list of filenames or URLs of the images to be used in the collage.
             dimensions (Tuple[int, int]): A tuple containing the width and height of the collage.
             style (dict): A dictionary containing the style properties for the collage.
+            quality (str, optional): The TRANSFORM_QUALITY preset used to resample tiles.
+                Defaults to the generator's transform_quality.
+            layout (str, optional): The name of the grid layout to use. Defaults to None (random layout).
+            seed (int, optional): The seed of the random layout and rotations. Defaults to None (random).
 
         Returns:
             Image: A single frame of the collage.
         """
-        base_width, base_height = dimensions
+        rng = random.Random(seed)
         if style['background_color'] == 'transparent':
             background = Image.new('RGBA', dimensions, (0, 0, 0, 0))
         else:
@@ -355,61 +1100,185 @@ class CollageGenerator:
             background = Image.alpha_composite(background, gradient)
 
         n_images = len(image_files)
-        border_size = style['border_size']
-        layout_config = random.choice(GRID_LAYOUTS.get(n_images, [DEFAULT_LAYOUT_CONFIG]))
+        layout_config = self.choose_layout(n_images, layout, dimensions, style, rng)
         grid = layout_config["layout"]
         grid = grid[:n_images]
 
-        for idx, (image_file, (x_ratio, y_ratio, w_ratio, h_ratio)) in enumerate(zip(image_files, grid)):
-            x = int(x_ratio * base_width)
-            y = int(y_ratio * base_height)
-            w = int(w_ratio * base_width) - (2 * border_size)
-            h = int(h_ratio * base_height) - (2 * border_size)
-
-            if image_file.startswith(('http://', 'https://')):
-                try:
-                    response = requests.get(image_file, stream=True)
-                    response.raise_for_status()
-                    img = Image.open(BytesIO(response.content))
-                except Exception as e:
-                    print(f"Error loading image from URL {image_file}: {e}")
-                    continue
-            else:
-                img_path = os.path.join(self.images_dir, image_file) if self.images_dir else image_file
-                try:
-                    img = Image.open(img_path)
-                except Exception as e:
-                    print(f"Error loading image from path {img_path}: {e}")
-                    continue
-
-            scale_needed = img.width > w or img.height > h
-            if scale_needed:
-                if img.width / w > img.height / h:
-                    scale_factor = w / img.width
-                else:
-                    scale_factor = h / img.height
-                new_size = (int(img.width * scale_factor), int(img.height * scale_factor))
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
+        self.render_tiles(background, image_files, grid, dimensions, style, quality, rng)
 
-            if style['shadow']:
-                img = self.add_drop_shadow(img, opacity=40)
-            if style['border_size'] > 0:
-                img = self.add_border(img, style['border_size'], style['border_color'])
+        return background.convert('RGB')
 
-            rotation = random.uniform(*style['rotation_range'])
-            img = img.rotate(rotation, expand=True, resample=Image.Resampling.BICUBIC)
+    def warm_up(self, dimensions_list: List[Tuple[int, int]]):
+        """Preloads everything a first render would otherwise have to load.
 
-            paste_x = x + (w - img.width) // 2
-            paste_y = y + (h - img.height) // 2
-            mask = Image.new('L', img.size, 255)
-            background.paste(img, (paste_x, paste_y), mask)
+        This imports every Pillow codec (HEIF included) and runs each decoder and encoder
+        once. It loads the title font and the saved render cost model (see render_budget),
+        compiles every grid layout for the given canvas sizes, and fills the gradient and
+        drop-shadow caches for them. Long-lived worker processes call it once at start-up.
 
-        return background.convert('RGB')
+        Args:
+            dimensions_list (List[Tuple[int, int]]): The canvas sizes that will be rendered.
+        """
+        Image.init()
+        register_heif_support()
+        for image_format in ('JPEG', 'PNG', 'WEBP'):
+            buffer = BytesIO()
+            Image.new('RGBA' if image_format != 'JPEG' else 'RGB', (16, 16)).save(buffer, format=image_format)
+            buffer.seek(0)
+            Image.open(buffer).load()
+
+        load_font(50)
+        # Loads the cost model of latency budgets; the process starting the workers calibrates it
+        from render_budget import get_cost_model
+        get_cost_model()
+
+        styles = self.style_presets.values()
+        border_sizes = {style['border_size'] for style in styles}
+        shadows = any(style['shadow'] for style in styles)
+        for dimensions in dimensions_list:
+            dimensions = tuple(dimensions)
+            for color in {style['background_color'] for style in styles}:
+                if color != 'transparent':
+                    self.create_gradient_overlay(dimensions, color)
+            for layout_configs in GRID_LAYOUTS.values():
+                for layout_config in layout_configs:
+                    for border_size in border_sizes:
+                        cells = compile_layout(tuple(layout_config["layout"]), dimensions, border_size)
+                        if shadows:
+                            # Sources matching a cell's aspect ratio fill it exactly
+                            for _, _, w, h in cells:
+                                shadow_mask((max(1, w), max(1, h)))
+
+    def open_image(self, image_file: str) -> Image:
+        """Opens a source image from a URL or a local path.
+
+        Local paths are resolved against images_dir when it is set. The image is opened
+        lazily, so callers can still request a reduced-size JPEG decode before loading.
+        HEIF support is registered the first time a HEIC/HEIF image is seen, either by
+        its extension or because Pillow could not identify it otherwise. Images that
+        were already decoded (e.g. received from another process) are returned as is.
+
+        Args:
+            image_file (str): The filename, path or URL of the image, or a decoded Image.
+
+        Returns:
+            Image: The opened image.
+        """
+        if isinstance(image_file, Image.Image):
+            return image_file
+
+        if image_file.lower().endswith(HEIF_EXTENSIONS):
+            register_heif_support()
+
+        if image_file.startswith(('http://', 'https://')):
+            import requests
+            response = requests.get(image_file, stream=True)
+            response.raise_for_status()
+            source = BytesIO(response.content)
+        else:
+            source = os.path.join(self.images_dir, image_file) if self.images_dir else image_file
+
+        try:
+            return Image.open(source)
+        except UnidentifiedImageError:
+            if _heif_registered:
+                raise
+            # Possibly a HEIC image without a .heic extension
+            register_heif_support()
+            if isinstance(source, BytesIO):
+                source.seek(0)
+            return Image.open(source)
+
+    def render_tiles(self, background: Image, image_files: List[str], grid: List[Tuple],
+                     dimensions: Tuple[int, int], style: dict, quality: str = None,
+                     rng: random.Random = None, sources: dict = None, source_scale: float = 0) -> List[dict]:
+        """Places every image of a collage onto the background, in place.
+
+        Each image goes through a single fused scale + rotation + translation resample
+        straight into its destination region (see tile_transform), then through the
+        style's effect pipeline, which is compiled once for the whole collage (see tile_effects).
+        For styles without rotation, the tiles are then composited together on a NumPy
+        array of the canvas rather than pasted one by one, with identical output (see compositor).
+
+        Args:
+            background (Image): The RGBA canvas to draw on.
+            image_files (List[str]): A list of filenames or URLs of the images to be placed.
+            grid (List[Tuple]): The layout ratios (x, y, w, h) of each cell.
+            dimensions (Tuple[int, int]): A tuple containing the width and height of the collage.
+            style (dict): A dictionary containing the style properties for the collage.
+            quality (str, optional): The TRANSFORM_QUALITY preset used to resample tiles.
+                Defaults to the generator's transform_quality.
+            rng (random.Random, optional): The random generator the rotations are drawn from.
+                Defaults to None (the shared `random` generator).
+            sources (dict, optional): Images already opened, by image file. The others are
+                opened here and added to it, decoded, for exports to reuse. Defaults to None.
+            source_scale (float, optional): How many times its tile size each image kept in
+                sources is decoded at, at least, for the exports that reuse it. Defaults to 0
+                (the size the tile needs).
+
+        Returns:
+            List[dict]: The placement of each image that was drawn: its 'image', pixel
+            'cell' and 'rotation', and the 'size' of the source, so exports can reproduce
+            the same collage.
+        """
+        border_size = style['border_size']
+        quality = quality or self.transform_quality
+        reducing_gap = transform_settings(quality)['reducing_gap']
+        rng = rng or random
+        effects = EffectPipeline.compile(style)
+        cells = compile_layout(tuple(grid), tuple(dimensions), border_size)
+
+        placements = []
+        # The tiles to composite at the end, when the NumPy compositor is used
+        tiles = [] if self.use_numpy_compositor(style) else None
+
+        for image_file, (x, y, w, h) in zip(image_files, cells):
+            keep = sources is not None and isinstance(image_file, str)
+            try:
+                img = sources.get(image_file) if keep else None
+                if img is None:
+                    img = self.open_image(image_file)
+            except Exception as e:
+                print(f"Error loading image {image_file}: {e}")
+                continue
+
+            # Apply rotation based on style preset
+            rotation = rng.uniform(*style['rotation_range'])
+            transform = TileTransform.for_cell(img.size, (x, y, w, h), border_size, rotation)
+            placements.append({'image': image_file, 'cell': (x, y, w, h), 'rotation': rotation, 'size': img.size})
+            if keep:
+                # Decoded once, large enough for the tile and for the exports reusing it
+                if source_scale and reducing_gap:
+                    img = prepare_source(img, transform.tile_size, max(source_scale, reducing_gap))
+                sources[image_file] = img
+            source_has_alpha = has_alpha(img)
+            tile, position = resample_tile(img, transform, quality)
+            tile, position = effects.render(tile, position, transform, source_has_alpha)
+
+            if tiles is not None:
+                tiles.append((tile, position))
+            else:
+                # Paste using the tile's own alpha so rotated corners stay transparent
+                background.paste(tile, position, tile if tile.mode == 'RGBA' else None)
+
+        if tiles:
+            from compositor import composite_tiles
+            composite_tiles(background, tiles)
+        return placements
 
     def convert_collage_to_html(self, image_files: List[str], dimensions: Tuple[int, int],
-                               grid: List[Tuple], style: dict, output_name: str = None, title: str = "Image Collage"):
+                               grid: List[Tuple], style: dict, output_name: str = None, title: str = "Image Collage",
+                               placements: List[dict] = None, html_mode: str = 'images', sources: dict = None,
+                               seed: int = None):
         """Converts a collage to an HTML file.
 
+        Each image is shown through web-sized derivatives rather than the original file:
+        1x and 2x versions of its displayed size, in WebP with a JPEG (or PNG) fallback,
+        loaded lazily and with explicit intrinsic sizes (see html_assets). In 'sprite' mode
+        all images are packed into a single atlas instead, and each cell shows its part of
+        it through CSS background-position, so the page needs one image request. Assets
+        are written to "<output_name>_assets/" next to the page, with a manifest.json.
+
         Args:
             image_files (List[str]): A list of filenames or URLs of the images used in the collage.
             dimensions (Tuple[int, int]): A tuple containing the width and height of the collage.
@@ -417,19 +1286,44 @@ class CollageGenerator:
             style (dict): A dictionary containing the style properties for the collage.
             output_name (str, optional): The name of the output HTML file. Defaults to None.
             title (str, optional): The title of the HTML page. Defaults to "Image Collage".
+            placements (List[dict], optional): The placements returned by render_tiles, so the
+                page matches the raster collage exactly. Defaults to None (cells from the grid
+                and new random rotations).
+            html_mode (str, optional): 'images' (one request per image) or 'sprite' (one
+                atlas for the page). Defaults to 'images'.
+            sources (dict, optional): The images decoded by render_tiles, by image file, used
+                instead of opening, decoding (or downloading) them again. Defaults to None.
+            seed (int, optional): The seed of the rotations drawn without placements.
+                Defaults to None (random).
 
         Returns:
             str: The path to the generated HTML file.
         """
+        from html_assets import picture_tag, sprite_css, write_derivatives, write_manifest, write_sprite_atlas
+
         base_width, base_height = dimensions
         border_size = style.get('border_size', 0)
 
+        if output_name is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_name = f"collage_{timestamp}_{uuid.uuid4().hex[:8]}"
+        asset_dir = os.path.join(self.output_dir, f"{output_name}_assets")
+        # Links are relative to the page, which sits next to its asset directory
+        asset_name = f"{os.path.basename(output_name)}_assets"
+
+        if placements is None:
+            rng = random.Random(seed)
+            cells = compile_layout(tuple(grid), tuple(dimensions), border_size)
+            placements = [{'image': image_file, 'cell': cell, 'rotation': rng.uniform(*style['rotation_range'])}
+                          for image_file, cell in zip(image_files, cells)]
+
         # Create HTML content
         html = [
             '<!DOCTYPE html>',
             '<html>',
             '<head>',
             '    <meta charset="UTF-8">',
+            '    <meta name="viewport" content="width=device-width, initial-scale=1">',
             f'    <title>{title}</title>',
             '    <style>',
             '        body { font-family: Arial, sans-serif; margin: 0; padding: 20px; text-align: center; }',
@@ -451,46 +1345,61 @@ class CollageGenerator:
             '    <div class="collage-container">'
         ])
 
-        # Add each image
-        for idx, (image_file, (x_ratio, y_ratio, w_ratio, h_ratio)) in enumerate(zip(image_files, grid)):
-            # Calculate actual pixel coordinates
-            x = int(x_ratio * base_width)
-            y = int(y_ratio * base_height)
-            w = int(w_ratio * base_width) - (2 * border_size)
-            h = int(h_ratio * base_height) - (2 * border_size)
-
-            # Calculate rotation
-            rotation = random.uniform(*style['rotation_range'])
+        # Lay out each image exactly like its raster tile
+        tiles = []
+        for idx, placement in enumerate(placements):
+            image_file = placement['image']
+            try:
+                img = sources.get(image_file) if sources and isinstance(image_file, str) else None
+                if img is None:
+                    img = self.open_image(image_file)
+            except Exception as e:
+                print(f"Error loading image {image_file}: {e}")
+                continue
 
-            # Create inline CSS for the image
+            # CSS rotates clockwise, TileTransform counter-clockwise. A reused source may have
+            # been decoded reduced, so the tile is sized from the original size
+            transform = TileTransform.for_cell(placement.get('size', img.size), placement['cell'], border_size,
+                                               placement['rotation'])
+            frame_width, frame_height = transform.frame_size
             image_style = [
-                f"left: {x}px",
-                f"top: {y}px",
-                f"width: {w}px",
-                f"height: {h}px",
-                f"transform: rotate({rotation}deg)",
-                f"object-fit: contain"
+                f"left: {round(transform.center[0] - frame_width / 2)}px",
+                f"top: {round(transform.center[1] - frame_height / 2)}px",
+                f"width: {frame_width}px",
+                f"height: {frame_height}px",
+                f"transform: rotate({-placement['rotation']:.3f}deg)",
             ]
 
             # Add border if specified
             if style['border_size'] > 0:
                 image_style.append(f"border: {style['border_size']}px solid {style['border_color']}")
+            tiles.append((idx, image_file, img, transform, image_style))
+
+        assets, sprites = [], None
+        if html_mode == 'sprite' and tiles:
+            # One atlas for the whole page; each cell shows its part of it
+            positions, sprites = write_sprite_atlas([img for _, _, img, _, _ in tiles],
+                                                    [transform.tile_size for _, _, _, transform, _ in tiles],
+                                                    asset_dir)
+            html.insert(html.index('    </style>'), '        ' + sprite_css('.collage-sprite', sprites, f"{asset_name}/"))
+            for (idx, image_file, _, transform, image_style), (sprite_x, sprite_y) in zip(tiles, positions):
+                alt = f"Collage image {idx+1}"
+                image_style.append(f"background-position: {-sprite_x}px {-sprite_y}px")
+                assets.append({'source': image_file if isinstance(image_file, str) else None, 'alt': alt,
+                               'sprite': {'x': sprite_x, 'y': sprite_y, 'width': transform.tile_size[0],
+                                          'height': transform.tile_size[1]}})
+                html.append(f'        <div class="collage-image collage-sprite" role="img" aria-label="{alt}" '
+                            f'style="{"; ".join(image_style)}"></div>')
+        else:
+            for idx, image_file, img, transform, image_style in tiles:
+                alt = f"Collage image {idx+1}"
+                variants = write_derivatives(img, transform.tile_size, asset_dir, f"{idx+1:02d}")
+                assets.append({'source': image_file if isinstance(image_file, str) else None,
+                               'alt': alt, 'variants': variants})
 
-            # Add shadow if enabled
-            if style.get('shadow', False):
-                # image_style.append("box-shadow: 4px 4px 8px rgba(0, 0, 0, 0.3)")
-                pass
-
-            # Determine image source path
-            if image_file.startswith(('http://', 'https://')):
-                # Use the URL directly
-                img_src = image_file
-            else:
-                # For local files, use relative path
-                img_src = os.path.join("../images", image_file)
-
-            # Add image element to HTML
-            html.append(f'        <img class="collage-image" src="{img_src}" alt="Collage image {idx+1}" style="{"; ".join(image_style)}">')
+                # Add image element to HTML
+                html.append(picture_tag(variants, f"{asset_name}/", alt, transform.tile_size,
+                                        "; ".join(image_style), css_class='collage-image', indent='        '))
 
         # Close HTML
         html.extend([
@@ -500,31 +1409,20 @@ class CollageGenerator:
         ])
 
         # Save HTML file
-        if output_name is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_name = f"collage_{timestamp}"
-
         html_path = os.path.join(self.output_dir, f"{output_name}.html")
-        with open(html_path, 'w') as f:
+        with atomic_write(html_path) as f:
             f.write('\n'.join(html))
 
-        print(f"Created HTML collage: {html_path}")
+        weight = ""
+        if assets:
+            manifest = write_manifest(os.path.join(asset_dir, 'manifest.json'), os.path.basename(html_path),
+                                      assets, sprites)
+            weight = f", {manifest['total_bytes'] / 1024:.0f} KB of images"
+        print(f"Created HTML collage: {html_path}{weight}")
         return html_path
 
-    @staticmethod
-    def rectangles_overlap(rect1, rect2):
-        """Checks if two rectangles overlap.
-
-        Args:
-            rect1 (Tuple[int, int, int, int]): The first rectangle (x1, y1, x2, y2).
-            rect2 (Tuple[int, int, int, int]): The second rectangle (x3, y3, x4, y4).
-
-        Returns:
-            bool: True if the rectangles overlap, False otherwise.
-        """
-        x1, y1, x2, y2 = rect1
-        x3, y3, x4, y4 = rect2
-        return not (x2 < x3 or x4 < x1 or y2 < y3 or y4 < y1)
+    # Kept for backward compatibility; scatter layouts use it through their spatial index
+    rectangles_overlap = staticmethod(rectangles_overlap)
 
     @staticmethod
     def create_gradient_overlay(dimensions: Tuple[int, int], base_color: str) -> Image:
@@ -535,21 +1433,9 @@ class CollageGenerator:
             base_color (str): The base color of the background.
 
         Returns:
-            Image: The gradient overlay image.
+            Image: The gradient overlay image. It is cached and shared, so it must not be modified.
         """
-        # Skip gradient for transparent backgrounds
-        if base_color == 'transparent':
-            return Image.new('RGBA', dimensions, (0, 0, 0, 0))
-
-        gradient = Image.new('RGBA', dimensions, (0, 0, 0, 0))
-        draw = ImageDraw.Draw(gradient)
-
-        # Create subtle diagonal gradient
-        for i in range(dimensions[1]):
-            alpha = int(255 * (1 - i/dimensions[1]) * 0.1)  # 10% maximum opacity
-            draw.line([(0, i), (dimensions[0], i)],
-                     fill=(255, 255, 255, alpha))
-        return gradient
+        return _gradient_overlay(tuple(dimensions), base_color)
 
     @staticmethod
     def add_drop_shadow(image: Image, opacity: int = 40) -> Image:
@@ -0,0 +1,215 @@
+"""Animated transitions between collage layouts.
+
+Every tile moves, scales and rotates smoothly from its place in one layout (a
+keyframe) to its place in the next. Sources are decoded and shrunk once, and each
+frame only resamples the tiles whose transform changed. Moving a tile by whole
+pixels does not change its pixels, only its position, and centers are snapped to a
+quarter pixel, so a tile sliding at constant size and rotation is rendered at most
+16 times. A tile that does not move reuses its earlier rendering, effects included,
+and a frame in which nothing moved (a held keyframe) is the previous frame itself.
+- TWEEN_SUBPIXEL_STEPS: The positions per pixel a tile center is snapped to.
+- ease_in_out: The easing curve of the transitions.
+- interpolate_transform: The transform of a tile part-way between two keyframes.
+- LayoutTween: Renders the frames of a tween between layouts.
+"""
+import math
+from collections import OrderedDict
+from typing import Iterator, List, Sequence, Tuple
+
+from PIL import Image
+
+from config import TRANSFORM_QUALITY
+from tile_effects import EffectPipeline
+from tile_transform import TileTransform, has_alpha, prepare_source, resample_tile
+
+TWEEN_SUBPIXEL_STEPS = 4
+
+# Rendered tiles kept per image; enough for the 16 sub-pixel phases of a slide
+TILE_CACHE_SIZE = 16
+
+
+def ease_in_out(t: float) -> float:
+    """Eases a transition: slow at both ends, fastest in the middle (smoothstep).
+
+    Args:
+        t (float): The linear progress, 0 to 1.
+
+    Returns:
+        float: The eased progress, 0 to 1.
+    """
+    return t * t * (3 - 2 * t)
+
+
+def interpolate_transform(start: TileTransform, end: TileTransform, t: float) -> TileTransform:
+    """Computes the placement of a tile part-way between two keyframes.
+
+    Args:
+        start (TileTransform): The placement at the first keyframe.
+        end (TileTransform): The placement at the second keyframe.
+        t (float): The progress, 0 (start) to 1 (end).
+
+    Returns:
+        TileTransform: The interpolated placement, its center snapped to
+        1/TWEEN_SUBPIXEL_STEPS of a pixel.
+    """
+    def lerp(a, b):
+        return a + (b - a) * t
+
+    def snap(value):
+        return round(value * TWEEN_SUBPIXEL_STEPS) / TWEEN_SUBPIXEL_STEPS
+
+    tile_size = (max(1, round(lerp(*(size[0] for size in (start.tile_size, end.tile_size))))),
+                 max(1, round(lerp(*(size[1] for size in (start.tile_size, end.tile_size))))))
+    center = (snap(lerp(start.center[0], end.center[0])), snap(lerp(start.center[1], end.center[1])))
+    return TileTransform(tile_size, start.border_size, lerp(start.rotation, end.rotation), center)
+
+
+class LayoutTween:
+    """The frames of an animation moving tiles between layouts.
+
+    Attributes:
+        keyframes (List[List[TileTransform]]): The placement of every tile in each layout.
+        stats (dict): The number of tiles 'rendered' and 'reused', and of 'frames' and
+            'repeated' (unchanged) frames produced so far.
+    """
+    def __init__(self, images: Sequence[Image.Image], keyframes: List[List[TileTransform]],
+                 background: Image.Image, style: dict, quality: str = 'quality', motion_quality: str = 'fast'):
+        """Prepares the sources of a tween.
+
+        Args:
+            images (Sequence[Image]): The opened source images, one per tile.
+            keyframes (List[List[TileTransform]]): For each layout, the placement of each tile.
+            background (Image): The RGBA background every frame starts from.
+            style (dict): The style properties of the collage (for its effects).
+            quality (str, optional): The TRANSFORM_QUALITY preset of the held keyframes. Defaults to 'quality'.
+            motion_quality (str, optional): The TRANSFORM_QUALITY preset of the in-between frames,
+                where each frame is only seen briefly. Defaults to 'fast'.
+        """
+        self.keyframes = keyframes
+        self.background = background
+        self.quality = quality
+        self.motion_quality = motion_quality
+        self.effects = EffectPipeline.compile(style)
+        self.stats = {'rendered': 0, 'reused': 0, 'frames': 0, 'repeated': 0}
+
+        # Shrink every source once, with the quality filter, to its largest placement;
+        # frames then only resample that small source
+        settings = TRANSFORM_QUALITY[quality]
+        self.sources, self.alpha = [], []
+        for i, image in enumerate(images):
+            largest = (max(frame[i].tile_size[0] for frame in keyframes),
+                       max(frame[i].tile_size[1] for frame in keyframes))
+            self.alpha.append(has_alpha(image))
+            source = prepare_source(image, largest, settings['reducing_gap'])
+            # Rotated tiles are resampled from RGBA, so convert those sources once here
+            rotated = any(not frame[i].is_axis_aligned for frame in keyframes)
+            source = source.convert('RGBA' if self.alpha[-1] or rotated else 'RGB')
+            if source.width > largest[0] and source.height > largest[1]:
+                source = source.resize(largest, getattr(Image.Resampling, settings['resize_filter']))
+            self.sources.append(source)
+        self._caches = [OrderedDict() for _ in images]
+        self._previous = None
+
+    @classmethod
+    def for_layouts(cls, images: Sequence[Image.Image], layouts: List[List[Tuple[int, int, int, int]]],
+                    rotations: List[List[float]], background: Image.Image, style: dict,
+                    quality: str = 'quality', motion_quality: str = 'fast') -> 'LayoutTween':
+        """Builds a tween from pixel layouts.
+
+        Args:
+            images (Sequence[Image]): The opened source images.
+            layouts (List[List[Tuple[int, int, int, int]]]): For each keyframe, the pixel
+                cell (x, y, w, h) of each image, border excluded (see compile_layout).
+            rotations (List[List[float]]): For each keyframe, the rotation of each image.
+            background (Image): The RGBA background every frame starts from.
+            style (dict): The style properties of the collage.
+            quality (str, optional): The TRANSFORM_QUALITY preset of the held keyframes. Defaults to 'quality'.
+            motion_quality (str, optional): The TRANSFORM_QUALITY preset of the in-between frames.
+                Defaults to 'fast'.
+
+        Returns:
+            LayoutTween: The tween.
+        """
+        keyframes = [[TileTransform.for_cell(image.size, cell, style['border_size'], rotation)
+                      for image, cell, rotation in zip(images, cells, angles)]
+                     for cells, angles in zip(layouts, rotations)]
+        return cls(images, keyframes, background, style, quality, motion_quality)
+
+    def _render_tile(self, i: int, transform: TileTransform, quality: str) -> Tuple[Image.Image, Tuple[int, int]]:
+        """Renders one tile, or shifts an earlier rendering of it by whole pixels."""
+        # Moving the center by whole pixels moves the tile without changing its pixels
+        shift = (math.floor(transform.center[0]), math.floor(transform.center[1]))
+        key = (quality, transform.tile_size, transform.rotation,
+               transform.center[0] - shift[0], transform.center[1] - shift[1])
+        cache = self._caches[i]
+        if key in cache:
+            cache.move_to_end(key)
+            self.stats['reused'] += 1
+            tile, (left, top) = cache[key]
+            return tile, (left + shift[0], top + shift[1])
+
+        tile, position = resample_tile(self.sources[i], transform, quality)
+        tile, position = self.effects.render(tile, position, transform, self.alpha[i])
+        cache[key] = (tile, (position[0] - shift[0], position[1] - shift[1]))
+        if len(cache) > TILE_CACHE_SIZE:
+            cache.popitem(last=False)
+        self.stats['rendered'] += 1
+        return tile, position
+
+    def frame(self, transforms: List[TileTransform], moving: List[bool] = None) -> Image.Image:
+        """Renders the frame showing every tile at the given placements.
+
+        Args:
+            transforms (List[TileTransform]): The placement of each tile.
+            moving (List[bool], optional): Which tiles are in motion; they are resampled with
+                motion_quality. Defaults to None (no tile is moving).
+
+        Returns:
+            Image: The RGB frame. It is the previous frame itself when nothing moved, so
+            it must not be modified.
+        """
+        qualities = [self.motion_quality if moving and moving[i] else self.quality for i in range(len(transforms))]
+        signature = [(quality, t.tile_size, t.rotation, t.center) for quality, t in zip(qualities, transforms)]
+        self.stats['frames'] += 1
+        if self._previous is not None and self._previous[0] == signature:
+            self.stats['repeated'] += 1
+            return self._previous[1]
+
+        canvas = self.background.copy()
+        for i, transform in enumerate(transforms):
+            tile, position = self._render_tile(i, transform, qualities[i])
+            canvas.paste(tile, position, tile if tile.mode == 'RGBA' else None)
+        image = canvas.convert('RGB')
+        self._previous = (signature, image)
+        return image
+
+    def frames(self, transition_frames: int = 24, hold_frames: int = 12, loop: bool = True,
+               easing=ease_in_out) -> Iterator[Image.Image]:
+        """Yields the frames of the animation, one at a time.
+
+        Each keyframe is shown for hold_frames frames, followed by transition_frames
+        in-between frames towards the next keyframe. With loop, the last keyframe
+        moves back to the first, so the animation repeats seamlessly.
+
+        Args:
+            transition_frames (int, optional): The in-between frames of each transition. Defaults to 24.
+            hold_frames (int, optional): The frames each keyframe is held for (at least 1). Defaults to 12.
+            loop (bool, optional): Whether to end with a transition back to the first keyframe. Defaults to True.
+            easing (Callable, optional): Maps linear progress to eased progress. Defaults to ease_in_out.
+
+        Yields:
+            Image: The RGB frames, in order.
+        """
+        count = len(self.keyframes)
+        for k, keyframe in enumerate(self.keyframes):
+            for _ in range(max(1, hold_frames)):
+                yield self.frame(keyframe)
+            if k + 1 == count and not (loop and count > 1):
+                break
+            target = self.keyframes[(k + 1) % count]
+            # Tiles placed the same in both layouts stay still, at keyframe quality
+            moving = [(a.tile_size, a.rotation, a.center) != (b.tile_size, b.rotation, b.center)
+                      for a, b in zip(keyframe, target)]
+            for step in range(1, transition_frames + 1):
+                t = easing(step / (transition_frames + 1))
+                yield self.frame([interpolate_transform(a, b, t) for a, b in zip(keyframe, target)], moving)
@@ -0,0 +1,290 @@
+"""Writable destinations for encoded collages.
+
+The encoders write to any object with a write(bytes) method: an open file, a
+BytesIO, a socket's makefile('wb'), or the sinks below. A collage can then go
+straight to where it is needed, and a local file is only written when one is
+wanted. StreamingSink hands the bytes to another thread while the encoder is
+still running, which is how a web response streams a collage as it is encoded.
+- encode_collage: Encodes a rendered collage into a path or a sink.
+- StreamingSink: A sink read, chunk by chunk, by another thread while it is written.
+- stream_encoding: Runs an encoder in a thread and returns its output as an iterator.
+- TeeSink: A sink writing to several sinks at once.
+- MemoryObjectStore: A dictionary standing in for an object store.
+- ObjectStoreSink: A sink uploading its content to an object store when closed.
+"""
+import queue
+import tempfile
+import threading
+from typing import Callable, Iterator
+
+from PIL import Image
+
+# The size of the chunks a StreamingSink hands over, and the chunks it holds before
+# the writer waits for the reader
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_MAX_CHUNKS = 16
+
+
+def encode_collage(image: Image.Image, output, image_format: str, **options):
+    """Encodes a rendered RGBA collage.
+
+    Args:
+        image (Image): The collage.
+        output: A path or a writable binary sink.
+        image_format (str): The Pillow format, such as 'JPEG', 'PNG' or 'WEBP'. JPEG drops
+            the alpha channel.
+        **options: Encoder options of the format, such as quality or compress_level.
+    """
+    if image_format == 'JPEG':
+        image = image.convert('RGB')
+    image.save(output, format=image_format, **options)
+
+
+class StreamingSink:
+    """A sink whose content is read, as it is written, by another thread.
+
+    Writes are grouped into chunks of chunk_size bytes. At most max_chunks wait for
+    the reader, after which the writer blocks, so a slow reader slows the encoder
+    down instead of filling memory. If the reader stops early, the next write
+    raises BrokenPipeError, so the writer does not wait forever.
+    """
+    _END = object()
+
+    def __init__(self, chunk_size: int = STREAM_CHUNK_SIZE, max_chunks: int = STREAM_MAX_CHUNKS):
+        """Creates an empty sink.
+
+        Args:
+            chunk_size (int, optional): The size of the chunks handed to the reader. Defaults to STREAM_CHUNK_SIZE.
+            max_chunks (int, optional): The chunks held before writes block. Defaults to STREAM_MAX_CHUNKS.
+        """
+        self.chunk_size = chunk_size
+        self._chunks = queue.Queue(max_chunks)
+        self._buffer = bytearray()
+        self._abandoned = threading.Event()
+        self.closed = False
+
+    def _put(self, item):
+        """Queues a chunk, waiting for room unless the reader has gone."""
+        while not self._abandoned.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise BrokenPipeError("The reader of the stream has stopped")
+
+    def write(self, data) -> int:
+        """Adds bytes to the stream.
+
+        Args:
+            data (bytes): The bytes.
+
+        Returns:
+            int: The number of bytes written.
+
+        Raises:
+            BrokenPipeError: If the reader has stopped reading.
+        """
+        if self.closed:
+            raise ValueError("write to a closed StreamingSink")
+        self._buffer += data
+        while len(self._buffer) >= self.chunk_size:
+            self._put(bytes(self._buffer[:self.chunk_size]))
+            del self._buffer[:self.chunk_size]
+        return len(data)
+
+    def flush(self):
+        """Does nothing; bytes are handed over a chunk at a time, and the rest on close."""
+
+    def close(self, error: BaseException = None):
+        """Ends the stream, handing over the last bytes.
+
+        Args:
+            error (BaseException, optional): The error that stopped the writer, raised to the
+                reader once it has read everything before it. Defaults to None.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self._buffer:
+                self._put(bytes(self._buffer))
+            self._buffer.clear()
+            self._put((self._END, error))
+        except BrokenPipeError:
+            pass
+
+    def __iter__(self) -> Iterator[bytes]:
+        """Yields the chunks as they are written, until the stream is closed.
+
+        Raises:
+            BaseException: The error the writer closed the stream with, if any.
+        """
+        try:
+            while True:
+                item = self._chunks.get()
+                if isinstance(item, tuple) and item[0] is self._END:
+                    if item[1] is not None:
+                        raise item[1]
+                    return
+                yield item
+        finally:
+            # Also reached when the reader stops early: release a blocked writer
+            self._abandoned.set()
+
+
+def stream_encoding(encode: Callable, *args, chunk_size: int = STREAM_CHUNK_SIZE, **kwargs) -> Iterator[bytes]:
+    """Runs an encoder in a thread and returns its output, chunk by chunk, as it is produced.
+
+    Args:
+        encode (Callable): The encoder, called as encode(*args, sink, **kwargs).
+        *args: The arguments before the sink.
+        chunk_size (int, optional): The size of the chunks. Defaults to STREAM_CHUNK_SIZE.
+        **kwargs: The keyword arguments of the encoder.
+
+    Returns:
+        Iterator[bytes]: The encoded chunks. It raises the encoder's error, if any,
+        after the chunks written before it.
+    """
+    sink = StreamingSink(chunk_size)
+
+    def run():
+        error = None
+        try:
+            encode(*args, sink, **kwargs)
+        except BaseException as e:
+            error = e
+        sink.close(error)
+
+    threading.Thread(target=run, name='stream-encoder', daemon=True).start()
+    return iter(sink)
+
+
+class TeeSink:
+    """A sink writing everything to several sinks, so one encoding serves them all."""
+    def __init__(self, *sinks):
+        """Creates a sink for the given sinks.
+
+        Args:
+            *sinks: The writable binary sinks.
+        """
+        self.sinks = sinks
+
+    def write(self, data) -> int:
+        """Writes bytes to every sink.
+
+        Args:
+            data (bytes): The bytes.
+
+        Returns:
+            int: The number of bytes written.
+        """
+        for sink in self.sinks:
+            sink.write(data)
+        return len(data)
+
+    def flush(self):
+        """Flushes every sink that can be flushed."""
+        for sink in self.sinks:
+            if hasattr(sink, 'flush'):
+                sink.flush()
+
+
+class MemoryObjectStore:
+    """An in-memory stand-in for an object store (S3, GCS, ...), with the same put/get calls.
+
+    Attributes:
+        objects (dict): The content and content type of each key.
+    """
+    def __init__(self):
+        """Creates an empty store."""
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, key: str, body, content_type: str = 'application/octet-stream'):
+        """Stores an object.
+
+        Args:
+            key (str): The key of the object.
+            body: A readable binary file object positioned at the start of the content.
+            content_type (str, optional): The content type. Defaults to 'application/octet-stream'.
+        """
+        content = body.read()
+        with self._lock:
+            self.objects[key] = (content, content_type)
+
+    def get_object(self, key: str) -> bytes:
+        """Reads an object.
+
+        Args:
+            key (str): The key of the object.
+
+        Returns:
+            bytes: The content.
+
+        Raises:
+            KeyError: If there is no such object.
+        """
+        with self._lock:
+            return self.objects[key][0]
+
+
+class ObjectStoreSink:
+    """A sink uploading what is written to it to an object store when it is closed.
+
+    The content is spooled in memory, spilling to a temporary file once it is larger
+    than spool_bytes, and uploaded in one put_object call, as object stores do not
+    accept appends.
+    """
+    def __init__(self, store, key: str, content_type: str = 'application/octet-stream',
+                 spool_bytes: int = 8 * 1024 * 1024):
+        """Creates an empty sink.
+
+        Args:
+            store: The object store; anything with put_object(key, body, content_type),
+                such as MemoryObjectStore or an adapter for a cloud client.
+            key (str): The key the content is stored under.
+            content_type (str, optional): The content type of the object. Defaults to 'application/octet-stream'.
+            spool_bytes (int, optional): The size above which the content spills to disk. Defaults to 8 MB.
+        """
+        self.store = store
+        self.key = key
+        self.content_type = content_type
+        self._spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes, mode='w+b')
+        self.closed = False
+
+    def write(self, data) -> int:
+        """Adds bytes to the object.
+
+        Args:
+            data (bytes): The bytes.
+
+        Returns:
+            int: The number of bytes written.
+        """
+        return self._spool.write(data)
+
+    def flush(self):
+        """Does nothing; the object is uploaded on close."""
+
+    def close(self):
+        """Uploads the object and frees its spooled content."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._spool.seek(0)
+            self.store.put_object(self.key, self._spool, self.content_type)
+        finally:
+            self._spool.close()
+
+    def __enter__(self) -> 'ObjectStoreSink':
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        # Nothing half-written is uploaded
+        if exc_type is None:
+            self.close()
+        else:
+            self.closed = True
+            self._spool.close()
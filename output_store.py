@@ -0,0 +1,234 @@
+"""Collision-free, atomic and sharded naming of generated files.
+
+Every output is written under a temporary name in the output directory, then
+renamed to a name derived from the SHA-256 of its content. Concurrent renders
+therefore never overwrite each other's files, and readers never see a half-written
+one. Identical outputs end up as a single file. Files are spread over
+SHARD_LEVELS levels of subdirectories named after the first hex digits of the
+hash (collages/3f/a2/collage_3fa2....jpg), so no directory grows past a few
+thousand entries however many files there are. A spec index maps the key of a
+render's inputs and settings (see checkpoint.collage_key) to its output, so a
+repeated request can be answered with the file already made.
+- SHARD_LEVELS: The levels of subdirectories outputs are spread over.
+- sharded_path: The path of an output named after its content hash.
+- atomic_write: Writes a file under a temporary name and renames it into place.
+- OutputFile: A sink published under its content hash once complete.
+- SpecIndex: Maps render specs to their outputs.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+# Hex digits of the hash kept in file names: 128 bits, far beyond any chance of collision
+NAME_DIGITS = 32
+
+# Files in progress start with this prefix; they are never served and, when a
+# crashed process leaves one behind, the storage sweeper removes it like any old file
+TEMP_PREFIX = '.tmp-'
+# The permissions of published files (temporary files are created private)
+FILE_MODE = 0o644
+SPEC_DIR = 'specs'
+
+
+def sharded_path(root: str, digest: str, extension: str, prefix: str = 'collage') -> str:
+    """Computes the path of an output named after its content hash.
+
+    Args:
+        root (str): The output directory.
+        digest (str): The hex SHA-256 of the content.
+        extension (str): The file extension, without the dot.
+        prefix (str, optional): The start of the file name. Defaults to 'collage'.
+
+    Returns:
+        str: root/<shard>/<shard>/<prefix>_<hash>.<extension>.
+    """
+    shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_LEVELS)]
+    return os.path.join(root, *shards, f"{prefix}_{digest[:NAME_DIGITS]}.{extension}")
+
+
+def _replace(source: str, destination: str):
+    """Renames a file into place, creating its directory (again, if a sweeper just removed it)."""
+    for attempt in range(3):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            os.replace(source, destination)
+            return
+        except FileNotFoundError:
+            if attempt == 2 or not os.path.exists(source):
+                raise
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = 'w', **open_args):
+    """Writes a file under a temporary name, renaming it to path once complete.
+
+    Readers see the old file or the new one, never a partial one. If the block
+    raises, the temporary file is removed and path is left unchanged.
+
+    Args:
+        path (str): The path of the file.
+        mode (str, optional): 'w' or 'wb'. Defaults to 'w'.
+        **open_args: Other arguments of open() (encoding, ...).
+
+    Yields:
+        file: The open temporary file.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, suffix=os.path.splitext(path)[1], dir=directory)
+    try:
+        with os.fdopen(fd, mode, **open_args) as file:
+            yield file
+        os.chmod(temp_path, FILE_MODE)
+        _replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class OutputFile:
+    """A writable sink whose content is published under its content hash once complete.
+
+    Write to it like a file, or let an encoder that needs a path (such as ffmpeg)
+    write to temp_path. Leaving the `with` block publishes the file; an exception
+    discards it instead.
+
+    Example:
+        with OutputFile(output_dir, 'jpg') as output:
+            image.save(output, format='JPEG')
+        print(output.path)
+
+    Attributes:
+        temp_path (str): Where the content is written until it is published.
+        path (str): The published path, once published.
+    """
+    def __init__(self, root: str, extension: str, prefix: str = 'collage'):
+        """Creates the temporary file.
+
+        Args:
+            root (str): The output directory.
+            extension (str): The file extension, without the dot.
+            prefix (str, optional): The start of the file name. Defaults to 'collage'.
+        """
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.extension = extension
+        self.prefix = prefix
+        fd, self.temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, suffix=f'.{extension}', dir=root)
+        self._file = os.fdopen(fd, 'wb')
+        self._hash = hashlib.sha256()
+        self._written = 0
+        self.path = None
+
+    def write(self, data) -> int:
+        """Writes bytes, hashing them on the way.
+
+        Args:
+            data (bytes): The bytes.
+
+        Returns:
+            int: The number of bytes written.
+        """
+        self._hash.update(data)
+        self._written += len(data)
+        return self._file.write(data)
+
+    def flush(self):
+        """Flushes the temporary file."""
+        self._file.flush()
+
+    def publish(self) -> str:
+        """Renames the complete file to the sharded path of its content hash.
+
+        An existing file with the same name has the same content, and is replaced.
+
+        Returns:
+            str: The published path.
+        """
+        self._file.close()
+        if self._written == os.path.getsize(self.temp_path):
+            digest = self._hash.hexdigest()
+        else:
+            # Written through temp_path rather than write()
+            with open(self.temp_path, 'rb') as file:
+                digest = hashlib.file_digest(file, 'sha256').hexdigest()
+        os.chmod(self.temp_path, FILE_MODE)
+        path = sharded_path(self.root, digest, self.extension, self.prefix)
+        _replace(self.temp_path, path)
+        self.path = path
+        return path
+
+    def discard(self):
+        """Deletes the temporary file."""
+        self._file.close()
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> 'OutputFile':
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.publish()
+        else:
+            self.discard()
+
+
+class SpecIndex:
+    """Maps the keys of render specs to the outputs they produced.
+
+    Each record is a small JSON file, sharded like the outputs under root/specs/ and
+    written atomically, so any number of processes can share the index without
+    locking. A record whose output has since been deleted reads as missing.
+    """
+    def __init__(self, root: str):
+        """Initializes the SpecIndex.
+
+        Args:
+            root (str): The output directory the recorded paths are relative to.
+        """
+        self.root = root
+
+    def _record_path(self, key: str) -> str:
+        """Returns the path of the record of a spec key."""
+        return os.path.join(self.root, SPEC_DIR, key[:SHARD_WIDTH], f"{key}.json")
+
+    def record(self, key: str, output_path: str, **info):
+        """Records the output of a spec, replacing any earlier record.
+
+        Args:
+            key (str): The spec key.
+            output_path (str): The path of the output.
+            **info: Other JSON-serializable details kept with the record (HTML page, ...).
+        """
+        record = dict(info, output=os.path.relpath(output_path, self.root), created=time.time())
+        with atomic_write(self._record_path(key)) as file:
+            json.dump(record, file)
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Finds the output of a spec.
+
+        Args:
+            key (str): The spec key.
+
+        Returns:
+            str: The path of the output, or None if the spec has no (remaining) output.
+        """
+        try:
+            with open(self._record_path(key)) as file:
+                record = json.load(file)
+        except (OSError, ValueError):
+            return None
+        path = os.path.join(self.root, record['output'])
+        return path if os.path.isfile(path) else None
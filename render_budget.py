@@ -0,0 +1,498 @@
+"""Latency budgets for collage renders.
+
+A render with a latency budget picks its settings instead of using fixed ones: the
+resampling filters of its tiles, the reducing gap (which sets the JPEG draft scale
+sources are decoded at), the drop shadows and the encoder effort. A cost model
+predicts the seconds each stage of the render takes with each combination of
+settings (see config.AUTOTUNE), from the pixels the stage handles: decoding, box
+reducing, resampling with each filter, drawing shadows, compositing and encoding.
+Of the combinations predicted to fit the budget, the one giving up the least quality
+is used.
+
+The model's rates, in seconds per megapixel, are timings of each stage on synthetic
+images on this machine. They are measured once, at start-up and never inside a
+timed render (see calibrate_cost_model), saved in CALIBRATION_FILE, and measured
+again when the machine, Python or Pillow changes. Processes starting together wait
+for the first one to measure, so the timings are not slowed by each other. Until
+the model is calibrated, budgeted renders use the 'fast' TRANSFORM_QUALITY preset.
+The measured times of budgeted renders then correct the predictions of the process
+as they come in.
+- CALIBRATION_FILE: Where the measured rates are saved.
+- TilePlan: The source and cell of one tile of a planned render.
+- RenderPlan: The work of a planned render.
+- draft_size: The size a JPEG is decoded at for a requested size.
+- calibrate: Measures the rates of every render stage on this machine.
+- CostModel: Predicts the stage times of a render and chooses its settings.
+- calibrate_cost_model: Loads or measures the calibration of this machine, at start-up.
+- get_cost_model: The cost model of this machine, calibrated or not, without measuring.
+"""
+import json
+import math
+import os
+import platform
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from io import BytesIO
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+from config import AUTOTUNE, TRANSFORM_QUALITY
+
+try:
+    import fcntl
+except ImportError:  # Windows: calibrations started together are not serialized
+    fcntl = None
+
+CALIBRATION_FILE = os.environ.get('COLLAGE_CALIBRATION_FILE', os.path.join(
+    os.path.expanduser('~'), '.cache', 'collage-maker', 'render_calibration.json'))
+# Bumped when the measurements change, so that older calibrations are redone
+CALIBRATION_VERSION = 1
+
+# Sources whose size cannot be read without fetching them (URLs) are assumed this large
+DEFAULT_SOURCE_SIZE = (4032, 3024)
+
+# How far each measured render moves the correction of the predictions towards
+# measured / predicted, and the bounds of the correction
+CORRECTION_WEIGHT = 0.3
+CORRECTION_RANGE = (0.25, 4.0)
+
+# The stages of a prediction, and the measured time (see create_single_collage's
+# timings) that corrects each
+STAGES = {'decode': 'render', 'resample': 'render', 'effects': 'render', 'composite': 'render',
+          'encode': 'encode'}
+
+
+class TilePlan(NamedTuple):
+    """The source and cell of one tile of a planned render."""
+    source_size: Tuple[int, int]
+    cell_size: Tuple[int, int]
+    jpeg: bool = True  # Decoded at a reduced DCT scale
+    decoded: bool = False  # Already decoded, so it costs nothing to decode
+    alpha: bool = False  # Has transparency, so drop shadows show
+
+
+class RenderPlan(NamedTuple):
+    """The work of a planned render: its canvas, tiles and the settings fixed by its style."""
+    dimensions: Tuple[int, int]
+    tiles: List[TilePlan]
+    output_format: str
+    rotation: float = 0.0  # The largest rotation of a tile, in degrees
+    shadow: bool = False  # Whether the style draws drop shadows
+
+
+def draft_size(source_size: Tuple[int, int], requested: Tuple[int, int]) -> Tuple[int, int]:
+    """Computes the size a JPEG is decoded at after Image.draft(mode, requested).
+
+    Args:
+        source_size (Tuple[int, int]): The size of the JPEG.
+        requested (Tuple[int, int]): The requested size.
+
+    Returns:
+        Tuple[int, int]: The size at the largest DCT scale (1/8, 1/4, 1/2 or 1) that is
+        still at least the requested size.
+    """
+    scale = min(source_size[0] // max(1, requested[0]), source_size[1] // max(1, requested[1]))
+    for factor in (8, 4, 2, 1):
+        if scale >= factor:
+            break
+    return (-(-source_size[0] // factor), -(-source_size[1] // factor))
+
+
+def _tile_size(tile: TilePlan) -> Tuple[int, int]:
+    """Returns the size a tile's source is scaled to (see tile_transform.fit_scale)."""
+    width, height = tile.source_size
+    scale = min(1.0, max(1, tile.cell_size[0]) / width, max(1, tile.cell_size[1]) / height)
+    return (max(1, int(width * scale)), max(1, int(height * scale)))
+
+
+def _megapixels(size: Tuple[float, float], rotation: float = 0.0) -> float:
+    """Returns the megapixels of a box, or of the bounding box of the box rotated by rotation degrees."""
+    width, height = size
+    if rotation:
+        cos, sin = abs(math.cos(math.radians(rotation))), abs(math.sin(math.radians(rotation)))
+        width, height = width * cos + height * sin, width * sin + height * cos
+    return width * height / 1e6
+
+
+def _best_time(function: Callable, repeat: int = 3) -> float:
+    """Returns the shortest of repeat timings of a function, in seconds."""
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _sample_image(size: Tuple[int, int]) -> Image.Image:
+    """Draws a photo-like RGB test image: smooth gradients with some noise."""
+    horizontal = Image.linear_gradient('L').rotate(90).resize(size)
+    vertical = Image.linear_gradient('L').resize(size)
+    radial = Image.radial_gradient('L').resize(size)
+    noise = Image.effect_noise((size[0] // 2, size[1] // 2), 8).resize(size)
+    return Image.merge('RGB', (horizontal, Image.blend(vertical, noise, 0.15), radial))
+
+
+def _rate_names() -> List[str]:
+    """Lists the rates the current AUTOTUNE settings need."""
+    names = ['open', 'jpeg_source', 'jpeg_decoded', 'decode', 'reduce', 'convert', 'paste', 'canvas',
+             'shadow_soft', 'shadow_hard']
+    names += [f'resize_{name}' for name in AUTOTUNE['filters']]
+    names += sorted({f'affine_{affine}' for affine, _ in AUTOTUNE['filters'].values()})
+    names += [f'encode_{image_format}_{effort}' for image_format, efforts in AUTOTUNE['encoder_efforts'].items()
+              for effort in efforts]
+    return names
+
+
+def calibrate() -> Dict[str, float]:
+    """Measures the rates of every render stage on this machine.
+
+    Each stage runs a few times on synthetic images and its shortest time is kept.
+    This takes a couple of seconds.
+
+    Returns:
+        Dict[str, float]: The rates, in seconds per megapixel, except 'open' (seconds per tile).
+    """
+    from output_sinks import encode_collage
+    from tile_effects import shadow_mask
+
+    rates = {}
+    sample = _sample_image((2048, 1536))
+    sample_mp = _megapixels(sample.size)
+    buffer = BytesIO()
+    sample.save(buffer, format='JPEG', quality=90)
+    jpeg = buffer.getvalue()
+
+    # Decoding at a DCT scale costs a part proportional to the source (entropy decoding)
+    # and one proportional to the decoded pixels: fit seconds / source MP against
+    # decoded pixels / source pixels
+    def decode(factor):
+        image = Image.open(BytesIO(jpeg))
+        image.draft('RGB', (sample.width // factor, sample.height // factor))
+        image.load()
+    points = [(1 / factor ** 2, _best_time(lambda: decode(factor)) / sample_mp) for factor in (1, 2, 4, 8)]
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    slope = (sum((x - mean_x) * (y - mean_y) for x, y in points)
+             / sum((x - mean_x) ** 2 for x, _ in points))
+    rates['jpeg_decoded'] = max(0.0, slope)
+    rates['jpeg_source'] = max(0.0, mean_y - slope * mean_x)
+    rates['open'] = _best_time(lambda: Image.open(BytesIO(jpeg)))
+
+    medium = sample.resize((1024, 768))
+    medium_mp = _megapixels(medium.size)
+    buffer = BytesIO()
+    medium.save(buffer, format='PNG')
+    png = buffer.getvalue()
+    rates['decode'] = _best_time(lambda: Image.open(BytesIO(png)).load()) / medium_mp
+    rates['reduce'] = _best_time(lambda: sample.reduce(2)) / sample_mp
+    rates['convert'] = _best_time(lambda: medium.convert('RGBA')) / medium_mp
+
+    # Resizes are priced by their input, affine transforms by their output
+    for name in AUTOTUNE['filters']:
+        resample = getattr(Image.Resampling, name)
+        rates[f'resize_{name}'] = _best_time(lambda: medium.resize((341, 256), resample)) / medium_mp
+    tile = medium.convert('RGBA')
+    radians = math.radians(5)
+    coefficients = (math.cos(radians), -math.sin(radians), 40, math.sin(radians), math.cos(radians), -40)
+    for affine in {affine for affine, _ in AUTOTUNE['filters'].values()}:
+        resample = getattr(Image.Resampling, affine)
+        rates[f'affine_{affine}'] = _best_time(
+            lambda: tile.transform(tile.size, Image.Transform.AFFINE, coefficients, resample=resample)) / medium_mp
+
+    canvas = Image.new('RGBA', medium.size, (0, 0, 0, 0))
+    rates['paste'] = _best_time(lambda: canvas.paste(tile, (0, 0), tile)) / medium_mp
+    rates['canvas'] = _best_time(lambda: Image.alpha_composite(Image.new('RGBA', medium.size, 'white'),
+                                                                Image.new('RGBA', medium.size))) / medium_mp
+
+    # A shadowed tile: its (uncached) mask, the frame buffer, the shadow and the image
+    def shadowed(blur_radius):
+        mask = shadow_mask.__wrapped__(tile.size, 40, 4, blur_radius)
+        frame = Image.new('RGBA', tile.size, (0, 0, 0, 0))
+        frame.paste((0, 0, 0, 255), (0, 0) + tile.size, mask)
+        frame.alpha_composite(tile)
+    rates['shadow_soft'] = _best_time(lambda: shadowed(3)) / medium_mp
+    rates['shadow_hard'] = _best_time(lambda: shadowed(0)) / medium_mp
+
+    small = tile.resize((640, 480))
+    for image_format, efforts in AUTOTUNE['encoder_efforts'].items():
+        for effort, (options, _) in efforts.items():
+            rates[f'encode_{image_format}_{effort}'] = _best_time(
+                lambda: encode_collage(small, BytesIO(), image_format, **options), repeat=2) / _megapixels(small.size)
+    return rates
+
+
+class CostModel:
+    """Predicts how long the stages of a render take, and chooses settings that fit a budget.
+
+    Predictions are the calibrated rates times the pixels of each stage, times a
+    correction per measured time ('render' and 'encode') learnt from the renders
+    observed so far. A model without rates predicts nothing and chooses the 'fast'
+    TRANSFORM_QUALITY preset.
+
+    Attributes:
+        rates (Dict[str, float]): The calibrated rates (see calibrate), or None.
+        corrections (Dict[str, float]): The measured / predicted ratio of each measured time.
+    """
+    def __init__(self, rates: Dict[str, float] = None):
+        """Initializes the CostModel.
+
+        Args:
+            rates (Dict[str, float], optional): The calibrated rates (see calibrate).
+                Defaults to None (not calibrated yet).
+        """
+        self.rates = rates
+        self.corrections = {'render': 1.0, 'encode': 1.0}
+        self._lock = threading.Lock()
+
+    @property
+    def calibrated(self) -> bool:
+        """Whether the model has rates to predict with."""
+        return self.rates is not None
+
+    def _tile_costs(self, plan: RenderPlan, resize_filter: str, affine_filter: str,
+                    reducing_gap: float) -> Tuple[float, float, float]:
+        """Predicts the decode, resample and composite seconds of the tiles with these filters and gap."""
+        rates = self.rates
+        decode = resample = 0.0
+        composite = rates['canvas'] * _megapixels(plan.dimensions)
+        for tile in plan.tiles:
+            tile_size = _tile_size(tile)
+            wanted = (math.ceil(tile_size[0] * reducing_gap), math.ceil(tile_size[1] * reducing_gap))
+            size = tile.source_size
+            if not tile.decoded:
+                decode += rates['open']
+                if tile.jpeg:
+                    source_mp = _megapixels(size)
+                    size = draft_size(size, wanted)
+                    decode += rates['jpeg_source'] * source_mp + rates['jpeg_decoded'] * _megapixels(size)
+                else:
+                    decode += rates['decode'] * _megapixels(size)
+            factor = min(size[0] // wanted[0], size[1] // wanted[1])
+            if factor >= 2:
+                resample += rates['reduce'] * _megapixels(size)
+                size = (-(-size[0] // factor), -(-size[1] // factor))
+            # Rotated tiles are resized like the others, then rotated by an affine pass
+            if size != tile_size:
+                resample += rates[f'resize_{resize_filter}'] * _megapixels(size)
+            if plan.rotation:
+                output_mp = _megapixels(tile_size, plan.rotation)
+                resample += (rates['convert'] * _megapixels(tile_size)
+                             + rates[f'affine_{affine_filter}'] * output_mp)
+            else:
+                output_mp = _megapixels(tile_size)
+            composite += rates['paste'] * output_mp
+        return decode, resample, composite
+
+    def _effects_cost(self, plan: RenderPlan, shadow_blur: Optional[int]) -> float:
+        """Predicts the seconds spent drawing drop shadows with this blur radius (None: no shadows)."""
+        if shadow_blur is None:
+            return 0.0
+        rate = self.rates['shadow_soft' if shadow_blur else 'shadow_hard']
+        return sum(rate * _megapixels(_tile_size(tile), plan.rotation) for tile in plan.tiles if tile.alpha)
+
+    def _correct(self, stages: Dict[str, float]) -> Dict[str, float]:
+        """Applies the learnt corrections to predicted stage times."""
+        return {stage: seconds * self.corrections[STAGES[stage]] for stage, seconds in stages.items()}
+
+    def predict(self, plan: RenderPlan, settings: dict) -> Dict[str, float]:
+        """Predicts the seconds of each stage of a render.
+
+        Args:
+            plan (RenderPlan): The render.
+            settings (dict): The settings, as returned by choose.
+
+        Returns:
+            Dict[str, float]: The seconds of each stage (see STAGES), or an empty dict if
+            the model is not calibrated.
+        """
+        if not self.calibrated:
+            return {}
+        decode, resample, composite = self._tile_costs(plan, settings['resize_filter'], settings['affine_filter'],
+                                                       settings['reducing_gap'])
+        encode = self.rates[f"encode_{plan.output_format}_{settings['encoder_effort']}"]
+        return self._correct({'decode': decode, 'resample': resample,
+                              'effects': self._effects_cost(plan, settings['shadow_blur']),
+                              'composite': composite, 'encode': encode * _megapixels(plan.dimensions)})
+
+    def choose(self, plan: RenderPlan, budget: float) -> Tuple[dict, Dict[str, float]]:
+        """Chooses the settings of a render that lose the least quality within a budget.
+
+        Every combination of the AUTOTUNE settings is priced; among those predicted to
+        take at most AUTOTUNE['margin'] of the budget, the one with the lowest total
+        loss wins (the fastest one on ties). When none fits, the fastest is used. An
+        uncalibrated model uses the 'fast' preset, without shadows, at the lowest
+        encoder effort, and predicts nothing.
+
+        Args:
+            plan (RenderPlan): The render.
+            budget (float): The seconds the render and its encoding may take.
+
+        Returns:
+            Tuple[dict, Dict[str, float]]: The settings ('resize_filter', 'affine_filter',
+            'reducing_gap', 'shadow', 'shadow_blur', 'encoder_effort', 'encoder_options',
+            'quality_loss' and 'fits'), and the predicted seconds of each stage.
+        """
+        if not self.calibrated:
+            return self._fast_settings(plan), {}
+        limit = budget * AUTOTUNE['margin']
+        shadows = AUTOTUNE['shadows'] if plan.shadow else {'none': (None, 0)}
+        efforts = AUTOTUNE['encoder_efforts'].get(plan.output_format, {'default': ({}, 0)})
+        canvas_mp = _megapixels(plan.dimensions)
+        best = None
+        for resize_filter, (affine_filter, filter_loss) in AUTOTUNE['filters'].items():
+            for reducing_gap, gap_loss in AUTOTUNE['reducing_gaps'].items():
+                decode, resample, composite = self._tile_costs(plan, resize_filter, affine_filter, reducing_gap)
+                for shadow, (shadow_blur, shadow_loss) in shadows.items():
+                    effects = self._effects_cost(plan, shadow_blur)
+                    for effort, (options, effort_loss) in efforts.items():
+                        stages = self._correct({
+                            'decode': decode, 'resample': resample, 'effects': effects, 'composite': composite,
+                            'encode': self.rates[f'encode_{plan.output_format}_{effort}'] * canvas_mp})
+                        seconds = sum(stages.values())
+                        loss = filter_loss + gap_loss + shadow_loss + effort_loss
+                        fits = seconds <= limit
+                        rank = (not fits, loss, seconds) if fits else (True, seconds, loss)
+                        if best is None or rank < best[0]:
+                            settings = {'resize_filter': resize_filter, 'affine_filter': affine_filter,
+                                        'reducing_gap': reducing_gap, 'shadow': shadow, 'shadow_blur': shadow_blur,
+                                        'encoder_effort': effort, 'encoder_options': dict(options),
+                                        'quality_loss': loss, 'fits': fits}
+                            best = (rank, settings, stages)
+        return best[1], best[2]
+
+    @staticmethod
+    def _fast_settings(plan: RenderPlan) -> dict:
+        """Returns the settings of a render without a calibration: the cheapest ones."""
+        fast = TRANSFORM_QUALITY['fast']
+        shadows = AUTOTUNE['shadows'] if plan.shadow else {'none': (None, 0)}
+        efforts = AUTOTUNE['encoder_efforts'].get(plan.output_format, {'default': ({}, 0)})
+        shadow = max(shadows, key=lambda name: shadows[name][1])
+        effort = max(efforts, key=lambda name: efforts[name][1])
+        loss = (AUTOTUNE['filters'].get(fast['resize_filter'], (None, 0))[1]
+                + AUTOTUNE['reducing_gaps'].get(fast['reducing_gap'], 0) + shadows[shadow][1] + efforts[effort][1])
+        return {'resize_filter': fast['resize_filter'], 'affine_filter': fast['affine_filter'],
+                'reducing_gap': fast['reducing_gap'], 'shadow': shadow, 'shadow_blur': shadows[shadow][0],
+                'encoder_effort': effort, 'encoder_options': dict(efforts[effort][0]), 'quality_loss': loss,
+                'fits': False}
+
+    def observe(self, predicted: Dict[str, float], measured: Dict[str, float]):
+        """Corrects later predictions with the measured times of a render.
+
+        Args:
+            predicted (Dict[str, float]): The prediction of the render (see predict and choose).
+            measured (Dict[str, float]): The measured 'render' and 'encode' seconds; missing
+                ones (a reused collage) are ignored.
+        """
+        with self._lock:
+            for group, correction in self.corrections.items():
+                # The prediction without the correction it was made with
+                raw = sum(seconds for stage, seconds in predicted.items() if STAGES[stage] == group) / correction
+                if raw <= 0 or measured.get(group) is None:
+                    continue
+                ratio = min(max(measured[group] / raw, CORRECTION_RANGE[0]), CORRECTION_RANGE[1])
+                self.corrections[group] = correction + CORRECTION_WEIGHT * (ratio - correction)
+
+
+@lru_cache(maxsize=None)
+def _signature() -> dict:
+    """Describes what a calibration is valid for: this machine, Python, Pillow and CALIBRATION_VERSION."""
+    import PIL
+    return {'version': CALIBRATION_VERSION, 'node': platform.node(), 'machine': platform.machine(),
+            'processor': platform.processor(), 'cpus': os.cpu_count(), 'python': platform.python_version(),
+            'pillow': PIL.__version__}
+
+
+def _load_rates(path: str, signature: dict) -> Optional[Dict[str, float]]:
+    """Reads the rates saved at path, if they were measured with this signature and cover every rate needed."""
+    try:
+        with open(path) as file:
+            record = json.load(file)
+        if record.get('signature') == signature and all(name in record['rates'] for name in _rate_names()):
+            return record['rates']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Holds an exclusive lock on path (created if needed) across processes, where fcntl is available."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+_cost_model = CostModel()
+_cost_model_lock = threading.Lock()
+
+
+def calibrate_cost_model(path: str = CALIBRATION_FILE) -> CostModel:
+    """Calibrates the shared cost model, measuring the rates only if none are saved.
+
+    Call it at start-up, before timed work: measuring takes a couple of seconds.
+    Processes calibrating at the same time queue on a lock file next to path, so
+    only the first one measures, alone, and the others read what it saved.
+
+    Args:
+        path (str, optional): The calibration file. Defaults to CALIBRATION_FILE.
+
+    Returns:
+        CostModel: The shared, calibrated cost model.
+    """
+    from output_store import atomic_write
+
+    with _cost_model_lock:
+        if _cost_model.calibrated:
+            return _cost_model
+        signature = _signature()
+        rates = _load_rates(path, signature)
+        if rates is None:
+            with _file_lock(path + '.lock'):
+                # Another process may have measured them while this one waited
+                rates = _load_rates(path, signature)
+                if rates is None:
+                    start = time.perf_counter()
+                    rates = calibrate()
+                    print(f"Calibrated the render cost model in {time.perf_counter() - start:.1f}s")
+                    try:
+                        with atomic_write(path) as file:
+                            json.dump({'signature': signature, 'created': time.time(), 'rates': rates}, file,
+                                      indent=1)
+                    except OSError as e:
+                        print(f"Could not save the render calibration to {path}: {e}")
+        _cost_model.rates = rates
+        return _cost_model
+
+
+def get_cost_model(path: str = CALIBRATION_FILE) -> CostModel:
+    """Returns the cost model of this machine, shared by the process.
+
+    The rates are read from path when the model has none yet. Nothing is measured
+    here, so this is safe in timed paths: without a saved calibration the model stays
+    uncalibrated (see CostModel.choose) until calibrate_cost_model runs.
+
+    Args:
+        path (str, optional): The calibration file. Defaults to CALIBRATION_FILE.
+
+    Returns:
+        CostModel: The cost model.
+    """
+    # While another thread calibrates, the model is returned as it is rather than waited for
+    if _cost_model.calibrated or not _cost_model_lock.acquire(blocking=False):
+        return _cost_model
+    try:
+        if os.path.exists(path):
+            _cost_model.rates = _load_rates(path, _signature())
+    finally:
+        _cost_model_lock.release()
+    return _cost_model
@@ -0,0 +1,406 @@
+"""A pool of long-lived, pre-warmed render processes for the web service.
+
+Building a CollageGenerator, importing codecs, resolving fonts and filling the layout,
+gradient and shadow caches all happen once per worker process at start-up instead of
+on the first request each one serves. Workers are recycled after a number of jobs or
+when their memory grows past a ceiling, so a leak in a decoder cannot accumulate.
+Images travel between the web process and the workers through shared memory (see
+shm_transport), so only small handles are pickled. Each worker reads its jobs from a
+queue of its own: a worker killed while waiting on a shared queue would leave the
+queue's lock held, and no other worker could receive a job again.
+- RenderPool: Starts the workers, dispatches jobs to them and replaces workers that exit.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import List, Tuple
+
+# Canvas sizes the workers warm up for when none are given
+DEFAULT_WARM_DIMENSIONS = ((1200, 1200),)
+
+
+def _memory_mb() -> float:
+    """Returns the resident memory of the current process in megabytes."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        import sys
+        # Peak rather than current memory, which is close enough for recycling
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _worker(tasks, results, output_dir: str, max_jobs: int, max_memory_mb: float,
+            warm_dimensions: List[Tuple[int, int]]):
+    """The main loop of a worker process.
+
+    Args:
+        tasks (multiprocessing.Queue): The worker's own queue of (job_id, method, kwargs,
+            output_buffer) jobs, or None to stop.
+        results (multiprocessing.Queue): The (event, pid, job_id, payload) messages to the pool.
+        output_dir (str): The output directory of the worker's CollageGenerator.
+        max_jobs (int): The number of jobs after which the worker exits (0 for no limit).
+        max_memory_mb (float): The resident memory after which the worker exits (0 for no limit).
+        warm_dimensions (List[Tuple[int, int]]): The canvas sizes to warm up for.
+    """
+    from image_collage_maker import CollageGenerator
+    from shm_transport import resolve_images, write_image
+
+    pid = os.getpid()
+    generator = CollageGenerator(images_dir=None, output_dir=output_dir)
+    started = time.perf_counter()
+    generator.warm_up(warm_dimensions)
+    results.put(('ready', pid, None, time.perf_counter() - started))
+
+    jobs, reason = 0, 'shutdown'
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        job_id, method, kwargs, output_buffer = task
+        try:
+            kwargs = {name: resolve_images(value) for name, value in kwargs.items()}
+            if isinstance(kwargs.get('style'), str):
+                kwargs['style'] = generator.style_presets[kwargs['style']]
+            result = getattr(generator, method)(**kwargs)
+            if output_buffer is not None:
+                result = write_image(result, output_buffer)
+            results.put(('done', pid, job_id, (True, result)))
+        except Exception as e:
+            results.put(('done', pid, job_id, (False, f"{type(e).__name__}: {e}")))
+
+        jobs += 1
+        if max_jobs and jobs >= max_jobs:
+            reason = f'recycled after {jobs} jobs'
+            break
+        if max_memory_mb and _memory_mb() > max_memory_mb:
+            reason = f'recycled at {_memory_mb():.0f} MB'
+            break
+
+    results.put(('exit', pid, None, reason))
+
+
+class RenderPool:
+    """A fixed number of pre-warmed CollageGenerator processes.
+
+    Jobs name a CollageGenerator method and its keyword arguments; a 'style' given as a
+    preset name is resolved in the worker. Each job's result is delivered through a
+    concurrent.futures.Future. Images are passed both ways through shared memory:
+    share_image() turns a decoded image into a handle that can be used in place of an
+    image file, and submit_image() returns the resulting image as a SharedImage. Workers use the 'spawn' start method, so they never
+    inherit the web server's threads or sockets.
+
+    Attributes:
+        output_dir (str): The directory the workers write collages to.
+        processes (int): The number of worker processes.
+        max_jobs_per_worker (int): The number of jobs after which a worker is replaced.
+        max_memory_mb (float): The resident memory after which a worker is replaced.
+        warm_dimensions (List[Tuple[int, int]]): The canvas sizes workers warm up for.
+    """
+    def __init__(self, output_dir: str, processes: int = None, max_jobs_per_worker: int = 200,
+                 max_memory_mb: float = 1024, warm_dimensions: List[Tuple[int, int]] = DEFAULT_WARM_DIMENSIONS):
+        """Initializes the RenderPool. Call start() to launch the workers.
+
+        Args:
+            output_dir (str): The directory the workers write collages to.
+            processes (int, optional): The number of worker processes. Defaults to the CPU count.
+            max_jobs_per_worker (int, optional): Jobs after which a worker is replaced (0 for
+                no limit). Defaults to 200.
+            max_memory_mb (float, optional): Resident memory in megabytes after which a worker is
+                replaced (0 for no limit). Defaults to 1024.
+            warm_dimensions (List[Tuple[int, int]], optional): The canvas sizes workers warm up
+                for. Defaults to DEFAULT_WARM_DIMENSIONS.
+        """
+        import multiprocessing
+
+        self.output_dir = output_dir
+        self.processes = processes or os.cpu_count() or 1
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_memory_mb = max_memory_mb
+        self.warm_dimensions = [tuple(dimensions) for dimensions in warm_dimensions]
+
+        self._context = multiprocessing.get_context('spawn')
+        self._results = self._context.Queue()
+        self._workers = {}    # pid -> Process
+        self._queues = {}     # pid -> the worker's task queue
+        self._idle = []       # pids of the workers waiting for a job
+        self._pending = deque()  # jobs not sent to a worker yet
+        self._in_flight = {}  # pid -> the job sent to the worker
+        self._futures = {}    # job_id -> Future
+        self._outputs = {}    # job_id -> shared output buffer
+        self._buffers = None
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._closed = False
+        self._collector = None
+        self._ready = threading.Event()
+        self._stats = {'jobs': 0, 'failed': 0, 'recycled': 0, 'crashed': 0, 'warm_up_s': []}
+
+    def start(self, wait: bool = False, calibrate: bool = False) -> 'RenderPool':
+        """Launches the workers.
+
+        Args:
+            wait (bool, optional): Whether to block until every worker is warm. Defaults to False.
+            calibrate (bool, optional): Whether to calibrate the render cost model first,
+                rather than on the first budgeted job (see submit). Defaults to False.
+
+        Returns:
+            RenderPool: The pool itself.
+        """
+        from shm_transport import SharedBufferPool
+
+        if calibrate:
+            self._calibrate()
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._buffers = SharedBufferPool(max_idle=2 * self.processes)
+        for _ in range(self.processes):
+            self._spawn()
+        self._collector = threading.Thread(target=self._collect, name='render-pool-collector', daemon=True)
+        self._collector.start()
+        if wait:
+            self._ready.wait()
+        return self
+
+    @staticmethod
+    def _calibrate():
+        """Calibrates the render cost model in this process.
+
+        The workers then load the saved calibration instead of all measuring it at once
+        (see render_budget). Once calibrated, this returns immediately.
+        """
+        from render_budget import calibrate_cost_model
+        calibrate_cost_model()
+
+    def _spawn(self):
+        """Starts one worker process."""
+        tasks = self._context.Queue()
+        process = self._context.Process(
+            target=_worker, daemon=True,
+            args=(tasks, self._results, self.output_dir, self.max_jobs_per_worker,
+                  self.max_memory_mb, self.warm_dimensions))
+        process.start()
+        with self._lock:
+            self._workers[process.pid] = process
+            self._queues[process.pid] = tasks
+
+    def _dispatch(self):
+        """Sends queued jobs to idle workers. Call with the lock held."""
+        while self._pending and self._idle:
+            pid = self._idle.pop()
+            task = self._in_flight[pid] = self._pending.popleft()
+            self._queues[pid].put(task)
+
+    def _forget(self, pid: int):
+        """Removes a worker that exited; returns the job it had been sent. Call with the lock held."""
+        if pid in self._idle:
+            self._idle.remove(pid)
+        tasks = self._queues.pop(pid, None)
+        if tasks is not None:
+            # Nobody reads it any more: do not wait for it to be flushed at exit
+            tasks.cancel_join_thread()
+            tasks.close()
+        return self._in_flight.pop(pid, None)
+
+    def _resolve(self, job_id: int, ok: bool, payload):
+        """Completes the future of a job."""
+        from shm_transport import SharedImage
+
+        with self._lock:
+            future = self._futures.pop(job_id, None)
+            output_buffer = self._outputs.pop(job_id, None)
+            self._stats['jobs'] += 1
+            if not ok:
+                self._stats['failed'] += 1
+        if output_buffer is not None and (not ok or future is None):
+            self._buffers.release(output_buffer)
+        if future is None:
+            return
+        if ok:
+            future.set_result(SharedImage(payload, self._buffers) if output_buffer else payload)
+        else:
+            future.set_exception(RuntimeError(payload))
+
+    def _collect(self):
+        """Handles worker messages and replaces workers that exit (run in a thread)."""
+        import queue
+
+        while True:
+            try:
+                event, pid, job_id, payload = self._results.get(timeout=0.5)
+            except queue.Empty:
+                event = None
+            except (EOFError, OSError):
+                return
+
+            if event == 'ready':
+                with self._lock:
+                    self._stats['warm_up_s'].append(round(payload, 3))
+                    if len(self._stats['warm_up_s']) >= self.processes:
+                        self._ready.set()
+                    if pid in self._workers:
+                        self._idle.append(pid)
+                        self._dispatch()
+            elif event == 'done':
+                with self._lock:
+                    self._in_flight.pop(pid, None)
+                    if pid in self._workers:
+                        self._idle.append(pid)
+                        self._dispatch()
+                self._resolve(job_id, *payload)
+            elif event == 'exit':
+                with self._lock:
+                    process = self._workers.pop(pid, None)
+                    # A job sent after its last one was never started: give it to another worker
+                    task = self._forget(pid)
+                    if task is not None:
+                        self._pending.appendleft(task)
+                    if not self._closed:
+                        self._stats['recycled'] += 1
+                if process is not None:
+                    process.join()
+                    if not self._closed:
+                        self._spawn()
+
+            # Workers that died without saying goodbye (killed, segfault in a codec...);
+            # workers that exit cleanly are handled by their 'exit' message
+            with self._lock:
+                dead = [pid for pid, process in self._workers.items()
+                        if not process.is_alive() and process.exitcode != 0]
+            for pid in dead:
+                with self._lock:
+                    process = self._workers.pop(pid)
+                    task = self._forget(pid)
+                    self._stats['crashed'] += 1
+                if task is not None:
+                    self._resolve(task[0], False, f"render worker {pid} died (exit code {process.exitcode})")
+                if not self._closed:
+                    self._spawn()
+
+            with self._lock:
+                if self._closed and not self._workers:
+                    return
+
+    def share_image(self, image):
+        """Copies a decoded image into shared memory, so jobs can use it without pickling it.
+
+        The handle can be passed wherever a job expects an image file (for example in
+        image_files), any number of times, until release_image() is called.
+
+        Args:
+            image (Image): The image.
+
+        Returns:
+            ImageHandle: The handle to pass to jobs.
+        """
+        return self._buffers.put_image(image)
+
+    def release_image(self, handle):
+        """Frees an image shared with share_image(), once no queued job uses it.
+
+        Args:
+            handle (ImageHandle): The handle returned by share_image().
+        """
+        self._buffers.release(handle.buffer)
+
+    def submit(self, method: str, _output_nbytes: int = None, **kwargs) -> Future:
+        """Queues a job.
+
+        The first budgeted job ('create_budgeted_collage') calibrates the render cost
+        model, unless the pool was started with calibrate=True.
+
+        Args:
+            method (str): The CollageGenerator method to call, e.g. 'create_single_collage'.
+            **kwargs: Its keyword arguments. They must be picklable.
+
+        Returns:
+            Future: Resolves to the method's return value, or raises RuntimeError if it failed.
+
+        Raises:
+            RuntimeError: If the pool has been shut down.
+        """
+        if method == 'create_budgeted_collage':
+            self._calibrate()
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The render pool has been shut down")
+            job_id = self._next_id
+            self._next_id += 1
+            self._futures[job_id] = future
+            output_buffer = None
+            if _output_nbytes is not None:
+                output_buffer = self._outputs[job_id] = self._buffers.acquire(_output_nbytes)
+            self._pending.append((job_id, method, kwargs, output_buffer))
+            self._dispatch()
+        return future
+
+    def submit_image(self, method: str, size, mode: str = 'RGB', **kwargs) -> Future:
+        """Queues a job that returns an image, and receives it through shared memory.
+
+        Args:
+            method (str): The CollageGenerator method to call, e.g. 'create_single_collage_frame'.
+            size (Tuple[int, int]): The largest width and height the image can have.
+            mode (str, optional): The mode of the image. Defaults to 'RGB'.
+            **kwargs: Its keyword arguments.
+
+        Returns:
+            Future: Resolves to a SharedImage, which must be released once the image is used.
+        """
+        from shm_transport import image_nbytes
+        return self.submit(method, _output_nbytes=image_nbytes(mode, size), **kwargs)
+
+    def render(self, method: str, timeout: float = None, **kwargs):
+        """Runs a job and waits for its result.
+
+        Args:
+            method (str): The CollageGenerator method to call.
+            timeout (float, optional): The maximum number of seconds to wait. Defaults to None.
+            **kwargs: Its keyword arguments.
+
+        Returns:
+            Any: The method's return value.
+        """
+        return self.submit(method, **kwargs).result(timeout)
+
+    def stats(self) -> dict:
+        """Returns counters for monitoring.
+
+        Returns:
+            dict: Live workers, queued and completed jobs, failures, recycled and crashed
+            workers, and the warm-up time of each worker started so far.
+        """
+        with self._lock:
+            stats = dict(self._stats, warm_up_s=list(self._stats['warm_up_s']))
+            stats.update(workers=len(self._workers), pending=len(self._futures), ready=self._ready.is_set())
+        return stats
+
+    def shutdown(self, timeout: float = 10.0):
+        """Stops the workers after their current job.
+
+        Args:
+            timeout (float, optional): Seconds to wait for each worker before killing it. Defaults to 10.0.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._workers.values())
+            self._pending.clear()
+            for tasks in self._queues.values():
+                tasks.put(None)
+        for process in workers:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        if self._collector is not None:
+            self._collector.join(timeout)
+        with self._lock:
+            futures, self._futures = list(self._futures.values()), {}
+            if self._buffers is not None:
+                self._buffers.close()
+        for future in futures:
+            future.set_exception(RuntimeError("The render pool has been shut down"))
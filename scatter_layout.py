@@ -0,0 +1,157 @@
+"""Randomized scatter layouts for scrapbook-style collages.
+
+Instead of the fixed coordinates of GRID_LAYOUTS, a scatter layout drops tiles at
+random positions and keeps, for each, the first candidate position that overlaps the
+tiles already placed by no more than a given fraction. Placed tiles are indexed in a
+uniform grid of buckets, so a candidate is only compared with the tiles in the
+buckets it touches, and laying out hundreds of photos stays near-linear.
+- rectangles_overlap: Checks whether two rectangles overlap.
+- SpatialGrid: A uniform-grid spatial index of rectangles.
+- scatter_layout: Builds a scatter layout configuration for any number of images.
+"""
+import math
+import random
+from typing import List, Tuple
+
+
+def rectangles_overlap(rect1, rect2):
+    """Checks if two rectangles overlap.
+
+    Args:
+        rect1 (Tuple[int, int, int, int]): The first rectangle (x1, y1, x2, y2).
+        rect2 (Tuple[int, int, int, int]): The second rectangle (x3, y3, x4, y4).
+
+    Returns:
+        bool: True if the rectangles overlap, False otherwise.
+    """
+    x1, y1, x2, y2 = rect1
+    x3, y3, x4, y4 = rect2
+    return not (x2 < x3 or x4 < x1 or y2 < y3 or y4 < y1)
+
+
+def intersection_area(rect1, rect2) -> float:
+    """Computes the area shared by two (x1, y1, x2, y2) rectangles."""
+    width = min(rect1[2], rect2[2]) - max(rect1[0], rect2[0])
+    height = min(rect1[3], rect2[3]) - max(rect1[1], rect2[1])
+    return width * height if width > 0 and height > 0 else 0.0
+
+
+class SpatialGrid:
+    """A uniform grid of buckets indexing (x1, y1, x2, y2) rectangles.
+
+    Each rectangle is stored in every bucket it touches. With buckets about the size
+    of the rectangles, that is a handful of buckets per rectangle and per query.
+
+    Attributes:
+        bucket_size (float): The width and height of a bucket.
+    """
+    def __init__(self, bucket_size: float):
+        """Initializes the SpatialGrid.
+
+        Args:
+            bucket_size (float): The width and height of a bucket.
+        """
+        self.bucket_size = bucket_size
+        self._buckets = {}  # (column, row) -> list of rectangles
+
+    def _cells(self, rect):
+        """Yields the buckets a rectangle touches."""
+        size = self.bucket_size
+        for column in range(math.floor(rect[0] / size), math.floor(rect[2] / size) + 1):
+            for row in range(math.floor(rect[1] / size), math.floor(rect[3] / size) + 1):
+                yield (column, row)
+
+    def insert(self, rect):
+        """Adds a rectangle to the index.
+
+        Args:
+            rect (Tuple[float, float, float, float]): The rectangle (x1, y1, x2, y2).
+        """
+        for cell in self._cells(rect):
+            self._buckets.setdefault(cell, []).append(rect)
+
+    def query(self, rect) -> List[tuple]:
+        """Finds the indexed rectangles overlapping a rectangle.
+
+        Args:
+            rect (Tuple[float, float, float, float]): The rectangle (x1, y1, x2, y2).
+
+        Returns:
+            List[tuple]: The overlapping rectangles, each listed once.
+        """
+        found, seen = [], set()
+        for cell in self._cells(rect):
+            for other in self._buckets.get(cell, ()):
+                if id(other) not in seen and rectangles_overlap(rect, other):
+                    seen.add(id(other))
+                    found.append(other)
+        return found
+
+
+def scatter_layout(n_images: int, dimensions: Tuple[int, int], rotation_range: Tuple[float, float] = (0, 0),
+                   spacing: float = 0.0, max_overlap: float = 0.2, coverage: float = 0.9,
+                   attempts: int = 30, seed=None) -> dict:
+    """Builds a randomized scatter layout.
+
+    Tiles get roughly equal areas (jittered by up to 15%) and a landscape, portrait or
+    square shape, so that together they cover `coverage` of the canvas. Overlap is
+    measured on each tile's box enlarged to contain it at the largest rotation of
+    rotation_range and padded by `spacing`, so rotated tiles respect it too.
+
+    Args:
+        n_images (int): The number of images.
+        dimensions (Tuple[int, int]): The width and height of the collage.
+        rotation_range (Tuple[float, float], optional): The rotation range of the style,
+            in degrees. Defaults to (0, 0).
+        spacing (float, optional): The gap kept around each tile, as a fraction of the
+            shorter canvas side. Defaults to 0.0.
+        max_overlap (float, optional): The largest fraction of a tile that earlier tiles
+            may cover. Defaults to 0.2.
+        coverage (float, optional): The total tile area as a fraction of the canvas. Defaults to 0.9.
+        attempts (int, optional): Candidate positions tried per tile; when none satisfies
+            max_overlap the least covered one is used. Defaults to 30.
+        seed (optional): The random seed, for reproducible layouts. Defaults to None.
+
+    Returns:
+        dict: A layout configuration (name, layout and description), like those of GRID_LAYOUTS.
+    """
+    rng = random.Random(seed)
+    width, height = dimensions
+    side = math.sqrt(coverage * width * height / max(n_images, 1))
+    padding = spacing * min(width, height) / 2
+    angle = math.radians(max(abs(rotation_range[0]), abs(rotation_range[1])))
+    cos, sin = abs(math.cos(angle)), abs(math.sin(angle))
+
+    index = SpatialGrid(bucket_size=side * 1.5)
+    layout = []
+    for _ in range(n_images):
+        aspect = rng.choice((4 / 3, 3 / 4, 1.0))
+        scale = rng.uniform(0.85, 1.15)
+        w = min(side * scale * math.sqrt(aspect), width)
+        h = min(side * scale / math.sqrt(aspect), height)
+        # Half-size of the box holding the rotated, padded tile
+        half_w = (w * cos + h * sin) / 2 + padding
+        half_h = (w * sin + h * cos) / 2 + padding
+        area = 4 * half_w * half_h
+
+        best = None
+        for _ in range(attempts):
+            x = rng.uniform(0, width - w)
+            y = rng.uniform(0, height - h)
+            center_x, center_y = x + w / 2, y + h / 2
+            box = (center_x - half_w, center_y - half_h, center_x + half_w, center_y + half_h)
+            covered = sum(intersection_area(box, other) for other in index.query(box)) / area
+            if best is None or covered < best[0]:
+                best = (covered, x, y, box)
+            if covered <= max_overlap:
+                break
+
+        _, x, y, box = best
+        index.insert(box)
+        layout.append((x / width, y / height, w / width, h / height))
+
+    return {
+        "name": "Scatter",
+        "layout": layout,
+        "description": f"{n_images} images scattered with limited overlap",
+    }
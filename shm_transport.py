@@ -0,0 +1,314 @@
+"""Shared-memory transport of images between render processes.
+
+Pickling a Pillow image copies its pixels into the pickle, through a pipe and into a
+new image on the other side. This file instead places the pixels in a
+multiprocessing.shared_memory buffer once and sends only a small handle; the
+receiving process maps the same buffer and wraps it without copying.
+- ImageHandle: The picklable description of an image stored in a shared buffer.
+- SharedBufferPool: Owns the shared buffers of one process and recycles them.
+- SharedImage: An image received through the pool, released back to it when done.
+- write_image / read_image: Store and load an image given its handle, from any process.
+"""
+import sys
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Tuple
+
+from PIL import Image
+
+# Buffers are allocated in multiples of this, so similar sizes can reuse each other
+BUFFER_GRANULARITY = 1024 * 1024
+
+# Modes Pillow can wrap around a buffer without copying, and their bytes per pixel
+ZERO_COPY_MODES = {'L': 1, 'P': 1, 'RGBA': 4, 'RGBX': 4, 'CMYK': 4, 'I': 4, 'F': 4}
+BYTES_PER_PIXEL = dict(ZERO_COPY_MODES, RGB=3, LA=2)
+
+# Buffers created by this process' pools, and buffers attached from other processes
+# (most recently used last, at most MAX_ATTACHED), by name
+_owned = {}
+_attached = OrderedDict()
+MAX_ATTACHED = 32
+
+
+class ImageHandle(NamedTuple):
+    """An image stored in a shared buffer.
+
+    Attributes:
+        buffer (str): The name of the shared memory buffer.
+        mode (str): The Pillow mode of the image.
+        size (Tuple[int, int]): The width and height of the image.
+    """
+    buffer: str
+    mode: str
+    size: Tuple[int, int]
+
+    @property
+    def nbytes(self) -> int:
+        """The number of bytes of pixel data."""
+        return image_nbytes(self.mode, self.size)
+
+
+def image_nbytes(mode: str, size: Tuple[int, int]) -> int:
+    """Computes the raw size of an image.
+
+    Args:
+        mode (str): The Pillow mode of the image.
+        size (Tuple[int, int]): The width and height of the image.
+
+    Returns:
+        int: The number of bytes of pixel data.
+
+    Raises:
+        ValueError: If the mode cannot be transported.
+    """
+    if mode not in BYTES_PER_PIXEL:
+        raise ValueError(f"Cannot transport images of mode {mode}")
+    return BYTES_PER_PIXEL[mode] * size[0] * size[1]
+
+
+def attach(name: str):
+    """Maps a shared buffer created by another process.
+
+    Mappings are cached, so a recycled buffer is only mapped once per process. The
+    owner of the buffer, not this process, is responsible for unlinking it; on Python
+    versions before 3.13 this requires this process to have been started by
+    multiprocessing from the owner (or one of its children).
+
+    Args:
+        name (str): The name of the buffer.
+
+    Returns:
+        SharedMemory: The mapped buffer.
+    """
+    from multiprocessing import shared_memory
+
+    if name in _owned:
+        return _owned[name]
+    if name in _attached:
+        _attached.move_to_end(name)
+        return _attached[name]
+
+    if sys.version_info >= (3, 13):
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    else:
+        # Processes started by multiprocessing share their parent's resource tracker,
+        # where the owner already registered the buffer, so this registration is a no-op
+        shm = shared_memory.SharedMemory(name=name)
+
+    _attached[name] = shm
+    while len(_attached) > MAX_ATTACHED:
+        _, oldest = _attached.popitem(last=False)
+        try:
+            oldest.close()
+        except BufferError:
+            # An image still wraps it; the mapping is freed when that image is
+            pass
+    return shm
+
+
+def write_image(image: Image, buffer: str) -> ImageHandle:
+    """Copies an image into a shared buffer.
+
+    Args:
+        image (Image): The image. Modes other than those in BYTES_PER_PIXEL are converted to RGBA.
+        buffer (str): The name of a buffer at least image_nbytes(mode, size) long.
+
+    Returns:
+        ImageHandle: The handle to send to the reading process.
+
+    Raises:
+        ValueError: If the buffer is too small.
+    """
+    if image.mode not in BYTES_PER_PIXEL:
+        image = image.convert('RGBA')
+    handle = ImageHandle(buffer, image.mode, image.size)
+    shm = attach(buffer)
+    if shm.size < handle.nbytes:
+        raise ValueError(f"Shared buffer {buffer} is too small for a {image.mode} {image.size} image")
+    shm.buf[:handle.nbytes] = image.tobytes()
+    return handle
+
+
+def read_image(handle: ImageHandle, copy: bool = False) -> Image:
+    """Loads an image from a shared buffer.
+
+    Without copy, modes in ZERO_COPY_MODES are wrapped around the buffer itself. Such
+    an image is read-only (Pillow copies it on the first modification) and is only
+    valid until the buffer is reused.
+
+    Args:
+        handle (ImageHandle): The handle returned by write_image.
+        copy (bool, optional): Whether to return an independent copy. Defaults to False.
+
+    Returns:
+        Image: The image.
+    """
+    view = attach(handle.buffer).buf[:handle.nbytes]
+    if copy or handle.mode not in ZERO_COPY_MODES:
+        return Image.frombytes(handle.mode, handle.size, bytes(view))
+    return Image.frombuffer(handle.mode, handle.size, view, 'raw', handle.mode, 0, 1)
+
+
+def resolve_images(value):
+    """Replaces ImageHandles in job arguments with the images they refer to.
+
+    Args:
+        value: An ImageHandle, or a list/tuple that may contain some.
+
+    Returns:
+        The value with every ImageHandle replaced by a (read-only) Image.
+    """
+    if isinstance(value, ImageHandle):
+        return read_image(value)
+    if isinstance(value, list):
+        return [resolve_images(item) for item in value]
+    return value
+
+
+class SharedBufferPool:
+    """The shared buffers owned by one process.
+
+    Released buffers are kept (up to max_idle of them) and handed out again for any
+    request that fits, so steady-state rendering creates no new shared memory. All
+    buffers are unlinked by close(). The pool can be shared between threads.
+
+    Attributes:
+        max_idle (int): The number of released buffers kept for reuse.
+    """
+    def __init__(self, max_idle: int = 8):
+        """Initializes the SharedBufferPool.
+
+        Args:
+            max_idle (int, optional): The number of released buffers kept for reuse. Defaults to 8.
+        """
+        self.max_idle = max_idle
+        self._buffers = {}  # name -> SharedMemory, every buffer owned
+        self._idle = []     # names of released buffers
+        self._stats = {'created': 0, 'reused': 0}
+        self._lock = threading.Lock()
+
+    def acquire(self, nbytes: int) -> str:
+        """Hands out a buffer of at least nbytes.
+
+        Args:
+            nbytes (int): The required size.
+
+        Returns:
+            str: The name of the buffer.
+        """
+        from multiprocessing import shared_memory
+
+        with self._lock:
+            fitting = [name for name in self._idle if self._buffers[name].size >= nbytes]
+            if fitting:
+                name = min(fitting, key=lambda name: self._buffers[name].size)
+                self._idle.remove(name)
+                self._stats['reused'] += 1
+                return name
+
+            size = -(-max(nbytes, 1) // BUFFER_GRANULARITY) * BUFFER_GRANULARITY
+            shm = shared_memory.SharedMemory(create=True, size=size)
+            self._buffers[shm.name] = shm
+            _owned[shm.name] = shm
+            self._stats['created'] += 1
+            return shm.name
+
+    def release(self, name: str):
+        """Returns a buffer to the pool, freeing it if enough buffers are idle.
+
+        Args:
+            name (str): The name returned by acquire.
+        """
+        with self._lock:
+            if name not in self._buffers or name in self._idle:
+                return
+            self._idle.append(name)
+            while len(self._idle) > self.max_idle:
+                # Drop the smallest, which are the least likely to fit later requests
+                smallest = min(self._idle, key=lambda name: self._buffers[name].size)
+                self._idle.remove(smallest)
+                self._free(smallest)
+
+    def _free(self, name: str):
+        """Unlinks a buffer."""
+        shm = self._buffers.pop(name)
+        _owned.pop(name, None)
+        try:
+            shm.close()
+        except BufferError:
+            pass
+        shm.unlink()
+
+    def put_image(self, image: Image) -> ImageHandle:
+        """Copies an image into a pooled buffer, for another process to read.
+
+        The buffer stays allocated until release(handle.buffer) is called.
+
+        Args:
+            image (Image): The image.
+
+        Returns:
+            ImageHandle: The handle to send.
+        """
+        mode = image.mode if image.mode in BYTES_PER_PIXEL else 'RGBA'
+        return write_image(image, self.acquire(image_nbytes(mode, image.size)))
+
+    def stats(self) -> dict:
+        """Returns counters for monitoring.
+
+        Returns:
+            dict: The buffers created and reused, and the owned, idle and total bytes.
+        """
+        with self._lock:
+            return dict(self._stats, buffers=len(self._buffers), idle=len(self._idle),
+                        bytes=sum(shm.size for shm in self._buffers.values()))
+
+    def close(self):
+        """Unlinks every buffer owned by the pool."""
+        with self._lock:
+            for name in list(self._buffers):
+                self._free(name)
+            self._idle = []
+
+
+class SharedImage:
+    """An image received from another process through a SharedBufferPool.
+
+    Use it as a context manager, or call release() once the image is no longer
+    needed; the buffer is then reused for a later image.
+
+    Attributes:
+        handle (ImageHandle): Where the image is stored.
+    """
+    def __init__(self, handle: ImageHandle, pool: SharedBufferPool):
+        """Initializes the SharedImage.
+
+        Args:
+            handle (ImageHandle): Where the image is stored.
+            pool (SharedBufferPool): The pool owning the buffer.
+        """
+        self.handle = handle
+        self._pool = pool
+
+    def image(self, copy: bool = False) -> Image:
+        """Returns the image (see read_image).
+
+        Args:
+            copy (bool, optional): Whether to return a copy that outlives release(). Defaults to False.
+
+        Returns:
+            Image: The image.
+        """
+        return read_image(self.handle, copy)
+
+    def release(self):
+        """Returns the buffer to the pool."""
+        if self._pool is not None:
+            self._pool.release(self.handle.buffer)
+            self._pool = None
+
+    def __enter__(self) -> Image:
+        return self.image()
+
+    def __exit__(self, *exc_info):
+        self.release()
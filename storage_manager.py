@@ -0,0 +1,306 @@
+"""Size- and age-bounded storage for the files the web service writes.
+
+Each storage class (uploads, collages, ...) is a directory with a budget: a
+number of bytes, a number of files and a time to live since last access. A
+background thread sweeps the directories periodically. It deletes entries that
+have not been accessed within their TTL, then evicts the least recently accessed
+entries until each class is back under EVICTION_TARGET of its budget. Requests
+never wait for a sweep. An entry is a file together with the files derived from
+it: a collage, its HTML page and the page's "<name>_assets/" directory are
+evicted together.
+
+Last access is the file's atime, which touch() refreshes when a file is served.
+Filesystems mounted with relatime (the Linux default) only update atime about
+once a day on their own. Being stored on disk, it is shared by every process
+serving the directory, and it survives restarts.
+- StorageBudget: The directory and limits of a storage class.
+- entry_key: The entry a file belongs to.
+- StorageManager: Tracks usage, evicts entries and runs the background sweeper.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+# Sweeps bring a class down to this fraction of its budget, so that the next few
+# writes do not trigger another eviction right away
+EVICTION_TARGET = 0.9
+
+# Entries written this recently are never evicted, so a render's inputs and outputs
+# are not deleted while the request that uses them is running
+MIN_ENTRY_AGE = 60
+
+# touch() only rewrites a file's atime once per interval, in seconds
+TOUCH_INTERVAL = 60
+
+ASSETS_SUFFIX = '_assets'
+
+
+class StorageBudget(NamedTuple):
+    """The directory and limits of a storage class; None leaves a limit unset."""
+    directory: str
+    max_bytes: Optional[int] = None
+    max_files: Optional[int] = None
+    ttl: Optional[float] = None  # Seconds since last access
+
+
+def entry_key(root: str, path: str) -> str:
+    """Returns the entry a file belongs to.
+
+    The entry of a file is its path without its extension, relative to the root of
+    its class, so a collage and its HTML page share an entry. Files inside a
+    "<name>_assets" directory belong to the entry "<name>".
+
+    Args:
+        root (str): The directory of the storage class.
+        path (str): The path of the file.
+
+    Returns:
+        str: The entry key.
+    """
+    parts = os.path.relpath(path, root).split(os.sep)
+    for i, part in enumerate(parts[:-1]):
+        if part.endswith(ASSETS_SUFFIX):
+            return os.path.join(*parts[:i], part[:-len(ASSETS_SUFFIX)])
+    return os.path.splitext(os.path.join(*parts))[0]
+
+
+class _Entry:
+    """The files of one entry, their total size and their latest access and modification."""
+    __slots__ = ('files', 'bytes', 'accessed', 'modified')
+
+    def __init__(self):
+        self.files: List[str] = []
+        self.bytes = 0
+        self.accessed = 0.0
+        self.modified = 0.0
+
+
+class StorageManager:
+    """Keeps storage classes within their budgets with a background sweeper.
+
+    Example:
+        storage = StorageManager({'uploads': StorageBudget('uploads', max_bytes=2**30, ttl=86400)}).start()
+        storage.touch(path)       # when a file is read
+        storage.record('uploads', nbytes)  # when a file is written
+    """
+    def __init__(self, budgets: Dict[str, StorageBudget], interval: float = 300,
+                 min_age: float = MIN_ENTRY_AGE):
+        """Initializes the StorageManager.
+
+        Args:
+            budgets (Dict[str, StorageBudget]): The budget of each storage class, by name.
+            interval (float, optional): The seconds between sweeps. Defaults to 300.
+            min_age (float, optional): The seconds after being written during which an entry
+                is never evicted. Defaults to MIN_ENTRY_AGE.
+        """
+        self.budgets = budgets
+        self.interval = interval
+        self.min_age = min_age
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._usage = {name: {'files': 0, 'bytes': 0, 'entries': 0, 'oldest_access_s': None}
+                       for name in budgets}
+        self._counters = {name: {'expired_entries': 0, 'evicted_entries': 0, 'deleted_files': 0,
+                                 'deleted_bytes': 0, 'errors': 0}
+                          for name in budgets}
+        self._sweeps = {'sweeps': 0, 'last_sweep_at': None, 'last_sweep_s': None}
+
+    def start(self) -> 'StorageManager':
+        """Starts the background sweeper; the first sweep runs right away.
+
+        Returns:
+            StorageManager: The manager itself.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='storage-sweeper', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 10.0):
+        """Stops the background sweeper, waiting for a running sweep to finish.
+
+        Args:
+            timeout (float, optional): The most seconds to wait. Defaults to 10.
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        """Sweeps every interval, or sooner when a class is reported over budget."""
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Storage sweep failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def touch(self, path: str):
+        """Records that a file was accessed, by refreshing its atime.
+
+        Args:
+            path (str): The path of the file; missing files are ignored.
+        """
+        if not path:
+            return
+        now = time.time()
+        try:
+            stat = os.stat(path)
+            if now - stat.st_atime >= TOUCH_INTERVAL:
+                os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+        except OSError:
+            pass
+
+    def record(self, name: str, nbytes: int, files: int = 1):
+        """Records files written to a storage class, waking the sweeper if the class is now over budget.
+
+        Args:
+            name (str): The storage class.
+            nbytes (int): The bytes written.
+            files (int, optional): The files written. Defaults to 1.
+        """
+        budget = self.budgets[name]
+        with self._lock:
+            usage = self._usage[name]
+            usage['bytes'] += nbytes
+            usage['files'] += files
+            over = ((budget.max_bytes is not None and usage['bytes'] > budget.max_bytes)
+                    or (budget.max_files is not None and usage['files'] > budget.max_files))
+        if over:
+            self._wake.set()
+
+    def _scan(self, root: str) -> Dict[str, _Entry]:
+        """Lists the entries of a directory with their files, size and last access."""
+        entries = {}
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # Deleted since it was listed
+                entry = entries.setdefault(entry_key(root, path), _Entry())
+                entry.files.append(path)
+                entry.bytes += stat.st_size
+                entry.accessed = max(entry.accessed, stat.st_atime, stat.st_mtime)
+                entry.modified = max(entry.modified, stat.st_mtime)
+        return entries
+
+    def _delete(self, root: str, entry: _Entry) -> int:
+        """Deletes the files of an entry and the directories it leaves empty; returns the errors."""
+        errors = 0
+        directories = set()
+        for path in entry.files:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                errors += 1
+            directories.add(os.path.dirname(path))
+        # Remove emptied asset and shard directories, deepest first, up to the root
+        root = os.path.abspath(root)
+        for directory in sorted(directories, key=len, reverse=True):
+            directory = os.path.abspath(directory)
+            while directory != root and directory.startswith(root + os.sep):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+                directory = os.path.dirname(directory)
+        return errors
+
+    def sweep_class(self, name: str) -> dict:
+        """Applies the TTL and the budgets of one storage class.
+
+        Args:
+            name (str): The storage class.
+
+        Returns:
+            dict: The usage of the class after the sweep.
+        """
+        budget = self.budgets[name]
+        if not os.path.isdir(budget.directory):
+            return dict(self._usage[name])
+        now = time.time()
+        entries = self._scan(budget.directory)
+        counters = {'expired_entries': 0, 'evicted_entries': 0, 'deleted_files': 0, 'deleted_bytes': 0, 'errors': 0}
+
+        def evict(key, counter):
+            entry = entries.pop(key)
+            counters['errors'] += self._delete(budget.directory, entry)
+            counters[counter] += 1
+            counters['deleted_files'] += len(entry.files)
+            counters['deleted_bytes'] += entry.bytes
+
+        # Least recently accessed first; entries being written are left alone
+        candidates = sorted((key for key, entry in entries.items() if now - entry.modified >= self.min_age),
+                            key=lambda key: entries[key].accessed)
+        if budget.ttl is not None:
+            for key in candidates:
+                if now - entries[key].accessed > budget.ttl:
+                    evict(key, 'expired_entries')
+        total_bytes = sum(entry.bytes for entry in entries.values())
+        total_files = sum(len(entry.files) for entry in entries.values())
+        over_bytes = budget.max_bytes is not None and total_bytes > budget.max_bytes
+        over_files = budget.max_files is not None and total_files > budget.max_files
+        if over_bytes or over_files:
+            target_bytes = budget.max_bytes * EVICTION_TARGET if budget.max_bytes is not None else None
+            target_files = budget.max_files * EVICTION_TARGET if budget.max_files is not None else None
+            for key in candidates:
+                if key not in entries:
+                    continue
+                if ((target_bytes is None or total_bytes <= target_bytes)
+                        and (target_files is None or total_files <= target_files)):
+                    break
+                total_bytes -= entries[key].bytes
+                total_files -= len(entries[key].files)
+                evict(key, 'evicted_entries')
+
+        oldest = min((entry.accessed for entry in entries.values()), default=None)
+        usage = {'files': total_files, 'bytes': total_bytes, 'entries': len(entries),
+                 'oldest_access_s': round(now - oldest) if oldest is not None else None}
+        with self._lock:
+            self._usage[name] = usage
+            for counter, value in counters.items():
+                self._counters[name][counter] += value
+        if counters['deleted_files']:
+            print(f"Storage '{name}': expired {counters['expired_entries']} and evicted "
+                  f"{counters['evicted_entries']} entries, freeing {counters['deleted_bytes'] / 2**20:.1f} MB")
+        return usage
+
+    def sweep(self) -> dict:
+        """Sweeps every storage class once.
+
+        Returns:
+            dict: The usage of each class after the sweep.
+        """
+        start = time.perf_counter()
+        usage = {name: self.sweep_class(name) for name in self.budgets}
+        with self._lock:
+            self._sweeps['sweeps'] += 1
+            self._sweeps['last_sweep_at'] = time.time()
+            self._sweeps['last_sweep_s'] = round(time.perf_counter() - start, 3)
+        return usage
+
+    def stats(self) -> dict:
+        """Reports the usage, budgets and eviction counters of each class.
+
+        Usage is measured by the last sweep plus the writes recorded since.
+
+        Returns:
+            dict: The sweep counters, and per class its 'usage', 'budget' and 'evictions'.
+        """
+        with self._lock:
+            classes = {name: {'usage': dict(self._usage[name]),
+                              'budget': {'max_bytes': budget.max_bytes, 'max_files': budget.max_files,
+                                         'ttl_s': budget.ttl},
+                              'evictions': dict(self._counters[name])}
+                       for name, budget in self.budgets.items()}
+            return dict(self._sweeps, classes=classes)
@@ -0,0 +1,70 @@
+"""Shared fixtures of the test suite.
+
+The modules of the collage generator live at the root of the repository, so the
+root is put on sys.path for the tests to import them as the scripts do. The render
+cost model is calibrated into a temporary file rather than the user's cache.
+- make_image: Draws a deterministic, detailed RGB(A) test image.
+- image_files: Writes a few JPEG and PNG test images into a temporary directory.
+- generator: A CollageGenerator writing into a temporary directory.
+"""
+import os
+import random
+import sys
+import tempfile
+
+import pytest
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('COLLAGE_CALIBRATION_FILE',
+                      os.path.join(tempfile.gettempdir(), 'collage-maker-tests', 'render_calibration.json'))
+
+
+def make_image(size, seed: int = 0, mode: str = 'RGB') -> Image.Image:
+    """Draws a deterministic test image: a gradient under random rectangles and lines.
+
+    Args:
+        size (Tuple[int, int]): The width and height.
+        seed (int, optional): Selects the shapes and colors. Defaults to 0.
+        mode (str, optional): 'RGB', or 'RGBA' for a partly transparent image. Defaults to 'RGB'.
+
+    Returns:
+        Image: The image.
+    """
+    rng = random.Random(seed)
+    width, height = size
+    image = Image.linear_gradient('L').resize(size).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(width), rng.randrange(height)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.rectangle([x, y, x + rng.randrange(1, width // 3 + 2), y + rng.randrange(1, height // 3 + 2)], fill=color)
+        draw.line([rng.randrange(width), rng.randrange(height), rng.randrange(width), rng.randrange(height)],
+                  fill=color, width=3)
+    if mode == 'RGBA':
+        image = image.convert('RGBA')
+        mask = Image.new('L', size, 255)
+        ImageDraw.Draw(mask).ellipse([0, 0, width // 2, height // 2], fill=0)
+        image.putalpha(mask)
+    return image
+
+
+@pytest.fixture
+def image_files(tmp_path):
+    """Four JPEGs of different sizes and aspect ratios, and one transparent PNG."""
+    paths = []
+    for i, size in enumerate([(1200, 800), (800, 1200), (900, 900), (1600, 900)]):
+        path = tmp_path / f"photo{i}.jpg"
+        make_image(size, seed=i).save(path, quality=90)
+        paths.append(str(path))
+    path = tmp_path / "cutout.png"
+    make_image((600, 600), seed=9, mode='RGBA').save(path)
+    paths.append(str(path))
+    return paths
+
+
+@pytest.fixture
+def generator(tmp_path):
+    """A CollageGenerator writing into tmp_path/collages."""
+    from image_collage_maker import CollageGenerator
+    return CollageGenerator(images_dir=None, output_dir=str(tmp_path / 'collages'))
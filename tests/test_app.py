@@ -0,0 +1,97 @@
+"""Tests of the Flask app, rendering in the request thread."""
+import time
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import app as app_module
+from conftest import make_image
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'RENDER_WORKERS', 0)
+    monkeypatch.setitem(app_module.app.config, 'DEFAULT_DIMENSIONS', (600, 600))
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    monkeypatch.setitem(app_module.app.config, 'COLLAGE_FOLDER', str(tmp_path / 'collages'))
+    return app_module.app.test_client()
+
+
+def jpeg(size, seed=0) -> BytesIO:
+    buffer = BytesIO()
+    make_image(size, seed).save(buffer, format='JPEG', quality=85)
+    buffer.seek(0)
+    return buffer
+
+
+def test_collage_streams_the_rendered_image(client):
+    files = [(jpeg((800, 600), i), f'{i}.jpg') for i in range(4)]
+    response = client.post('/collage', data={'files': files, 'style': 'minimal', 'format': 'jpeg'})
+    assert response.status_code == 200 and response.mimetype == 'image/jpeg'
+    assert Image.open(BytesIO(response.data)).size == (600, 600)
+
+
+def test_collage_rejects_corrupt_uploads(client):
+    data = jpeg((800, 600)).getvalue()
+    truncated = BytesIO(data[:len(data) // 2])
+    response = client.post('/collage', data={'files': [(jpeg((800, 600)), 'good.jpg'), (truncated, 'bad.jpg')]})
+    assert response.status_code == 400
+    assert 'bad.jpg' in response.get_json()['error']
+
+
+def test_collage_decodes_each_upload_for_its_cell(client, monkeypatch):
+    captured = {}
+    monkeypatch.setattr(app_module, 'stream_collage',
+                        lambda pool, images, job, output_format: captured.update(images=images, job=job) or '')
+    files = [(jpeg((3200, 2400), i), f'{i}.jpg') for i in range(4)]
+    client.post('/collage', data={'files': files, 'style': 'minimal'})
+    # Four tiles on a 600px canvas need far less than the canvas size times the reducing gap
+    assert all(image.width <= 1600 for image in captured['images'])
+    assert captured['job']['seed'] is not None
+
+
+def test_immutable_url_is_not_cached_longer_than_the_file_is_kept(client, tmp_path, monkeypatch):
+    from http_cache import file_version
+    from storage_manager import StorageManager
+    monkeypatch.setattr(app_module, 'get_storage', lambda: StorageManager({}))
+    monkeypatch.setitem(app_module.app.config, 'COLLAGES_TTL_HOURS', 24)
+    (tmp_path / 'collages').mkdir()
+    path = tmp_path / 'collages' / 'collage.jpg'
+    path.write_bytes(jpeg((64, 64)).getvalue())
+
+    response = client.get(f'/c/{file_version(str(path))}/collage.jpg')
+    assert response.status_code == 200 and response.cache_control.immutable
+    # The sweeper deletes files unused for the TTL; serving the file restarted that clock
+    assert response.cache_control.max_age <= 24 * 3600
+
+
+def saved(tmp_path, count=4):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f'{i}.jpg'
+        path.write_bytes(jpeg((800, 600), i).getvalue())
+        paths.append(str(path))
+    return paths
+
+
+def test_generate_collage_rejects_unknown_styles(client, tmp_path):
+    response = client.post('/generate_collage', json={'filepaths': saved(tmp_path), 'style': 'no-such-style'})
+    assert response.status_code == 400
+    assert 'no-such-style' in response.get_json()['error']
+
+
+def test_reused_collages_are_not_counted_twice(client, tmp_path, monkeypatch):
+    from storage_manager import StorageManager
+    storage = StorageManager({})
+    monkeypatch.setattr(app_module, 'get_storage', lambda: storage)
+    recorded = []
+    monkeypatch.setattr(storage, 'record', lambda name, nbytes, files=1: recorded.append(name))
+    request = {'filepaths': saved(tmp_path), 'style': 'minimal', 'seed': 3, 'reuse': True}
+
+    first = client.post('/generate_collage', json=request)
+    assert first.status_code == 200 and recorded == ['collages']
+    time.sleep(1.1)  # Past the slack given to whole-second mtimes
+    second = client.post('/generate_collage', json=request)
+    assert second.get_json()['collage_url'] == first.get_json()['collage_url']
+    assert recorded == ['collages']
@@ -0,0 +1,77 @@
+"""Tests of checkpoint: content keys and resuming from the durable store."""
+import shutil
+
+import cli
+from checkpoint import CheckpointStore, collage_key, content_key
+
+
+def test_content_key_follows_the_content(image_files, tmp_path):
+    copy = tmp_path / 'renamed.jpg'
+    shutil.copy(image_files[0], copy)
+    assert content_key(str(copy)) == content_key(image_files[0]) != content_key(image_files[1])
+    assert content_key('https://example.com/a.jpg').startswith('url:')
+
+
+def test_collage_key_depends_on_images_and_settings():
+    key = collage_key(['a', 'b'], dimension=(800, 600), style='modern')
+    assert key == collage_key(['a', 'b'], style='modern', dimension=[800, 600])
+    assert key != collage_key(['b', 'a'], dimension=(800, 600), style='modern')
+    assert key != collage_key(['a', 'b'], dimension=(800, 600), style='vintage')
+
+
+def test_store_survives_reopening(image_files, tmp_path):
+    path = str(tmp_path / 'run.db')
+    store = CheckpointStore(path)
+    keys = [store.image_key(image) for image in image_files[:2]]
+    store.record_collage('collage-1', 'out/1.png', keys, image_files[:2])
+    store.close()
+
+    store = CheckpointStore(path)
+    assert store.used_image_keys() == set(keys)
+    assert store.find_collage('collage-1') == 'out/1.png'
+    assert store.find_collage('collage-2') is None
+    store.close()
+
+
+def test_image_key_notices_changed_files(image_files, tmp_path):
+    store = CheckpointStore(str(tmp_path / 'run.db'))
+    path = tmp_path / 'changing.jpg'
+    shutil.copy(image_files[0], path)
+    first = store.image_key(str(path))
+    assert store.image_key(str(path)) == first
+    shutil.copy(image_files[1], path)
+    assert store.image_key(str(path)) == content_key(image_files[1])
+    store.close()
+
+
+def test_generator_resumes_with_unused_images(image_files, tmp_path):
+    from image_collage_maker import CollageGenerator
+    path = str(tmp_path / 'run.db')
+    generator = CollageGenerator(images_dir=None, output_dir=str(tmp_path / 'out'), checkpoint=path)
+    generator.mark_images_used(image_files[:2], 'out/1.png')
+    generator.checkpoint.close()
+
+    resumed = CollageGenerator(images_dir=None, output_dir=str(tmp_path / 'out'), checkpoint=path)
+    assert [resumed.is_image_used(image) for image in image_files[:3]] == [True, True, False]
+    resumed.checkpoint.close()
+
+
+def test_batch_rerun_skips_finished_collages(image_files, tmp_path, capsys):
+    argv = ['batch', *image_files[:4], '--per-collage', '2', '--no-html', '--dimension', '300x300',
+            '-o', str(tmp_path / 'out'), '--checkpoint', str(tmp_path / 'run.db')]
+    assert cli.main(argv) == 0
+    assert 'Rendered 2/2' in capsys.readouterr().out
+    assert cli.main(argv) == 0
+    assert 'Resuming: 2 of 2 collages already finished' in capsys.readouterr().out
+
+
+def test_batch_rerun_with_changed_options_renders_again(image_files, tmp_path, capsys):
+    argv = ['batch', *image_files[:4], '--per-collage', '2', '--no-html', '--dimension', '300x300',
+            '-o', str(tmp_path / 'out'), '--checkpoint', str(tmp_path / 'run.db')]
+    assert cli.main(argv) == 0
+    capsys.readouterr()
+    for changed in ([*argv, '--title', 'Holidays'], [*argv, '--quality', 'fast'],
+                    [arg for arg in argv if arg != '--no-html']):
+        assert cli.main(changed) == 0
+        output = capsys.readouterr().out
+        assert 'Resuming' not in output and 'Rendered 2/2' in output
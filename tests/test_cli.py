@@ -0,0 +1,78 @@
+"""Tests of the batch command-line interface: inputs, manifests and end-to-end runs."""
+import argparse
+import json
+
+import pytest
+
+import cli
+from config import DIMENSIONS
+
+
+def test_parse_dimension():
+    assert cli.parse_dimension('square') == DIMENSIONS['Square']
+    assert cli.parse_dimension('640x480') == (640, 480)
+    for value in ('huge', '0x10', '10x'):
+        with pytest.raises(argparse.ArgumentTypeError):
+            cli.parse_dimension(value)
+
+
+def test_expand_input(image_files, tmp_path):
+    (tmp_path / 'notes.txt').write_text('not an image')
+    assert cli.expand_input(str(tmp_path)) == sorted(image_files)
+    assert cli.expand_input(str(tmp_path / 'photo*.jpg')) == sorted(image_files[:4])
+    assert cli.expand_input('https://example.com/a.jpg') == ['https://example.com/a.jpg']
+    with pytest.raises(FileNotFoundError):
+        cli.expand_input(str(tmp_path / 'missing*.jpg'))
+
+
+def test_json_manifest(tmp_path):
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text(json.dumps({'collages': [
+        'loose.jpg',
+        {'images': ['a.jpg', '/abs/b.jpg'], 'style': 'minimal', 'unknown': 1},
+    ]}))
+    jobs, loose = cli.load_manifest(str(manifest))
+    assert jobs == [{'style': 'minimal', 'images': [str(tmp_path / 'a.jpg'), '/abs/b.jpg']}]
+    assert loose == [str(tmp_path / 'loose.jpg')]
+
+    manifest.write_text(json.dumps([{'style': 'minimal'}]))
+    with pytest.raises(ValueError):
+        cli.load_manifest(str(manifest))
+
+
+def test_csv_manifest_groups_rows(tmp_path):
+    manifest = tmp_path / 'manifest.csv'
+    manifest.write_text('image,collage,style\n'
+                        'a.jpg,1,vintage\n'
+                        'b.jpg,1,\n'
+                        'c.jpg,,\n'
+                        'd.jpg,2,\n')
+    jobs, loose = cli.load_manifest(str(manifest))
+    assert jobs == [{'style': 'vintage', 'images': [str(tmp_path / 'a.jpg'), str(tmp_path / 'b.jpg')]},
+                    {'images': [str(tmp_path / 'd.jpg')]}]
+    assert loose == [str(tmp_path / 'c.jpg')]
+
+
+def test_collect_jobs_splits_loose_images(image_files):
+    jobs = cli.collect_jobs(image_files, per_collage=2)
+    assert [job['images'] for job in jobs] == [image_files[0:2], image_files[2:4], image_files[4:]]
+    assert len(cli.collect_jobs(image_files)) == 1
+
+
+def test_batch_renders_every_collage(image_files, tmp_path, capsys):
+    output_dir = tmp_path / 'out'
+    code = cli.main(['batch', *image_files[:4], '--per-collage', '2', '--jobs', '2', '--no-html', '--style', 'minimal',
+                     '--dimension', '400x300', '-o', str(output_dir)])
+    assert code == 0
+    assert 'Rendered 2/2 collages' in capsys.readouterr().out
+    assert len([path for path in output_dir.rglob('collage_*') if path.is_file()]) == 2
+
+
+
+def test_mosaic_without_readable_images_is_a_usage_error(tmp_path, capsys):
+    broken = tmp_path / 'broken.jpg'
+    broken.write_bytes(b'not an image')
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main(['mosaic', str(broken), '--atlas', str(tmp_path / 'atlas'), '-o', str(tmp_path / 'out')])
+    assert exit_info.value.code == 2
+    assert 'no readable tile images' in capsys.readouterr().err
@@ -0,0 +1,77 @@
+"""Tests of compositor: batched NumPy compositing, pixel-identical to Pillow's paste."""
+import random
+
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+
+from conftest import make_image
+from config import STYLE_PRESETS
+
+np = pytest.importorskip('numpy')
+from compositor import batch_tiles, composite_tiles  # noqa: E402
+
+
+def pasted(canvas, tiles):
+    """The canvas with the tiles pasted one by one, as render_tiles does without NumPy."""
+    canvas = canvas.copy()
+    for tile, position in tiles:
+        canvas.paste(tile, position, tile if tile.mode == 'RGBA' else None)
+    return canvas
+
+
+def soft_tile(size, seed):
+    """An RGBA tile with opaque, transparent and partly transparent pixels."""
+    tile = make_image(size, seed, 'RGBA')
+    alpha = Image.linear_gradient('L').resize(size)
+    ImageDraw.Draw(alpha).rectangle([size[0] // 4, size[1] // 4, size[0] // 2, size[1] // 2], fill=255)
+    tile.putalpha(ImageChops.multiply(alpha, tile.getchannel('A')))
+    return tile
+
+
+def assert_identical(canvas, tiles):
+    expected = pasted(canvas, tiles)
+    composite_tiles(canvas, tiles)
+    assert ImageChops.difference(canvas, expected).getbbox() is None
+
+
+def test_batches_split_before_an_overlapping_tile():
+    boxes = [(0, 0, 10, 10), (10, 0, 20, 10), (0, 10, 10, 20), (5, 5, 15, 15), (20, 20, 30, 30), (0, 0, 0, 0)]
+    assert batch_tiles(boxes) == [[0, 1, 2], [3, 4, 5]]
+    assert batch_tiles([]) == []
+
+
+def test_grid_of_opaque_and_alpha_tiles_matches_paste():
+    canvas = make_image((400, 300), seed=1, mode='RGBA')
+    tiles = [(make_image((90, 70), seed=i) if i % 2 else soft_tile((90, 70), i), (10 + 95 * (i % 4), 5 + 75 * (i // 4)))
+             for i in range(16)]
+    assert_identical(canvas, tiles)
+
+
+def test_overlapping_and_clipped_tiles_match_paste():
+    rng = random.Random(7)
+    canvas = Image.new('RGBA', (300, 200), (0, 0, 0, 0))
+    tiles = []
+    for i in range(40):
+        size = (rng.randint(20, 120), rng.randint(20, 120))
+        tile = soft_tile(size, i) if rng.random() < 0.5 else make_image(size, i)
+        tiles.append((tile, (rng.randint(-60, 280), rng.randint(-60, 180))))
+    tiles.append((make_image((50, 50), 99), (400, 400)))  # Entirely outside the canvas
+    tiles.append((Image.new('RGBA', (50, 50), (255, 0, 0, 0)), (10, 10)))  # Fully transparent
+    assert_identical(canvas, tiles)
+
+
+@pytest.mark.parametrize('name', [name for name, style in STYLE_PRESETS.items()
+                                  if tuple(style['rotation_range']) == (0, 0)])
+@pytest.mark.parametrize('effects', [{}, {'border_size': 6, 'shadow': True}])
+def test_unrotated_presets_use_numpy_with_identical_output(generator, image_files, name, effects):
+    style = {**STYLE_PRESETS[name], **effects}
+    assert generator.use_numpy_compositor(style)
+    images = [*image_files, *image_files]
+    numpy_render = generator.render_collage(images, (900, 700), style, seed=5)
+    pillow_render = generator.render_collage(images, (900, 700), {**style, 'compositor': 'pillow'}, seed=5)
+    assert ImageChops.difference(numpy_render, pillow_render).getbbox() is None
+
+
+def test_rotated_presets_use_pillow(generator):
+    assert not generator.use_numpy_compositor(STYLE_PRESETS['modern'])
+    assert generator.use_numpy_compositor({**STYLE_PRESETS['modern'], 'compositor': 'numpy'})
@@ -0,0 +1,57 @@
+"""Tests of frame_pipeline: frame seeds, ordering and parallel rendering."""
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import ImageChops
+
+from config import STYLE_PRESETS
+from frame_pipeline import frame_seeds, ordered_map, render_frames
+
+DIMENSIONS = (320, 240)
+
+
+def test_frame_seeds_are_reproducible():
+    assert frame_seeds('animation', 5) == frame_seeds('animation', 5)
+    assert frame_seeds('animation', 3) == frame_seeds('animation', 5)[:3]
+    assert len(set(frame_seeds(1, 50))) == 50
+
+
+def test_ordered_map_keeps_the_input_order():
+    with ThreadPoolExecutor(4) as executor:
+        results = list(ordered_map(executor, lambda x: x * x, ((i,) for i in range(20)), max_pending=3))
+    assert results == [i * i for i in range(20)]
+
+
+def test_serial_frames_leave_the_shared_generator_alone(generator, image_files):
+    random.seed(1)
+    state = random.getstate()
+    list(render_frames(generator, frame_seeds(7, 2), image_files=image_files, dimensions=DIMENSIONS,
+                       style=STYLE_PRESETS['scrapbook']))
+    assert random.getstate() == state
+
+
+def test_frames_do_not_depend_on_the_number_of_workers(generator, image_files):
+    kwargs = {'image_files': image_files, 'dimensions': DIMENSIONS, 'style': STYLE_PRESETS['scrapbook']}
+    seeds = frame_seeds(7, 4)
+    serial = list(render_frames(generator, seeds, workers=1, **kwargs))
+    parallel = list(render_frames(generator, seeds, workers=2, **kwargs))
+    assert len(parallel) == 4
+    for a, b in zip(serial, parallel):
+        assert a.size == DIMENSIONS and a.mode == 'RGB'
+        assert ImageChops.difference(a, b).getbbox() is None
+    assert ImageChops.difference(serial[0], serial[1]).getbbox() is not None
+
+
+def test_parallel_frames_come_back_through_shared_memory(generator, image_files, monkeypatch):
+    import shm_transport
+
+    created = []
+    acquire = shm_transport.SharedBufferPool.acquire
+    monkeypatch.setattr(shm_transport.SharedBufferPool, 'acquire',
+                        lambda pool, nbytes: created.append(pool) or acquire(pool, nbytes))
+    frames = list(render_frames(generator, frame_seeds(3, 6), workers=2, max_pending=2, image_files=image_files,
+                                dimensions=DIMENSIONS, style=STYLE_PRESETS['minimal']))
+    assert len(frames) == 6 and len(created) == 6
+    # Buffers are reused once a frame is copied out, and all unlinked at the end
+    pool = created[0]
+    assert pool.stats()['buffers'] == 0 and pool.stats()['created'] <= 3
@@ -0,0 +1,58 @@
+"""Tests of gif_encoder: shared palette, delta frames and frame rate limiting."""
+from PIL import Image, ImageChops, ImageSequence
+
+from gif_encoder import build_palette, encode_gif, limit_frame_rate
+
+
+def moving_square_frames(count: int = 20):
+    """Frames of a white square moving over a red background with a gray bar, each one different."""
+    frames = []
+    for i in range(count):
+        frame = Image.new('RGB', (96, 64), (200, 40, 40))
+        frame.paste((60, 60, 60), (0, 56, 96, 64))
+        frame.paste((240, 240, 240), (i * 3, 10, i * 3 + 16, 26))
+        frames.append(frame)
+    return frames
+
+
+def decoded_frames(path):
+    with Image.open(path) as gif:
+        return [frame.convert('RGB') for frame in ImageSequence.Iterator(gif)]
+
+
+def test_limit_frame_rate_drops_frames_above_max_fps():
+    frames, duration = limit_frame_rate(list(range(10)), 0.01, max_fps=50)
+    assert frames == [0, 2, 4, 6, 8]
+    assert duration == 0.02
+
+
+def test_build_palette_covers_sampled_colors():
+    palette = build_palette(moving_square_frames(), colors=16).getpalette()
+    colors = {tuple(palette[i:i + 3]) for i in range(0, len(palette), 3)}
+    assert (200, 40, 40) in colors and (240, 240, 240) in colors
+
+
+def test_frames_round_trip(tmp_path):
+    frames = moving_square_frames()
+    # A dark patch only in a frame the palette sample skips must not decode as
+    # "unchanged" and show the previous frame instead
+    frames[-1].paste((5, 5, 5), (60, 40, 90, 60))
+    path = tmp_path / 'animation.gif'
+    stats = encode_gif(frames, str(path), duration=0.1, dither=False)
+
+    decoded = decoded_frames(path)
+    assert stats['frames'] == len(decoded) == len(frames)
+    palette = build_palette(frames, stats['colors'])
+    for frame, original in zip(decoded, frames):
+        expected = original.quantize(palette=palette, dither=Image.Dither.NONE).convert('RGB')
+        assert ImageChops.difference(frame, expected).getbbox() is None
+    assert decoded[-1].getpixel((75, 50)) == (60, 60, 60)
+
+
+def test_identical_frames_are_merged(tmp_path):
+    frames = moving_square_frames(4)
+    frames = [frames[0], frames[0].copy(), frames[1], frames[2]]
+    path = tmp_path / 'animation.gif'
+    encode_gif(frames, str(path), duration=0.1, dither=False)
+    with Image.open(path) as gif:
+        assert gif.n_frames == 3
@@ -0,0 +1,75 @@
+"""Tests of html_assets: web-sized derivatives and sprite atlases of the HTML export."""
+import os
+
+from PIL import Image, ImageColor
+
+from conftest import make_image
+from html_assets import pack_sprites, picture_tag, sprite_css, write_derivatives, write_sprite_atlas
+
+
+def test_derivatives_at_each_density(tmp_path):
+    variants = write_derivatives(make_image((1600, 1200)), (200, 150), str(tmp_path), '00')
+    assert [(v['format'], v['density'], v['width'], v['height']) for v in variants] == [
+        ('webp', 1, 200, 150), ('jpeg', 1, 200, 150), ('webp', 2, 400, 300), ('jpeg', 2, 400, 300)]
+    for variant in variants:
+        path = tmp_path / variant['file']
+        assert os.path.getsize(path) == variant['bytes']
+        with Image.open(path) as image:
+            assert image.size == (variant['width'], variant['height'])
+
+
+def test_transparent_images_fall_back_to_png(tmp_path):
+    variants = write_derivatives(make_image((600, 600), mode='RGBA'), (100, 100), str(tmp_path), '01')
+    assert {variant['format'] for variant in variants} == {'webp', 'png'}
+    with Image.open(tmp_path / variants[-1]['file']) as image:
+        assert image.mode == 'RGBA'
+
+
+def test_small_sources_are_not_upscaled(tmp_path):
+    variants = write_derivatives(make_image((300, 200)), (250, 150), str(tmp_path), '02')
+    # 2x would need 500x300: the largest available size is used once instead
+    assert [(v['density'], v['width'], v['height']) for v in variants if v['format'] == 'webp'] == [
+        (1, 250, 150), (2, 300, 180)]
+    variants = write_derivatives(make_image((200, 120)), (250, 150), str(tmp_path), '03')
+    assert [(v['density'], v['width'], v['height']) for v in variants if v['format'] == 'webp'] == [(1, 200, 120)]
+
+
+def test_picture_tag(tmp_path):
+    variants = write_derivatives(make_image((800, 600)), (200, 150), str(tmp_path), '00')
+    html = picture_tag(variants, 'assets/', 'A "quoted" <alt>', (200, 150), 'left: 0px;')
+    assert 'srcset="assets/00_200x150.webp 1x, assets/00_400x300.webp 2x"' in html
+    assert 'src="assets/00_200x150.jpg"' in html
+    assert 'width="200" height="150" loading="lazy"' in html
+    assert 'alt="A &quot;quoted&quot; &lt;alt&gt;"' in html
+
+
+def test_pack_sprites_places_every_sprite_without_overlap():
+    sizes = [(40, 30), (10, 80), (25, 25), (60, 10), (5, 5), (33, 47)] * 5
+    positions, (width, height) = pack_sprites(sizes, padding=1)
+    rects = [(x, y, x + w, y + h) for (x, y), (w, h) in zip(positions, sizes)]
+    for i, rect in enumerate(rects):
+        assert rect[0] >= 0 and rect[1] >= 0 and rect[2] <= width and rect[3] <= height
+        for other in rects[:i]:
+            # At least `padding` pixels apart on one axis
+            assert rect[2] < other[0] or other[2] < rect[0] or rect[3] < other[1] or other[3] < rect[1]
+    assert width * height < 2 * sum((w + 1) * (h + 1) for w, h in sizes)
+
+
+def test_sprite_atlas_holds_each_image_at_its_position(tmp_path):
+    colors = ['red', 'lime', 'blue']
+    images = [Image.new('RGB', (400, 300), color) for color in colors]
+    display_sizes = [(40, 30), (20, 20), (30, 60)]
+    positions, variants = write_sprite_atlas(images, display_sizes, str(tmp_path))
+    assert [(v['format'], v['density']) for v in variants] == [('webp', 1), ('jpeg', 1), ('webp', 2), ('jpeg', 2)]
+
+    atlas_2x = next(v for v in variants if v['format'] == 'jpeg' and v['density'] == 2)
+    with Image.open(tmp_path / atlas_2x['file']) as atlas:
+        atlas = atlas.convert('RGB')
+        for color, (x, y), (width, height) in zip(colors, positions, display_sizes):
+            center = atlas.getpixel((2 * x + width, 2 * y + height))
+            assert max(abs(a - b) for a, b in zip(center, ImageColor.getrgb(color))) < 8
+
+    css = sprite_css('.tile', variants, 'assets/')
+    assert f'url("assets/{variants[1]["file"]}")' in css
+    assert f'background-size: {variants[1]["width"]}px {variants[1]["height"]}px' in css
+    assert 'image-set(url("assets/' in css and '2x type("image/webp")' in css
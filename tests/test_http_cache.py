@@ -0,0 +1,59 @@
+"""Tests of http_cache: ETags, conditional and range requests, and immutable URLs."""
+import pytest
+from flask import Flask
+
+from http_cache import IMMUTABLE_MAX_AGE, file_digest, file_version, send_cached_file
+
+
+@pytest.fixture
+def served(tmp_path):
+    """A Flask client serving tmp_path through send_cached_file, and the path of one file in it."""
+    path = tmp_path / 'collage.png'
+    path.write_bytes(bytes(range(256)) * 8)
+    app = Flask(__name__)
+
+    @app.route('/files/<path:filename>')
+    def plain(filename):
+        return send_cached_file(str(tmp_path), filename)
+
+    @app.route('/v/<version>/<path:filename>')
+    def versioned(version, filename):
+        return send_cached_file(str(tmp_path), filename, version, max_age=3600)
+
+    return app.test_client(), str(path)
+
+
+def test_plain_url_revalidates_with_a_304(served):
+    client, path = served
+    response = client.get('/files/collage.png')
+    assert response.status_code == 200 and response.cache_control.no_cache
+    assert response.get_etag() == (file_digest(path), False)
+
+    response = client.get('/files/collage.png', headers={'If-None-Match': f'"{file_digest(path)}"'})
+    assert response.status_code == 304 and not response.data
+
+
+def test_ranges(served):
+    client, _ = served
+    response = client.get('/files/collage.png', headers={'Range': 'bytes=10-19'})
+    assert response.status_code == 206 and response.data == bytes(range(10, 20))
+    assert client.get('/files/collage.png', headers={'Range': 'bytes=5000-'}).status_code == 416
+
+
+def test_versioned_url_is_immutable_for_max_age(served):
+    client, path = served
+    response = client.get(f'/v/{file_version(path)}/collage.png')
+    assert response.cache_control.immutable and response.cache_control.public
+    assert response.cache_control.max_age == 3600 < IMMUTABLE_MAX_AGE
+
+
+def test_stale_version_must_revalidate(served):
+    client, _ = served
+    response = client.get(f'/v/{"0" * 16}/collage.png')
+    assert response.status_code == 200
+    assert response.cache_control.no_cache and not response.cache_control.immutable
+
+
+def test_missing_file_is_a_404(served):
+    client, _ = served
+    assert client.get('/files/missing.png').status_code == 404
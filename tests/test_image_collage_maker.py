@@ -0,0 +1,181 @@
+"""Tests of CollageGenerator: layouts, seeded renders and previews."""
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image, ImageChops, ImageStat
+
+from config import PREVIEW, STYLE_PRESETS
+from image_collage_maker import CollageGenerator
+
+DIMENSIONS = (640, 480)
+
+
+def mean_difference(a, b) -> float:
+    difference = ImageChops.difference(a.convert('RGB'), b.convert('RGB'))
+    return sum(ImageStat.Stat(difference).mean) / 3
+
+
+def test_choose_layout_is_drawn_from_the_given_generator():
+    first = CollageGenerator.choose_layout(4, rng=random.Random(7))
+    assert CollageGenerator.choose_layout(4, rng=random.Random(7)) == first
+
+
+def test_choose_layout_rejects_unknown_names():
+    with pytest.raises(ValueError):
+        CollageGenerator.choose_layout(4, 'No such layout')
+
+
+def test_seeded_renders_are_reproducible(generator, image_files):
+    style = STYLE_PRESETS['scrapbook']
+    first = generator.render_collage(image_files, DIMENSIONS, style, seed=42)
+    second = generator.render_collage(image_files, DIMENSIONS, style, seed=42)
+    assert ImageChops.difference(first, second).getbbox() is None
+
+
+def test_seeded_renders_leave_the_shared_generator_alone(generator, image_files):
+    random.seed(1)
+    state = random.getstate()
+    generator.render_collage(image_files, DIMENSIONS, STYLE_PRESETS['scrapbook'], seed=42)
+    assert random.getstate() == state
+
+
+def test_concurrent_seeded_renders_match_sequential_ones(generator, image_files):
+    style = STYLE_PRESETS['scrapbook']
+    seeds = [1, 2, 3, 4] * 2
+    expected = {seed: generator.render_collage(image_files, DIMENSIONS, style, seed=seed) for seed in set(seeds)}
+    with ThreadPoolExecutor(4) as pool:
+        images = list(pool.map(lambda seed: generator.render_collage(image_files, DIMENSIONS, style, seed=seed), seeds))
+    for seed, image in zip(seeds, images):
+        assert ImageChops.difference(image, expected[seed]).getbbox() is None
+
+
+def test_preview_has_the_layout_of_the_full_render(generator, image_files, monkeypatch):
+    monkeypatch.setitem(PREVIEW, 'max_side', 320)
+    # Previews skip drop shadows, which would otherwise be the main difference
+    style = dict(STYLE_PRESETS['scrapbook'], shadow=False)
+    full = generator.render_collage(image_files, DIMENSIONS, style, seed=42)
+    preview = generator.render_preview(image_files, DIMENSIONS, style, seed=42)
+    assert preview.size == (320, 240)
+
+    reduced = full.resize(preview.size)
+    # Only the cheaper filters differ; another seed gives another layout, far off
+    assert mean_difference(preview, reduced) < 10
+    other = generator.render_preview(image_files, DIMENSIONS, style, seed=43)
+    assert mean_difference(other, reduced) > 4 * mean_difference(preview, reduced)
+
+
+def test_budget_plan_has_the_cells_of_the_seeded_render(generator, image_files):
+    style = STYLE_PRESETS['scrapbook']
+    random.seed(1)
+    state = random.getstate()
+    plan = generator._plan_collage(image_files, DIMENSIONS, style, None, 'JPEG', seed=42)
+    assert random.getstate() == state
+
+    placements = generator._compose_collage(image_files, DIMENSIONS, style, seed=42)[2]
+    assert [tile.cell_size for tile in plan.tiles] == [placement['cell'][2:] for placement in placements]
+
+
+def test_budgeted_render_opens_each_source_once(generator, image_files, monkeypatch):
+    opened = []
+    open_image = generator.open_image
+    monkeypatch.setattr(generator, 'open_image', lambda image_file: opened.append(image_file) or open_image(image_file))
+    result = generator.create_budgeted_collage(image_files, DIMENSIONS, 0.5, STYLE_PRESETS['modern'], seed=42,
+                                               html=False)
+    assert sorted(opened) == sorted(image_files)
+    assert result['seed'] == 42 and result['path'] is not None
+
+
+@pytest.mark.parametrize('html_mode', ['images', 'sprite'])
+def test_html_export_reuses_the_decoded_sources(generator, image_files, monkeypatch, html_mode):
+    import json
+    import os
+
+    opened = []
+    open_image = generator.open_image
+    monkeypatch.setattr(generator, 'open_image', lambda image_file: opened.append(image_file) or open_image(image_file))
+    style = STYLE_PRESETS['scrapbook']
+    path = generator.create_single_collage(image_files, DIMENSIONS, style=style, seed=42, html_mode=html_mode)
+    assert sorted(opened) == sorted(image_files)
+
+    # The derivatives are as large as those made from freshly opened originals
+    monkeypatch.setattr(generator, 'open_image', open_image)
+    stem = os.path.splitext(path)[0]
+    with open(f"{stem}_assets/manifest.json") as file:
+        reused = json.load(file)
+    placements = generator._compose_collage(image_files, DIMENSIONS, style, seed=42)[2]
+    generator.convert_collage_to_html(image_files, DIMENSIONS, None, style, output_name='fresh',
+                                      placements=placements, html_mode=html_mode)
+    with open(os.path.join(generator.output_dir, 'fresh_assets', 'manifest.json')) as file:
+        fresh = json.load(file)
+
+    def sizes(manifest):
+        if html_mode == 'sprite':
+            return ([(image['sprite']['width'], image['sprite']['height']) for image in manifest['images']]
+                    + [(sprite['width'], sprite['height']) for sprite in manifest['sprites']])
+        return [[(variant['width'], variant['height']) for variant in image['variants']] for image in manifest['images']]
+    assert sizes(reused) == sizes(fresh)
+
+
+def test_plain_renders_do_not_hash_their_images(generator, image_files, monkeypatch):
+    monkeypatch.setattr(generator, 'image_key', lambda image_file: pytest.fail("hashed an image"))
+    assert generator.create_single_collage(image_files, DIMENSIONS, style=STYLE_PRESETS['minimal'], seed=1,
+                                           html=False) is not None
+
+
+def test_reuse_returns_the_indexed_collage(generator, image_files, monkeypatch):
+    style = STYLE_PRESETS['minimal']
+    path = generator.create_single_collage(image_files, DIMENSIONS, style=style, seed=1, html=False, reuse=True)
+    assert generator.find_collage(image_files, DIMENSIONS, style, seed=1) == path
+
+    monkeypatch.setattr(generator, '_compose_collage', lambda *args, **kwargs: pytest.fail("rendered again"))
+    assert generator.create_single_collage(image_files, DIMENSIONS, style=style, seed=1, html=False,
+                                           reuse=True) == path
+
+
+def test_collage_sizes_decode_each_image_once(generator, image_files, monkeypatch):
+    opened = []
+    open_image = generator.open_image
+    monkeypatch.setattr(generator, 'open_image', lambda image_file: opened.append(image_file) or open_image(image_file))
+    style = STYLE_PRESETS['minimal']
+    sizes = [(1200, 900), (640, 480), (200, 150)]
+    results = generator.create_collage_sizes(image_files[:4], sizes, style, layout='Grid 2x2')
+    # Later passes only get the decoded images
+    assert sorted(image for image in opened if isinstance(image, str)) == sorted(image_files[:4])
+
+    for size, result in zip(sizes, results):
+        with Image.open(result['path']) as image:
+            assert image.size == size
+            # Each size looks like that size rendered on its own
+            alone = generator.render_collage(image_files[:4], size, style, layout='Grid 2x2')
+            assert mean_difference(image, alone) < 3
+
+
+def test_collage_sizes_are_the_same_collage(generator, image_files, monkeypatch):
+    placements = []
+    render_tiles = generator.render_tiles
+    monkeypatch.setattr(generator, 'render_tiles',
+                        lambda *args, **kwargs: placements.append(render_tiles(*args, **kwargs)) or placements[-1])
+    sizes = [(1200, 900), (640, 480), (400, 300)]
+    for _ in range(3):
+        placements.clear()
+        targets = generator.render_collage_sizes(image_files, sizes, STYLE_PRESETS['modern'])['targets']
+        assert len({target['layout'] for target in targets}) == 1
+        # The same rotations, and cells at the same place relative to the canvas
+        for (width, height), size_placements in zip(sizes, placements):
+            assert [placement['rotation'] for placement in size_placements] == \
+                [placement['rotation'] for placement in placements[0]]
+            for placement, first in zip(size_placements, placements[0]):
+                x, y = placement['cell'][:2]
+                assert abs(x / width - first['cell'][0] / 1200) < 0.01 and abs(y / height - first['cell'][1] / 900) < 0.01
+
+
+def test_html_rotations_without_placements_follow_the_seed(generator, image_files):
+    style = STYLE_PRESETS['modern']
+    grid = generator.choose_layout(len(image_files), None, DIMENSIONS, style, rng=random.Random(0))['layout']
+    pages = []
+    for _ in range(2):
+        path = generator.convert_collage_to_html(image_files, DIMENSIONS, grid, style, output_name='seeded', seed=3)
+        with open(path) as file:
+            pages.append(file.read())
+    assert pages[0] == pages[1] and 'rotate(' in pages[0]
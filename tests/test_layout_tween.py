@@ -0,0 +1,85 @@
+"""Tests of layout_tween: interpolated placements and the frames of a tween."""
+import pytest
+from PIL import Image, ImageChops
+
+from config import STYLE_PRESETS
+from conftest import make_image
+from layout_tween import LayoutTween, ease_in_out, interpolate_transform
+from tile_transform import TileTransform
+
+STYLE = dict(STYLE_PRESETS['minimal'], border_size=4, border_color='white', shadow=False)
+SIZE = (320, 240)
+
+
+def tween(layouts, rotations=None, images=None) -> LayoutTween:
+    images = images or [make_image((600, 400), seed) for seed in range(len(layouts[0]))]
+    rotations = rotations or [[0] * len(cells) for cells in layouts]
+    return LayoutTween.for_layouts(images, layouts, rotations, Image.new('RGBA', SIZE, 'gray'), STYLE)
+
+
+def placement(transform: TileTransform) -> tuple:
+    return transform.tile_size, transform.border_size, transform.rotation, transform.center
+
+
+def same(a: Image.Image, b: Image.Image) -> bool:
+    return ImageChops.difference(a, b).getbbox() is None
+
+
+def test_easing():
+    assert ease_in_out(0) == 0 and ease_in_out(1) == 1 and ease_in_out(0.5) == 0.5
+    assert ease_in_out(0.1) < 0.1 and ease_in_out(0.9) > 0.9
+
+
+def test_interpolation_ends_on_the_keyframes_and_snaps_to_quarter_pixels():
+    start = TileTransform((100, 80), 2, 0, (50.0, 40.0))
+    end = TileTransform((60, 40), 2, 30, (200.0, 120.0))
+    assert placement(interpolate_transform(start, end, 0)) == placement(start)
+    assert placement(interpolate_transform(start, end, 1)) == placement(end)
+    middle = interpolate_transform(start, end, 0.37)
+    assert middle.tile_size == (85, 65) and middle.rotation == pytest.approx(11.1)
+    assert all((4 * coordinate).is_integer() for coordinate in middle.center)
+
+
+@pytest.mark.parametrize('loop, expected', [(True, 3 * 2 + 3 * 5), (False, 3 * 2 + 2 * 5)])
+def test_frame_count(loop, expected):
+    layouts = [[(0, 0, 100, 100)], [(200, 100, 100, 100)], [(100, 50, 150, 150)]]
+    assert sum(1 for _ in tween(layouts).frames(transition_frames=5, hold_frames=2, loop=loop)) == expected
+
+
+def test_keyframes_match_a_direct_render_and_holds_repeat_the_frame():
+    layouts = [[(10, 10, 140, 100), (170, 20, 140, 200)], [(170, 20, 140, 200), (10, 10, 140, 100)]]
+    rotations = [[0, 5], [-5, 0]]
+    frames = list(tween(layouts, rotations).frames(transition_frames=6, hold_frames=3, loop=False))
+    assert frames[0] is frames[1] is frames[2]
+    for keyframe, frame in ((0, frames[0]), (1, frames[-1])):
+        direct = tween(layouts, rotations)
+        assert same(frame, direct.frame(direct.keyframes[keyframe]))
+
+
+def test_slides_reuse_rendered_tiles():
+    images = [make_image((600, 400))]
+    layouts = [[(0, 60, 120, 80)], [(197, 60, 120, 80)]]
+    animation = tween(layouts, images=images)
+    frames = list(animation.frames(transition_frames=40, hold_frames=1, loop=False))
+    # A constant-size slide has at most 4 sub-pixel phases per axis to render
+    assert animation.stats['rendered'] <= 1 + 16 and animation.stats['reused'] >= 40 - 16
+
+    # A shifted rendering is the same as rendering the tile in place
+    fresh = tween(layouts, images=images)
+    transform = interpolate_transform(*(keyframe[0] for keyframe in fresh.keyframes), ease_in_out(20 / 41))
+    assert same(frames[20], fresh.frame([transform], moving=[True]))
+
+
+def test_seeded_tween_animations_repeat_their_layouts(generator, image_files, monkeypatch):
+    keyframes, original = [], LayoutTween.for_layouts
+
+    def for_layouts(images, cells, rotations, *args):
+        keyframes.append((cells, rotations))
+        return original(images, cells, rotations, *args)
+
+    monkeypatch.setattr(LayoutTween, 'for_layouts', for_layouts)
+    for _ in range(2):
+        generator.create_tween_animation(image_files, SIZE, STYLE_PRESETS['modern'], keyframes=3, transition_frames=2,
+                                         hold_frames=1, output_format='gif', seed=11)
+    assert keyframes[0] == keyframes[1]
+    assert any(rotation for rotations in keyframes[0][1] for rotation in rotations)
@@ -0,0 +1,80 @@
+"""Tests of output_sinks: streaming, teeing and uploading encoded collages."""
+import threading
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from conftest import make_image
+from output_sinks import (MemoryObjectStore, ObjectStoreSink, StreamingSink, TeeSink, encode_collage,
+                          stream_encoding)
+
+
+def test_streamed_encoding_equals_encoding_to_memory():
+    image = make_image((640, 480), mode='RGBA')
+    expected = BytesIO()
+    encode_collage(image, expected, 'PNG', compress_level=1)
+    chunks = list(stream_encoding(encode_collage, image, chunk_size=4096, image_format='PNG', compress_level=1))
+    assert b''.join(chunks) == expected.getvalue()
+    assert all(len(chunk) == 4096 for chunk in chunks[:-1])
+
+
+def test_jpeg_drops_the_alpha_channel():
+    output = BytesIO()
+    encode_collage(make_image((64, 64), mode='RGBA'), output, 'JPEG', quality=80)
+    assert Image.open(output).mode == 'RGB'
+
+
+def test_encoder_errors_reach_the_reader_after_the_written_bytes():
+    def encode(sink):
+        sink.write(b'partial')
+        raise OSError('disk on fire')
+
+    stream = stream_encoding(encode, chunk_size=4)
+    assert next(stream) == b'part'
+    with pytest.raises(OSError, match='disk on fire'):
+        list(stream)
+
+
+def test_writer_blocks_on_a_slow_reader_and_stops_when_it_leaves():
+    sink = StreamingSink(chunk_size=1, max_chunks=2)
+    written, error = [], []
+
+    def write():
+        try:
+            for byte in range(100):
+                sink.write(bytes([byte]))
+                written.append(byte)
+        except BrokenPipeError as e:
+            error.append(e)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    reader = iter(sink)
+    assert next(reader) == b'\x00'
+    writer.join(0.3)
+    assert writer.is_alive() and len(written) <= 4  # Bounded by max_chunks, not the content
+
+    reader.close()  # The reader leaves early
+    writer.join(5)
+    assert not writer.is_alive() and error
+
+
+def test_tee_and_object_store():
+    store = MemoryObjectStore()
+    local = BytesIO()
+    with ObjectStoreSink(store, 'collages/a.png', 'image/png', spool_bytes=16) as upload:
+        encode_collage(make_image((64, 64)), TeeSink(local, upload), 'PNG')
+        assert 'collages/a.png' not in store.objects  # Uploaded in one piece, on close
+    assert store.get_object('collages/a.png') == local.getvalue()
+    assert store.objects['collages/a.png'][1] == 'image/png'
+
+
+def test_failed_encodings_are_not_uploaded():
+    store = MemoryObjectStore()
+    with pytest.raises(ValueError):
+        with ObjectStoreSink(store, 'broken.png') as upload:
+            upload.write(b'half a file')
+            raise ValueError
+    with pytest.raises(KeyError):
+        store.get_object('broken.png')
@@ -0,0 +1,89 @@
+"""Tests of output_store: content-addressed, sharded and atomic outputs, and the spec index."""
+import hashlib
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from output_store import TEMP_PREFIX, OutputFile, SpecIndex, atomic_write, sharded_path
+
+
+def leftovers(root) -> list:
+    return [name for _, _, names in os.walk(root) for name in names if name.startswith(TEMP_PREFIX)]
+
+
+def test_sharded_path():
+    digest = hashlib.sha256(b'collage').hexdigest()
+    assert sharded_path('out', digest, 'jpg') == os.path.join('out', digest[:2], digest[2:4],
+                                                              f'collage_{digest[:32]}.jpg')
+
+
+def test_outputs_are_named_after_their_content(tmp_path):
+    with OutputFile(str(tmp_path), 'png') as output:
+        output.write(b'first ')
+        output.write(b'image')
+    assert output.path == sharded_path(str(tmp_path), hashlib.sha256(b'first image').hexdigest(), 'png')
+    assert open(output.path, 'rb').read() == b'first image'
+    assert stat.S_IMODE(os.stat(output.path).st_mode) == 0o644
+
+    with OutputFile(str(tmp_path), 'png') as again:
+        again.write(b'first image')
+    assert again.path == output.path and leftovers(tmp_path) == []
+
+
+def test_content_written_through_the_temp_path_is_hashed(tmp_path):
+    with OutputFile(str(tmp_path), 'mp4') as output:
+        with open(output.temp_path, 'wb') as file:  # As ffmpeg does
+            file.write(b'video')
+    assert output.path == sharded_path(str(tmp_path), hashlib.sha256(b'video').hexdigest(), 'mp4')
+
+
+def test_failed_outputs_are_discarded(tmp_path):
+    with pytest.raises(RuntimeError):
+        with OutputFile(str(tmp_path), 'jpg') as output:
+            output.write(b'half')
+            raise RuntimeError
+    assert output.path is None and leftovers(tmp_path) == []
+
+
+def test_concurrent_outputs_never_collide(tmp_path):
+    def render(i):
+        with OutputFile(str(tmp_path), 'jpg') as output:
+            for _ in range(50):
+                output.write(f'collage {i};'.encode())
+        return i, output.path
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(render, range(32)))
+    assert len({path for _, path in results}) == 32
+    for i, path in results:
+        assert open(path, 'rb').read() == f'collage {i};'.encode() * 50
+
+
+def test_atomic_write_keeps_the_old_file_on_failure(tmp_path):
+    path = str(tmp_path / 'index' / 'record.json')
+    with atomic_write(path) as file:
+        file.write('old')
+    with pytest.raises(ValueError):
+        with atomic_write(path) as file:
+            file.write('new but broken')
+            raise ValueError
+    assert open(path).read() == 'old' and leftovers(tmp_path) == []
+
+
+def test_spec_index(tmp_path):
+    index = SpecIndex(str(tmp_path))
+    with OutputFile(str(tmp_path), 'jpg') as output:
+        output.write(b'collage')
+    key = hashlib.sha256(b'spec').hexdigest()
+
+    assert index.lookup(key) is None
+    index.record(key, output.path, html=None)
+    assert SpecIndex(str(tmp_path)).lookup(key) == output.path
+
+    os.remove(output.path)
+    assert index.lookup(key) is None  # The output was swept
+    with open(index._record_path(key), 'w') as file:
+        file.write('{not json')
+    assert index.lookup(key) is None
@@ -0,0 +1,105 @@
+"""Tests of render_budget: the cost model, its settings choice and its calibration."""
+import json
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import render_budget
+from config import TRANSFORM_QUALITY
+from render_budget import CostModel, RenderPlan, TilePlan, calibrate_cost_model, draft_size, get_cost_model
+
+PLAN = RenderPlan((1200, 1200), [TilePlan((4000, 3000), (600, 600)), TilePlan((3000, 4000), (600, 600), alpha=True)],
+                  'PNG', rotation=5, shadow=True)
+
+
+@pytest.fixture
+def rates():
+    return dict({name: 0.01 for name in render_budget._rate_names()}, open=0.001)
+
+
+@pytest.fixture
+def fresh_model(monkeypatch, tmp_path):
+    """An uncalibrated shared model and a calibration file in tmp_path; calibrate() only counts its calls."""
+    monkeypatch.setattr(render_budget, '_cost_model', CostModel())
+    calls = []
+    monkeypatch.setattr(render_budget, 'calibrate',
+                        lambda: calls.append(1) or {name: 0.01 for name in render_budget._rate_names()})
+    return str(tmp_path / 'calibration.json'), calls
+
+
+def test_draft_size_picks_the_largest_scale_still_covering_the_request():
+    assert draft_size((4000, 3000), (500, 375)) == (500, 375)
+    assert draft_size((4000, 3000), (501, 376)) == (1000, 750)
+    assert draft_size((4000, 3000), (4000, 3000)) == (4000, 3000)
+
+
+def test_larger_budgets_lose_less_quality(rates):
+    model = CostModel(rates)
+    tight, tight_stages = model.choose(PLAN, 0.01)
+    loose, loose_stages = model.choose(PLAN, 100)
+    assert loose['fits'] and loose['quality_loss'] == 0
+    assert not tight['fits'] and sum(tight_stages.values()) < sum(loose_stages.values())
+    assert model.predict(PLAN, loose) == pytest.approx(loose_stages)
+
+
+def test_observed_times_correct_the_predictions(rates):
+    model = CostModel(rates)
+    settings, predicted = model.choose(PLAN, 100)
+    model.observe(predicted, {'render': 2 * sum(seconds for stage, seconds in predicted.items() if stage != 'encode'),
+                              'encode': None})
+    assert model.corrections['render'] > 1 and model.corrections['encode'] == 1
+    assert model.predict(PLAN, settings)['resample'] > predicted['resample']
+
+
+def test_uncalibrated_model_uses_the_fast_preset():
+    settings, predicted = CostModel().choose(PLAN, 0.3)
+    assert predicted == {}
+    assert {key: settings[key] for key in TRANSFORM_QUALITY['fast']} == TRANSFORM_QUALITY['fast']
+    assert settings['shadow_blur'] is None and settings['encoder_effort'] == 'fastest'
+
+
+def test_get_cost_model_never_measures(fresh_model):
+    path, calls = fresh_model
+    assert not get_cost_model(path).calibrated
+    calibrate_cost_model(path)
+    assert calls == [1]
+    with open(path) as file:
+        assert json.load(file)['rates'] == render_budget._cost_model.rates
+
+
+def test_saved_calibration_is_loaded_without_measuring(fresh_model, monkeypatch):
+    path, calls = fresh_model
+    calibrate_cost_model(path)
+    monkeypatch.setattr(render_budget, '_cost_model', CostModel())
+    assert get_cost_model(path).calibrated
+    monkeypatch.setattr(render_budget, '_cost_model', CostModel())
+    calibrate_cost_model(path)
+    assert calls == [1]
+
+
+def _calibrate_in_process(path: str, log: str):
+    def measure():
+        with open(log, 'a') as file:
+            file.write(f"{os.getpid()}\n")
+        time.sleep(0.3)
+        return {name: 0.01 for name in render_budget._rate_names()}
+    render_budget.calibrate = measure
+    calibrate_cost_model(path)
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_processes_starting_together_measure_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(render_budget, '_cost_model', CostModel())
+    path, log = str(tmp_path / 'calibration.json'), str(tmp_path / 'calls.log')
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=_calibrate_in_process, args=(path, log)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(10)
+        assert process.exitcode == 0
+    with open(log) as file:
+        assert len(file.readlines()) == 1
+    assert os.path.exists(path)
@@ -0,0 +1,94 @@
+"""Tests of render_pool: pre-warmed workers, shared-memory jobs, failures and recycling."""
+import os
+import signal
+import time
+
+import pytest
+
+from conftest import make_image
+from render_pool import RenderPool
+
+
+@pytest.fixture(scope='module')
+def pool(tmp_path_factory):
+    """One warm worker, recycled after every three jobs."""
+    pool = RenderPool(str(tmp_path_factory.mktemp('pool')), processes=1, max_jobs_per_worker=3,
+                      warm_dimensions=[(200, 200)]).start(wait=True)
+    yield pool
+    pool.shutdown()
+
+
+def wait_for(condition, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_workers_start_warm(pool):
+    stats = pool.stats()
+    assert stats['ready'] and stats['workers'] == 1 and len(stats['warm_up_s']) >= 1
+
+
+def test_images_travel_through_shared_memory(pool):
+    handles = [pool.share_image(make_image((400, 300), seed)) for seed in range(3)]
+    try:
+        future = pool.submit_image('create_single_collage_frame', (200, 200), image_files=handles,
+                                   dimensions=(200, 200), style='minimal', seed=1)
+        with future.result(timeout=60) as frame:
+            assert frame.size == (200, 200)
+    finally:
+        for handle in handles:
+            pool.release_image(handle)
+
+
+def test_failed_jobs_raise_and_the_pool_carries_on(pool):
+    with pytest.raises(RuntimeError, match='AttributeError'):
+        pool.render('no_such_method', timeout=60)
+    assert pool.stats()['failed'] >= 1
+    frame = pool.render('create_single_collage_frame', timeout=60, image_files=[make_image((300, 300))],
+                        dimensions=(200, 200), style='minimal', seed=0)
+    assert frame.size == (200, 200)
+
+
+def test_workers_are_recycled_after_max_jobs(pool):
+    recycled = pool.stats()['recycled']
+    for seed in range(3):
+        pool.render('create_single_collage_frame', timeout=60, image_files=[make_image((300, 300))],
+                    dimensions=(200, 200), style='minimal', seed=seed)
+    wait_for(lambda: pool.stats()['recycled'] > recycled and pool.stats()['workers'] == 1)
+
+
+def test_crashed_workers_are_replaced(pool):
+    crashed = pool.stats()['crashed']
+    # Killed while waiting for a job, which must not leave other workers unable to get one
+    wait_for(lambda: pool.stats()['workers'] == 1 and pool._idle)
+    time.sleep(0.2)
+    os.kill(next(iter(pool._workers)), signal.SIGKILL)
+    wait_for(lambda: pool.stats()['crashed'] > crashed and pool.stats()['workers'] == 1)
+    frame = pool.render('create_single_collage_frame', timeout=60, image_files=[make_image((300, 300))],
+                        dimensions=(200, 200), style='minimal', seed=0)
+    assert frame.size == (200, 200)
+
+
+def test_shut_down_pool_rejects_jobs(tmp_path):
+    pool = RenderPool(str(tmp_path), processes=1, warm_dimensions=[(100, 100)]).start()
+    pool.shutdown()
+    assert pool.stats()['workers'] == 0
+    with pytest.raises(RuntimeError):
+        pool.submit('create_single_collage_frame')
+
+
+def test_cost_model_is_calibrated_only_for_budgeted_jobs(tmp_path, monkeypatch):
+    import render_budget
+    calls = []
+    monkeypatch.setattr(render_budget, 'calibrate_cost_model', lambda: calls.append(1))
+    pool = RenderPool(str(tmp_path), processes=1, warm_dimensions=[(100, 100)]).start()
+    try:
+        assert not calls
+        pool.submit('create_single_collage_frame')
+        assert not calls
+        pool.submit('create_budgeted_collage')
+        assert calls
+    finally:
+        pool.shutdown()
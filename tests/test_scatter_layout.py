@@ -0,0 +1,54 @@
+"""Tests of scatter_layout: the spatial index and randomized scatter layouts."""
+import random
+
+from grid_layouts import GRID_LAYOUTS
+from scatter_layout import SpatialGrid, intersection_area, rectangles_overlap, scatter_layout
+
+
+def random_rect(rng: random.Random, extent: float = 1000, size: float = 80):
+    x, y = rng.uniform(-extent / 10, extent), rng.uniform(-extent / 10, extent)
+    return (x, y, x + rng.uniform(1, size), y + rng.uniform(1, size))
+
+
+def test_spatial_grid_matches_brute_force():
+    rng = random.Random(3)
+    rects = [random_rect(rng) for _ in range(400)]
+    index = SpatialGrid(bucket_size=60)
+    for rect in rects:
+        index.insert(rect)
+    for _ in range(200):
+        query = random_rect(rng, size=200)
+        expected = [rect for rect in rects if rectangles_overlap(query, rect)]
+        assert sorted(index.query(query)) == sorted(expected)
+
+
+def test_layout_is_reproducible_and_inside_the_canvas():
+    layout = scatter_layout(40, (1600, 900), seed=7)
+    assert layout == scatter_layout(40, (1600, 900), seed=7)
+    assert layout != scatter_layout(40, (1600, 900), seed=8)
+    assert len(layout['layout']) == 40
+    for x, y, w, h in layout['layout']:
+        assert 0 <= x and 0 <= y and x + w <= 1 + 1e-9 and y + h <= 1 + 1e-9
+
+
+def test_tiles_respect_max_overlap_when_there_is_room():
+    width, height = 2000, 2000
+    layout = scatter_layout(12, (width, height), max_overlap=0.1, coverage=0.4, attempts=200, seed=1)
+    rects = [(x * width, y * height, (x + w) * width, (y + h) * height) for x, y, w, h in layout['layout']]
+    for i, rect in enumerate(rects):
+        area = (rect[2] - rect[0]) * (rect[3] - rect[1])
+        assert sum(intersection_area(rect, other) for other in rects[:i]) / area <= 0.1
+
+
+def test_hundreds_of_tiles():
+    assert len(scatter_layout(600, (4000, 3000), rotation_range=(-10, 10), spacing=0.01, seed=0)['layout']) == 600
+
+
+def test_choose_layout_scatters_when_no_grid_fits():
+    from image_collage_maker import CollageGenerator
+    n_images = max(GRID_LAYOUTS) + 1
+    assert CollageGenerator.choose_layout(n_images, dimensions=(800, 600), rng=random.Random(0))['name'] == 'Scatter'
+    assert CollageGenerator.choose_layout(3, 'scatter', (800, 600), rng=random.Random(0))['name'] == 'Scatter'
+    assert CollageGenerator.choose_layout(3, dimensions=(800, 600), style={'layout_mode': 'scatter'},
+                                          rng=random.Random(0))['name'] == 'Scatter'
+    assert CollageGenerator.choose_layout(3, rng=random.Random(0)) in GRID_LAYOUTS[3]
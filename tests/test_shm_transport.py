@@ -0,0 +1,85 @@
+"""Tests of shm_transport: image round trips, buffer reuse and cross-process reads."""
+import multiprocessing
+
+import pytest
+from PIL import Image, ImageChops
+
+from conftest import make_image
+from shm_transport import SharedBufferPool, SharedImage, read_image, write_image
+
+
+@pytest.fixture
+def buffers():
+    buffers = SharedBufferPool(max_idle=2)
+    yield buffers
+    buffers.close()
+
+
+def same(a: Image.Image, b: Image.Image) -> bool:
+    return a.mode == b.mode and a.size == b.size and ImageChops.difference(a, b).getbbox() is None
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'RGBA', 'L', 'LA'])
+def test_round_trip(buffers, mode):
+    image = make_image((123, 45), mode='RGBA').convert(mode)
+    handle = buffers.put_image(image)
+    assert same(read_image(handle), image)
+    assert same(read_image(handle, copy=True), image)
+
+
+def test_other_modes_travel_as_rgba(buffers):
+    image = make_image((64, 64)).convert('1')
+    handle = buffers.put_image(image)
+    assert handle.mode == 'RGBA'
+    assert same(read_image(handle), image.convert('RGBA'))
+
+
+def test_zero_copy_images_follow_the_buffer_and_copies_do_not(buffers):
+    handle = buffers.put_image(Image.new('RGBA', (8, 8), 'red'))
+    view, copy = read_image(handle), read_image(handle, copy=True)
+    write_image(Image.new('RGBA', (8, 8), 'blue'), handle.buffer)
+    assert view.getpixel((0, 0)) == (0, 0, 255, 255)
+    assert copy.getpixel((0, 0)) == (255, 0, 0, 255)
+
+
+def test_released_buffers_are_reused(buffers):
+    name = buffers.acquire(1000)
+    buffers.release(name)
+    assert buffers.acquire(500) == name
+    assert buffers.stats()['created'] == 1 and buffers.stats()['reused'] == 1
+
+    names = [buffers.acquire(2 ** 20 * size) for size in (1, 2, 3)]
+    for name in names:
+        buffers.release(name)
+    # Only max_idle buffers are kept, the largest ones; the first one is still in use
+    stats = buffers.stats()
+    assert stats['idle'] == 2 and stats['bytes'] == 2 ** 20 * (1 + 2 + 3)
+    assert buffers.acquire(3 * 2 ** 20) == names[2]
+
+
+def test_small_buffers_are_refused(buffers):
+    with pytest.raises(ValueError):
+        write_image(Image.new('RGB', (2048, 2048)), buffers.acquire(16))
+
+
+def test_shared_image_releases_its_buffer(buffers):
+    handle = buffers.put_image(make_image((32, 32)))
+    with SharedImage(handle, buffers) as image:
+        assert image.size == (32, 32)
+    assert buffers.stats()['idle'] == 1
+
+
+def _invert(handle, output):
+    """Reads an image in a child process and writes its negative back."""
+    write_image(ImageChops.invert(read_image(handle)), output)
+
+
+def test_images_cross_processes(buffers):
+    image = make_image((200, 100))
+    handle = buffers.put_image(image)
+    output = buffers.acquire(handle.nbytes)
+    process = multiprocessing.get_context('spawn').Process(target=_invert, args=(handle, output))
+    process.start()
+    process.join(60)
+    assert process.exitcode == 0
+    assert same(read_image(handle._replace(buffer=output)), ImageChops.invert(image))
@@ -0,0 +1,10 @@
+"""Tests that importing an entry point does not load the heavy dependencies it defers."""
+import pytest
+
+from benchmarks.startup import ENTRY_POINTS, LAZY_MODULES, time_import
+
+
+@pytest.mark.parametrize('module', list(ENTRY_POINTS.values()))
+def test_entry_points_import_heavy_modules_lazily(module):
+    _, loaded = time_import(module)
+    assert loaded == [], f"importing {module} loaded {', '.join(loaded)} (deferred: {', '.join(LAZY_MODULES)})"
@@ -0,0 +1,83 @@
+"""Tests of storage_manager: entries, TTL expiry, LRU eviction and the sweeper."""
+import os
+import time
+
+from storage_manager import StorageBudget, StorageManager, entry_key
+
+HOUR = 3600
+
+
+def write(path, nbytes: int = 1000, age: float = 2 * HOUR, accessed: float = None):
+    """Writes a file modified `age` seconds ago and last accessed `accessed` seconds ago."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * nbytes)
+    now = time.time()
+    os.utime(path, (now - (age if accessed is None else accessed), now - age))
+    return str(path)
+
+
+def test_entry_key_groups_a_collage_with_its_page_and_assets(tmp_path):
+    root = str(tmp_path)
+    keys = {entry_key(root, os.path.join(root, *parts)) for parts in [
+        ('ab', 'collage_1.png'), ('ab', 'collage_1.html'), ('ab', 'collage_1_assets', '00_200x150.webp')]}
+    assert keys == {os.path.join('ab', 'collage_1')}
+    assert entry_key(root, os.path.join(root, 'ab', 'collage_2.png')) != keys.pop()
+
+
+def test_ttl_expires_whole_entries_and_their_directories(tmp_path):
+    old = [write(tmp_path / 'ab' / name, accessed=3 * HOUR) for name in ('old.png', 'old.html', 'old_assets/00.webp')]
+    fresh = write(tmp_path / 'cd' / 'fresh.png', age=3 * HOUR, accessed=HOUR / 2)
+    manager = StorageManager({'collages': StorageBudget(str(tmp_path), ttl=HOUR)})
+
+    usage = manager.sweep()['collages']
+    assert not any(os.path.exists(path) for path in old)
+    assert not os.path.exists(tmp_path / 'ab')  # Emptied shard and asset directories are removed
+    assert os.path.exists(fresh)
+    assert usage['entries'] == 1
+    assert manager.stats()['classes']['collages']['evictions']['expired_entries'] == 1
+
+
+def test_budget_evicts_least_recently_accessed_entries(tmp_path):
+    paths = [write(tmp_path / f'{i}.png', accessed=HOUR - i * 60) for i in range(10)]
+    recent = write(tmp_path / 'being_written.png', age=1)
+    manager = StorageManager({'collages': StorageBudget(str(tmp_path), max_bytes=8000)})
+
+    usage = manager.sweep()['collages']
+    # Down to 90% of the budget, oldest access first; the entry being written is kept
+    assert [os.path.exists(path) for path in paths] == [False] * 4 + [True] * 6
+    assert os.path.exists(recent)
+    assert usage['bytes'] == 7000 and usage['files'] == 7
+
+
+def test_file_budget(tmp_path):
+    for i in range(5):
+        write(tmp_path / f'{i}.png', nbytes=10, accessed=HOUR - i)
+    StorageManager({'uploads': StorageBudget(str(tmp_path), max_files=3)}).sweep()
+    assert sorted(os.listdir(tmp_path)) == ['3.png', '4.png']
+
+
+def test_touch_refreshes_the_last_access(tmp_path):
+    path = write(tmp_path / 'a.png', accessed=3 * HOUR)
+    modified = os.stat(path).st_mtime_ns
+    manager = StorageManager({'collages': StorageBudget(str(tmp_path), ttl=HOUR)})
+    manager.touch(path)
+    manager.touch(str(tmp_path / 'missing.png'))
+    assert time.time() - os.stat(path).st_atime < 60 and os.stat(path).st_mtime_ns == modified
+    manager.sweep()
+    assert os.path.exists(path)
+
+
+def test_recording_an_overflow_wakes_the_sweeper(tmp_path):
+    manager = StorageManager({'uploads': StorageBudget(str(tmp_path), max_files=2)}, interval=3600).start()
+    try:
+        deadline = time.monotonic() + 10
+        while manager.stats()['sweeps'] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        paths = [write(tmp_path / f'{i}.png', accessed=HOUR - i) for i in range(4)]
+        manager.record('uploads', 4000, files=4)
+        while os.path.exists(paths[0]) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not os.path.exists(paths[0]) and manager.stats()['sweeps'] >= 2
+    finally:
+        manager.stop()
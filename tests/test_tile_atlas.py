@@ -0,0 +1,95 @@
+"""Tests of tile_atlas: building and updating an atlas, contact sheets and mosaics."""
+import os
+
+import pytest
+from PIL import Image, ImageChops
+
+from conftest import make_image
+
+np = pytest.importorskip('numpy')
+from tile_atlas import TileAtlas, contact_sheet, match_tiles, photo_mosaic  # noqa: E402
+
+COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (250, 250, 250)]
+
+
+@pytest.fixture
+def solid_files(tmp_path):
+    paths = []
+    for i, color in enumerate(COLORS):
+        path = tmp_path / f'solid{i}.png'
+        Image.new('RGB', (120 + 10 * i, 90), color).save(path)
+        paths.append(str(path))
+    return paths
+
+
+def test_build_shrinks_every_readable_file(image_files, tmp_path, capsys):
+    broken = tmp_path / 'broken.jpg'
+    broken.write_bytes(b'not an image')
+    atlas = TileAtlas.build(str(tmp_path / 'atlas'), [*image_files, str(broken)], cell_size=(32, 24))
+    assert len(atlas) == len(image_files)
+    assert atlas.tiles.shape == (len(image_files), 24, 32, 3)
+    assert 'broken.jpg' in capsys.readouterr().out
+
+    with Image.open(image_files[0]) as image:
+        expected = np.asarray(TileAtlas.shrink(image, (32, 24)))
+    assert np.array_equal(atlas.tiles[0], expected)
+    assert np.allclose(atlas.means[0], expected.reshape(-1, 3).mean(axis=0), atol=1e-3)
+
+
+def test_update_only_decodes_new_and_changed_files(image_files, tmp_path):
+    path = str(tmp_path / 'atlas')
+    TileAtlas.build(path, image_files[:3], cell_size=(16, 16))
+    make_image((300, 300), seed=42).save(image_files[0])
+    os.utime(image_files[0], ns=(0, 10 ** 18))
+
+    opened = []
+
+    def open_image(image_file):
+        opened.append(image_file)
+        return Image.open(image_file)
+
+    atlas = TileAtlas.build(path, image_files[:4], cell_size=(16, 16), open_image=open_image)
+    assert sorted(opened) == sorted([image_files[0], image_files[3]])
+    with Image.open(image_files[0]) as image:
+        assert np.array_equal(atlas.tiles[0], np.asarray(TileAtlas.shrink(image, (16, 16))))
+
+
+def test_contact_sheet_matches_pasting_each_tile(image_files, tmp_path):
+    atlas = TileAtlas.build(str(tmp_path / 'atlas'), image_files, cell_size=(20, 10))
+    sheet = contact_sheet(atlas, columns=2, spacing=3)
+
+    expected = Image.new('RGB', (2 * 23 + 3, 3 * 13 + 3), 'white')
+    for i in range(len(atlas)):
+        expected.paste(Image.fromarray(np.asarray(atlas.tiles[i])), (3 + 23 * (i % 2), 3 + 13 * (i // 2)))
+    assert ImageChops.difference(sheet, expected).getbbox() is None
+
+
+def test_match_tiles_finds_the_nearest_mean():
+    rng = np.random.default_rng(0)
+    targets, means = rng.uniform(0, 255, (500, 3)), rng.uniform(0, 255, (40, 3))
+    brute_force = np.argmin(((targets[:, None, :] - means[None, :, :]) ** 2).sum(axis=2), axis=1)
+    assert np.array_equal(match_tiles(targets, means, chunk=64), brute_force)
+
+
+def test_photo_mosaic_picks_tiles_by_color(solid_files, tmp_path):
+    atlas = TileAtlas.build(str(tmp_path / 'atlas'), solid_files, cell_size=(8, 8))
+    target = Image.new('RGB', (40, 20), COLORS[2])
+    target.paste(COLORS[0], (0, 0, 20, 20))
+    mosaic = photo_mosaic(atlas, target, columns=4)
+    assert mosaic.size == (32, 16)
+    assert mosaic.getpixel((4, 4)) == COLORS[0]
+    assert mosaic.getpixel((28, 12)) == COLORS[2]
+
+
+def test_build_refuses_an_atlas_without_tiles(tmp_path):
+    broken = tmp_path / 'broken.jpg'
+    broken.write_bytes(b'not an image')
+    with pytest.raises(ValueError, match='no readable tile images'):
+        TileAtlas.build(str(tmp_path / 'atlas'), [str(broken)])
+    with pytest.raises(ValueError, match='no readable tile images'):
+        TileAtlas.build(str(tmp_path / 'atlas'), [])
+
+
+def test_matching_refuses_an_empty_atlas():
+    with pytest.raises(ValueError, match='empty'):
+        match_tiles(np.zeros((4, 3)), np.zeros((0, 3)))
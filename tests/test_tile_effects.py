@@ -0,0 +1,61 @@
+"""Tests of tile_effects: compiling a style's effect chain and drawing it into one buffer."""
+import pytest
+from PIL import Image
+
+from tile_effects import BorderEffect, EffectPipeline, ShadowEffect
+from tile_transform import TileTransform, resample_tile
+
+
+def render(style: dict, source: Image.Image, border_size: int = 0, rotation: float = 0):
+    """Resamples source into a 200x200 cell and draws the style's effects around it."""
+    transform = TileTransform.for_cell(source.size, (0, 0, 200, 200), border_size, rotation)
+    tile, position = resample_tile(source, transform)
+    return EffectPipeline.compile(style).render(tile, position, transform, source.mode == 'RGBA'), transform
+
+
+def test_compile_drops_disabled_effects():
+    assert EffectPipeline.compile({'border_size': 0, 'shadow': False}).effects == []
+    effects = EffectPipeline.compile({'border_size': 5, 'border_color': 'white', 'shadow': True}).effects
+    assert [type(effect) for effect in effects] == [BorderEffect, ShadowEffect]
+    effects = EffectPipeline.compile({'effects': ['shadow'], 'border_size': 5, 'border_color': 'white',
+                                      'shadow': True}).effects
+    assert [type(effect) for effect in effects] == [ShadowEffect]
+
+
+def test_compile_rejects_unknown_effects():
+    with pytest.raises(ValueError, match='sparkles'):
+        EffectPipeline.compile({'effects': ['sparkles']})
+
+
+def test_tiles_without_effects_are_returned_as_resampled():
+    source = Image.new('RGB', (400, 300), 'red')
+    transform = TileTransform.for_cell(source.size, (0, 0, 200, 200), 0, 0)
+    tile, position = resample_tile(source, transform)
+    assert EffectPipeline([]).render(tile, position, transform, False) == (tile, position)
+
+
+def test_border_frames_the_image():
+    (tile, origin), transform = render({'border_size': 6, 'border_color': 'blue', 'shadow': False},
+                                       Image.new('RGB', (400, 400), 'red'), border_size=6)
+    assert tile.size == transform.frame_size
+    assert tile.getpixel((2, 2)) == (0, 0, 255, 255)
+    assert tile.getpixel((tile.width // 2, tile.height // 2)) == (255, 0, 0, 255)
+
+
+def test_shadow_only_shows_through_transparency():
+    style = {'border_size': 0, 'shadow': True, 'shadow_opacity': 120}
+    (tile, _), _ = render(style, Image.new('RGB', (400, 400), 'red'))
+    assert tile.mode == 'RGB'  # Opaque sources hide the shadow, so it is skipped
+
+    (tile, _), _ = render(style, Image.new('RGBA', (400, 400), (0, 0, 0, 0)))
+    assert tile.getpixel((tile.width // 2, tile.height // 2))[3] > 0
+
+
+def test_rotated_border_follows_the_tile():
+    (tile, _), transform = render({'border_size': 6, 'border_color': 'blue', 'shadow': False},
+                                  Image.new('RGB', (400, 400), 'red'), border_size=6, rotation=30)
+    left, top, right, bottom = transform.bounds()
+    assert tile.size == (right - left, bottom - top)
+    # The corners of the bounding box lie outside the rotated frame
+    assert tile.getpixel((0, 0))[3] == 0
+    assert tile.getpixel((tile.width // 2, tile.height // 2))[:3] == (255, 0, 0)
@@ -0,0 +1,59 @@
+"""Tests of tile_transform: tile geometry and the fused resample."""
+import math
+
+import pytest
+from PIL import Image, ImageChops, ImageStat
+
+from config import TRANSFORM_QUALITY
+from tile_transform import TileTransform, fit_scale, prepare_source, resample_tile
+
+
+def zone_plate(size: int) -> Image.Image:
+    """Draws a zone plate: rings whose frequency grows up to Nyquist at the edges, which alias visibly."""
+    center = size / 2
+    k = math.pi / size
+    data = bytes(int(127.5 + 127.5 * math.cos(k * ((x - center) ** 2 + (y - center) ** 2)))
+                 for y in range(size) for x in range(size))
+    return Image.frombytes('L', (size, size), data).convert('RGB')
+
+
+def mean_difference(a: Image.Image, b: Image.Image) -> float:
+    """Returns the mean absolute difference of the RGB channels of two images, over the opaque area of a."""
+    mask = a.getchannel('A').point(lambda alpha: 255 if alpha == 255 else 0)
+    difference = ImageChops.difference(a.convert('RGB'), b.convert('RGB'))
+    return sum(ImageStat.Stat(difference, mask).mean) / 3
+
+
+def test_fit_scale_only_downscales():
+    assert fit_scale((100, 50), (400, 400)) == 1.0
+    assert fit_scale((1000, 500), (200, 200)) == pytest.approx(0.2)
+
+
+def test_unrotated_tile_fills_its_cell():
+    transform = TileTransform.for_cell((1200, 800), (10, 20, 300, 200), 0, 0)
+    tile, position = resample_tile(Image.new('RGB', (1200, 800), 'red'), transform)
+    assert tile.size == (300, 200)
+    assert position == (10, 20)
+
+
+def test_prepare_source_keeps_the_reducing_gap():
+    image = Image.new('RGB', (3000, 2000))
+    reduced = prepare_source(image, (300, 200), reducing_gap=2.0)
+    assert reduced.width >= 600 and reduced.height >= 400
+    assert reduced.width < 3000
+
+
+@pytest.mark.parametrize('quality', list(TRANSFORM_QUALITY))
+def test_rotated_tiles_do_not_alias(quality):
+    # A rotated tile must look like the source resized with a proper filter, then
+    # rotated: the affine pass alone would sample 6x too sparsely and alias the rings
+    source = zone_plate(1800)
+    transform = TileTransform.for_cell(source.size, (0, 0, 300, 300), 0, 5)
+    tile, _ = resample_tile(source, transform, quality)
+
+    left, top, right, bottom = transform.bounds()
+    reference = source.resize(transform.tile_size, Image.Resampling.LANCZOS).convert('RGBA')
+    reference = reference.transform((right - left, bottom - top), Image.Transform.AFFINE,
+                                    transform.inverse_coefficients(reference.size, (left, top)),
+                                    resample=Image.Resampling.BICUBIC)
+    assert mean_difference(tile, reference) < 8
@@ -0,0 +1,68 @@
+"""Tests of video_encoder: streaming frames to ffmpeg as an H.264 MP4."""
+import weakref
+
+import pytest
+from PIL import Image
+
+from conftest import make_image
+
+imageio_ffmpeg = pytest.importorskip('imageio_ffmpeg')
+from video_encoder import encode_mp4  # noqa: E402
+
+
+def probe(path) -> dict:
+    """Reads the size and frame count of a video."""
+    reader = imageio_ffmpeg.read_frames(str(path))
+    meta = next(reader)
+    meta['frames'] = sum(1 for _ in reader)
+    return meta
+
+
+def frames(count: int, size):
+    for i in range(count):
+        yield make_image(size, seed=i)
+
+
+def test_odd_sizes_are_padded_for_yuv420p(tmp_path):
+    path = tmp_path / 'odd.mp4'
+    result = encode_mp4(frames(5, (101, 61)), str(path), fps=10, preset='ultrafast')
+    assert result['frames'] == 5 and result['bytes'] == path.stat().st_size
+    meta = probe(path)
+    assert tuple(meta['size']) == (102, 62) and meta['frames'] == 5
+
+
+def test_full_chroma_keeps_odd_sizes(tmp_path):
+    path = tmp_path / 'odd444.mp4'
+    encode_mp4(frames(3, (101, 61)), str(path), fps=10, preset='ultrafast', pix_fmt='yuv444p')
+    assert tuple(probe(path)['size']) == (101, 61)
+
+
+def test_faststart_moves_the_index_first(tmp_path):
+    for faststart in (True, False):
+        path = tmp_path / f'{faststart}.mp4'
+        encode_mp4(frames(3, (64, 64)), str(path), fps=10, preset='ultrafast', faststart=faststart)
+        data = path.read_bytes()
+        assert (data.index(b'moov') < data.index(b'mdat')) == faststart
+
+
+def test_bad_frames_are_refused(tmp_path):
+    with pytest.raises(ValueError):
+        encode_mp4(iter([]), str(tmp_path / 'empty.mp4'), fps=10)
+
+    def mixed():
+        yield Image.new('RGB', (64, 64))
+        yield Image.new('RGB', (32, 32))
+    with pytest.raises(ValueError, match='Frame 1'):
+        encode_mp4(mixed(), str(tmp_path / 'mixed.mp4'), fps=10, preset='ultrafast')
+
+
+def test_frames_are_consumed_as_they_are_encoded(tmp_path):
+    refs = []
+
+    def stream():
+        for frame in frames(8, (64, 64)):
+            # The first frame and the one being sent are alive, never the whole animation
+            assert sum(ref() is not None for ref in refs) <= 2
+            refs.append(weakref.ref(frame))
+            yield frame
+    assert encode_mp4(stream(), str(tmp_path / 'lazy.mp4'), fps=10, preset='ultrafast')['frames'] == 8
@@ -0,0 +1,92 @@
+"""Tests of watcher: arrival sources and the debounced grouping of new images."""
+import shutil
+from pathlib import Path
+
+import pytest
+
+from config import STYLE_PRESETS
+from conftest import make_image
+from watcher import FolderWatcher, InotifySource, PollingSource
+
+
+@pytest.fixture
+def watched(tmp_path):
+    """A generator watching an empty images directory."""
+    from image_collage_maker import CollageGenerator
+    images_dir = tmp_path / 'incoming'
+    images_dir.mkdir()
+    return CollageGenerator(images_dir=str(images_dir), output_dir=str(tmp_path / 'collages'))
+
+
+def add_image(directory, name: str, seed: int):
+    """Writes an image under a temporary name and moves it in, as uploaders do."""
+    make_image((400, 300), seed).save(directory / f'.{name}.part', format='JPEG')
+    shutil.move(str(directory / f'.{name}.part'), str(directory / name))
+
+
+def watcher_for(generator, **options) -> FolderWatcher:
+    options = {'group_size': 2, 'window': 60.0, 'debounce': 0.0, 'poll_interval': 0.05, 'html': False,
+               **options}
+    return FolderWatcher(generator, (300, 300), STYLE_PRESETS['minimal'], **options)
+
+
+def poll_until(watcher: FolderWatcher, count: int, attempts: int = 40) -> list:
+    outputs = []
+    for _ in range(attempts):
+        outputs.extend(watcher.poll())
+        if len(outputs) >= count:
+            break
+    return outputs
+
+
+def test_polling_source_reports_each_new_file_once(tmp_path):
+    (tmp_path / 'old.jpg').write_bytes(b'x')
+    source = PollingSource(str(tmp_path), {'old.jpg'})
+    assert source.wait(0) == []
+    (tmp_path / 'new.jpg').write_bytes(b'x')
+    assert source.wait(0) == ['new.jpg']
+    assert source.wait(0) == []
+
+
+def test_inotify_source_reports_moved_files(tmp_path):
+    try:
+        source = InotifySource(str(tmp_path))
+    except OSError:
+        pytest.skip("inotify is not available")
+    try:
+        add_image(tmp_path, 'a.jpg', 0)
+        names = source.wait(1.0)
+        assert 'a.jpg' in names
+    finally:
+        source.close()
+
+
+def test_renders_a_collage_when_a_group_fills(watched):
+    images_dir = Path(watched.images_dir)
+    add_image(images_dir, 'existing.jpg', 9)
+    watcher = watcher_for(watched)
+    add_image(images_dir, 'a.jpg', 0)
+    assert poll_until(watcher, 1, attempts=5) == []  # One new image, and the existing one is ignored
+
+    add_image(images_dir, 'b.jpg', 1)
+    outputs = poll_until(watcher, 1)
+    assert len(outputs) == 1
+    assert watched.is_image_used('a.jpg') and watched.is_image_used('b.jpg')
+    assert not watched.is_image_used('existing.jpg')
+
+
+def test_window_flushes_an_incomplete_group(watched):
+    watcher = watcher_for(watched, group_size=6, window=0.0)
+    add_image(Path(watched.images_dir), 'a.jpg', 0)
+    assert len(poll_until(watcher, 1)) == 1
+
+
+def test_copies_of_used_images_are_skipped(watched):
+    images_dir = Path(watched.images_dir)
+    watcher = watcher_for(watched, group_size=1)
+    add_image(images_dir, 'a.jpg', 0)
+    assert len(poll_until(watcher, 1)) == 1
+
+    shutil.copy(images_dir / 'a.jpg', images_dir / '.copy.part')
+    shutil.move(str(images_dir / '.copy.part'), str(images_dir / 'copy of a.jpg'))
+    assert poll_until(watcher, 1, attempts=5) == []
@@ -0,0 +1,277 @@
+"""Memory-mapped thumbnail atlas for photo-mosaic and contact-sheet modes.
+
+A corpus of images is decoded and shrunk once into fixed-size cells stored in a
+single .npy file. Renders then map that file and read thumbnails directly, with no
+decoding, and composite whole rows of cells with array slicing instead of one paste
+per tile. This is what makes posters of 10k+ thumbnails practical.
+- TileAtlas: Builds, updates and opens an atlas.
+- grid_view: A writable (rows, columns, cell) view of a canvas with spacing between cells.
+- contact_sheet: Lays atlas tiles out in a regular grid.
+- photo_mosaic: Recreates a target image from the atlas tiles that best match its colors.
+"""
+import json
+import os
+from typing import Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from tile_transform import prepare_source
+
+ATLAS_FILE = 'atlas.npy'
+MEANS_FILE = 'means.npy'
+INDEX_FILE = 'index.json'
+
+
+def _source_key(source: str) -> str:
+    """Identifies a version of a source file, so changed files are re-shrunk on update."""
+    stat = os.stat(source)
+    return f"{os.path.abspath(source)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class TileAtlas:
+    """A directory holding thumbnails of equal size in one memory-mapped array.
+
+    The directory contains atlas.npy (uint8, shape (n, cell_height, cell_width, 3)),
+    means.npy (the mean RGB color of each tile, used to match mosaic cells) and
+    index.json (the cell size and the source of each tile).
+
+    Attributes:
+        path (str): The atlas directory.
+        cell_size (Tuple[int, int]): The width and height of every tile.
+        sources (List[str]): The source key of each tile, in atlas order.
+        tiles (np.memmap): The read-only tile array.
+        means (np.ndarray): The mean color of each tile, shape (n, 3).
+    """
+    def __init__(self, path: str):
+        """Opens an existing atlas.
+
+        Args:
+            path (str): The atlas directory.
+
+        Raises:
+            FileNotFoundError: If the directory does not contain an atlas.
+        """
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.cell_size = tuple(index['cell_size'])
+        self.sources = index['sources']
+        self.tiles = np.load(os.path.join(path, ATLAS_FILE), mmap_mode='r')
+        self.means = np.load(os.path.join(path, MEANS_FILE))
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    @staticmethod
+    def shrink(image: Image, cell_size: Tuple[int, int]) -> Image:
+        """Center-crops and shrinks an image to a cell.
+
+        Args:
+            image (Image): The source image.
+            cell_size (Tuple[int, int]): The width and height of the cell.
+
+        Returns:
+            Image: An RGB image of size cell_size.
+        """
+        image = prepare_source(image, cell_size, reducing_gap=2.0)
+        return ImageOps.fit(image.convert('RGB'), cell_size, Image.Resampling.LANCZOS)
+
+    @classmethod
+    def build(cls, path: str, image_files: Sequence[str], cell_size: Tuple[int, int] = (64, 64),
+              open_image=Image.open) -> 'TileAtlas':
+        """Builds an atlas, or updates an existing one with new and changed files.
+
+        Tiles of unchanged files are copied from the previous atlas rather than decoded
+        again. Files that cannot be opened are skipped with a message.
+
+        Args:
+            path (str): The atlas directory (created if needed).
+            image_files (Sequence[str]): The paths of the images, in atlas order.
+            cell_size (Tuple[int, int], optional): The width and height of every tile. Defaults to (64, 64).
+            open_image (Callable, optional): Opens an image file. Defaults to Image.open.
+
+        Returns:
+            TileAtlas: The opened atlas.
+
+        Raises:
+            ValueError: If none of the images can be read.
+        """
+        os.makedirs(path, exist_ok=True)
+        previous = {}
+        try:
+            existing = cls(path)
+            if existing.cell_size == tuple(cell_size):
+                previous = {key: i for i, key in enumerate(existing.sources)}
+        except (FileNotFoundError, ValueError, KeyError):
+            existing = None
+
+        keys, tiles, reused = [], [], 0
+        for image_file in image_files:
+            try:
+                key = _source_key(image_file)
+                if key in previous:
+                    tiles.append(previous[key])
+                    reused += 1
+                else:
+                    with open_image(image_file) as image:
+                        tiles.append(np.asarray(cls.shrink(image, cell_size)))
+            except Exception as e:
+                print(f"Error adding {image_file} to the atlas: {e}")
+                continue
+            keys.append(key)
+        if not tiles:
+            raise ValueError("no readable tile images")
+
+        width, height = cell_size
+        # Write next to the old atlas, which may still be mapped, then swap atomically
+        temp_path = os.path.join(path, ATLAS_FILE + '.tmp')
+        array = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.uint8,
+                                          shape=(len(tiles), height, width, 3))
+        for i, tile in enumerate(tiles):
+            array[i] = existing.tiles[tile] if isinstance(tile, int) else tile
+        means = array.reshape(len(tiles), -1, 3).mean(axis=1, dtype=np.float64).astype(np.float32)
+        array.flush()
+        del array
+
+        np.save(os.path.join(path, MEANS_FILE + '.tmp.npy'), means)
+        os.replace(temp_path, os.path.join(path, ATLAS_FILE))
+        os.replace(os.path.join(path, MEANS_FILE + '.tmp.npy'), os.path.join(path, MEANS_FILE))
+        with open(os.path.join(path, INDEX_FILE + '.tmp'), 'w') as f:
+            json.dump({'cell_size': list(cell_size), 'sources': keys}, f)
+        os.replace(os.path.join(path, INDEX_FILE + '.tmp'), os.path.join(path, INDEX_FILE))
+
+        print(f"Tile atlas {path}: {len(keys)} tiles ({len(keys) - reused} new, {reused} reused)")
+        return cls(path)
+
+
+def grid_view(canvas: np.ndarray, cell_size: Tuple[int, int], grid_size: Tuple[int, int],
+              spacing: int = 0) -> np.ndarray:
+    """Views a canvas as a grid of cells, so all cells can be written in one assignment.
+
+    Args:
+        canvas (np.ndarray): A C-contiguous (height, width, channels) array.
+        cell_size (Tuple[int, int]): The width and height of a cell.
+        grid_size (Tuple[int, int]): The number of columns and rows.
+        spacing (int, optional): The gap between cells and around the grid. Defaults to 0.
+
+    Returns:
+        np.ndarray: A writable view of shape (rows, columns, cell_height, cell_width, channels).
+    """
+    width, height = cell_size
+    columns, rows = grid_size
+    row_stride, pixel_stride, channel_stride = canvas.strides
+    origin = canvas[spacing:, spacing:]
+    return np.lib.stride_tricks.as_strided(
+        origin, shape=(rows, columns, height, width, canvas.shape[2]),
+        strides=(row_stride * (height + spacing), pixel_stride * (width + spacing),
+                 row_stride, pixel_stride, channel_stride), writeable=True)
+
+
+def _grid_canvas(cell_size: Tuple[int, int], grid_size: Tuple[int, int], spacing: int,
+                 background: Tuple[int, int, int]) -> np.ndarray:
+    """Allocates a canvas for a grid of cells."""
+    width, height = cell_size
+    columns, rows = grid_size
+    canvas = np.empty((rows * (height + spacing) + spacing, columns * (width + spacing) + spacing, 3), np.uint8)
+    canvas[...] = background
+    return canvas
+
+
+def contact_sheet(atlas: TileAtlas, columns: int, indices: Sequence[int] = None, spacing: int = 2,
+                  background: Tuple[int, int, int] = (255, 255, 255)) -> Image:
+    """Lays atlas tiles out in a regular grid, in order.
+
+    Args:
+        atlas (TileAtlas): The atlas.
+        columns (int): The number of columns.
+        indices (Sequence[int], optional): The tiles to show. Defaults to every tile.
+        spacing (int, optional): The gap between tiles, in pixels. Defaults to 2.
+        background (Tuple[int, int, int], optional): The color of the gaps. Defaults to white.
+
+    Returns:
+        Image: The contact sheet.
+
+    Raises:
+        ValueError: If there are no tiles to show.
+    """
+    indices = np.arange(len(atlas)) if indices is None else np.asarray(indices)
+    if not len(indices):
+        raise ValueError("the tile atlas is empty")
+    rows = -(-len(indices) // columns)
+    canvas = _grid_canvas(atlas.cell_size, (columns, rows), spacing, background)
+    cells = grid_view(canvas, atlas.cell_size, (columns, rows), spacing)
+
+    # One row of cells per assignment, reading only the selected tiles from the memmap
+    for row in range(rows):
+        row_indices = indices[row * columns:(row + 1) * columns]
+        cells[row, :len(row_indices)] = atlas.tiles[row_indices]
+    return Image.fromarray(canvas)
+
+
+def match_tiles(targets: np.ndarray, means: np.ndarray, chunk: int = 4096) -> np.ndarray:
+    """Finds the tile whose mean color is closest to each target color.
+
+    Args:
+        targets (np.ndarray): The target colors, shape (n, 3).
+        means (np.ndarray): The mean color of each tile, shape (m, 3).
+        chunk (int, optional): The number of targets compared at once, to bound memory. Defaults to 4096.
+
+    Returns:
+        np.ndarray: The index of the best tile for each target.
+
+    Raises:
+        ValueError: If there are no tiles to choose from.
+    """
+    if not len(means):
+        raise ValueError("the tile atlas is empty")
+    targets = targets.astype(np.float32)
+    means = means.astype(np.float32)
+    # |t - m|^2 = |t|^2 - 2 t.m + |m|^2, and |t|^2 does not change the argmin
+    mean_norms = (means ** 2).sum(axis=1)
+    best = np.empty(len(targets), dtype=np.intp)
+    for start in range(0, len(targets), chunk):
+        block = targets[start:start + chunk]
+        best[start:start + chunk] = np.argmin(mean_norms - 2 * block @ means.T, axis=1)
+    return best
+
+
+def photo_mosaic(atlas: TileAtlas, target: Image, columns: int, tint: float = 0.0,
+                 spacing: int = 0) -> Image:
+    """Recreates an image from atlas tiles.
+
+    The target is shrunk to one pixel per cell and each cell gets the tile with the
+    closest mean color, optionally blended towards the cell's color.
+
+    Args:
+        atlas (TileAtlas): The atlas.
+        target (Image): The image to recreate.
+        columns (int): The number of tiles across; rows follow the target's aspect ratio.
+        tint (float, optional): How much each tile is blended with its cell's color (0 to 1). Defaults to 0.
+        spacing (int, optional): The gap between tiles, in pixels. Defaults to 0.
+
+    Returns:
+        Image: The mosaic.
+
+    Raises:
+        ValueError: If the atlas is empty.
+    """
+    if not len(atlas):
+        raise ValueError("the tile atlas is empty")
+    width, height = atlas.cell_size
+    rows = max(1, round(columns * (target.height / target.width) * (width / height)))
+    colors = np.asarray(target.convert('RGB').resize((columns, rows), Image.Resampling.BOX))
+    choice = match_tiles(colors.reshape(-1, 3), atlas.means)
+
+    canvas = _grid_canvas(atlas.cell_size, (columns, rows), spacing, (0, 0, 0))
+    cells = grid_view(canvas, atlas.cell_size, (columns, rows), spacing)
+    choice = choice.reshape(rows, columns)
+    # One row of cells per assignment, so memory stays bounded for huge posters
+    for row in range(rows):
+        tiles = atlas.tiles[choice[row]]
+        if tint > 0:
+            cell_colors = colors[row, :, None, None, :].astype(np.float32)
+            tiles = (tiles * (1 - tint) + cell_colors * tint + 0.5).astype(np.uint8)
+        cells[row] = tiles
+    return Image.fromarray(canvas)
+
@@ -0,0 +1,252 @@
+"""Compiled tile effect pipeline for the collage generator.
+
+This file turns the effect settings of a style preset (border, drop shadow, ...) into
+a pipeline that is compiled once per render and then draws every tile's effects in
+place, into a single output buffer.
+- TILE_EFFECTS: A registry of the available effects, keyed by name.
+- DEFAULT_EFFECT_CHAIN: The effects applied when a style does not list its own 'effects'.
+- register_effect: A decorator adding a TileEffect subclass to TILE_EFFECTS.
+- TileEffect: The base class of all effects.
+- EffectPipeline: The compiled chain of effects for one style.
+"""
+from functools import lru_cache
+from typing import List, Tuple
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from tile_transform import TileTransform
+
+TILE_EFFECTS = {}
+
+# Effects are drawn in this order; 'under' effects end up below the image
+DEFAULT_EFFECT_CHAIN = ('border', 'shadow')
+
+
+def register_effect(name: str):
+    """Registers a TileEffect subclass under a name.
+
+    Args:
+        name (str): The name used in a style's 'effects' list.
+
+    Returns:
+        Callable: A class decorator.
+    """
+    def decorator(cls):
+        cls.name = name
+        TILE_EFFECTS[name] = cls
+        return cls
+    return decorator
+
+
+class TileEffect:
+    """The base class of tile effects.
+
+    An effect draws directly into the tile's output buffer, either below the image
+    (layer 'under') or on top of it (layer 'over'). Effects must not allocate a new
+    full-size image; small cached masks are fine.
+
+    Attributes:
+        name (str): The registry name of the effect.
+        layer (str): 'under' or 'over'.
+    """
+    name = None
+    layer = 'under'
+
+    @classmethod
+    def from_style(cls, style: dict):
+        """Builds the effect from a style preset.
+
+        Args:
+            style (dict): A dictionary containing the style properties for the collage.
+
+        Returns:
+            TileEffect: The configured effect, or None if the style disables it.
+        """
+        return cls()
+
+    def applies(self, source_has_alpha: bool) -> bool:
+        """Checks whether the effect can change the final tile.
+
+        Args:
+            source_has_alpha (bool): Whether the source image has transparent areas.
+
+        Returns:
+            bool: False if the effect would be invisible and can be skipped.
+        """
+        return True
+
+    def draw(self, canvas: Image, transform: TileTransform, origin: Tuple[int, int]):
+        """Draws the effect into the output buffer, in place.
+
+        Args:
+            canvas (Image): The RGBA output buffer covering the tile's bounding box.
+            transform (TileTransform): The placement of the tile.
+            origin (Tuple[int, int]): The collage position of the buffer's top-left corner.
+        """
+        raise NotImplementedError
+
+
+@register_effect('border')
+class BorderEffect(TileEffect):
+    """A solid card of the border color behind the whole frame."""
+    layer = 'under'
+
+    def __init__(self, color: str):
+        self.color = color
+
+    @classmethod
+    def from_style(cls, style: dict):
+        if style.get('border_size', 0) <= 0:
+            return None
+        return cls(style['border_color'])
+
+    def draw(self, canvas: Image, transform: TileTransform, origin: Tuple[int, int]):
+        ImageDraw.Draw(canvas).polygon(transform.corners(origin=origin), fill=self.color)
+
+
+@lru_cache(maxsize=256)
+def shadow_mask(tile_size: Tuple[int, int], opacity: int = 40, offset: int = 4,
+                blur_radius: int = 3) -> Image:
+    """Builds the blurred drop-shadow mask of an unrotated tile.
+
+    This is the shadow of add_drop_shadow: a rectangle inset by 2 pixels, shifted by
+    `offset`, blurred and clipped to the tile. Masks are cached per tile size because
+    the same cells come back across collages and animation frames.
+
+    Args:
+        tile_size (Tuple[int, int]): The size of the scaled image.
+        opacity (int, optional): The opacity of the shadow. Defaults to 40.
+        offset (int, optional): The shadow offset in pixels. Defaults to 4.
+        blur_radius (int, optional): The Gaussian blur radius; 0 gives a hard-edged shadow.
+            Defaults to 3.
+
+    Returns:
+        Image: An 'L' mask of size tile_size.
+    """
+    width, height = tile_size
+    mask = Image.new('L', tile_size, 0)
+    ImageDraw.Draw(mask).rectangle([(2 + offset, 2 + offset), (width - 2 + offset, height - 2 + offset)],
+                                   fill=opacity)
+    if not blur_radius:
+        return mask
+    return mask.filter(ImageFilter.GaussianBlur(blur_radius))
+
+
+@register_effect('shadow')
+class ShadowEffect(TileEffect):
+    """A soft drop shadow behind the image, clipped to the image area.
+
+    Styles may set 'shadow_opacity' (default 40) and 'shadow_blur', the blur radius
+    (default 3; 0 draws a cheaper hard-edged shadow).
+    """
+    layer = 'under'
+
+    def __init__(self, opacity: int = 40, blur_radius: int = 3):
+        self.opacity = opacity
+        self.blur_radius = blur_radius
+
+    @classmethod
+    def from_style(cls, style: dict):
+        if not style.get('shadow'):
+            return None
+        return cls(style.get('shadow_opacity', 40), style.get('shadow_blur', 3))
+
+    def applies(self, source_has_alpha: bool) -> bool:
+        # The shadow sits entirely under the image, so opaque images hide it
+        return source_has_alpha
+
+    def draw(self, canvas: Image, transform: TileTransform, origin: Tuple[int, int]):
+        mask = shadow_mask(transform.tile_size, self.opacity, blur_radius=self.blur_radius)
+        border_size = transform.border_size
+
+        if transform.is_axis_aligned:
+            position = (transform.bounds()[0] - origin[0] + border_size,
+                        transform.bounds()[1] - origin[1] + border_size)
+            canvas.paste((0, 0, 0, 255), position + (position[0] + mask.width, position[1] + mask.height), mask)
+            return
+
+        # Map the cached mask through the tile's own affine (the mask is the image
+        # area, so its "source" is the unscaled tile size)
+        rotated = mask.transform(canvas.size, Image.Transform.AFFINE,
+                                 transform.inverse_coefficients(transform.tile_size, origin),
+                                 resample=Image.Resampling.BILINEAR)
+        canvas.paste((0, 0, 0, 255), (0, 0), rotated)
+
+
+class EffectPipeline:
+    """The effect chain of a style preset, compiled once per render.
+
+    Attributes:
+        effects (List[TileEffect]): The enabled effects, in drawing order.
+    """
+    def __init__(self, effects: List[TileEffect]):
+        """Initializes the EffectPipeline.
+
+        Args:
+            effects (List[TileEffect]): The enabled effects, in drawing order.
+        """
+        self.effects = effects
+
+    @classmethod
+    def compile(cls, style: dict) -> 'EffectPipeline':
+        """Compiles the effect chain of a style preset.
+
+        The chain is the style's 'effects' list if present, DEFAULT_EFFECT_CHAIN
+        otherwise. Effects the style disables are dropped here, once, rather than
+        being checked for every tile.
+
+        Args:
+            style (dict): A dictionary containing the style properties for the collage.
+
+        Returns:
+            EffectPipeline: The compiled pipeline.
+        """
+        effects = []
+        for name in style.get('effects', DEFAULT_EFFECT_CHAIN):
+            if name not in TILE_EFFECTS:
+                raise ValueError(f"Unknown tile effect: {name}")
+            effect = TILE_EFFECTS[name].from_style(style)
+            if effect is not None:
+                effects.append(effect)
+        return cls(effects)
+
+    def render(self, tile: Image, position: Tuple[int, int], transform: TileTransform,
+               source_has_alpha: bool) -> Tuple[Image, Tuple[int, int]]:
+        """Computes the final tile, effects and alpha included.
+
+        When no effect applies the resampled tile is returned untouched. Otherwise a
+        single RGBA buffer covering the frame is allocated and every effect, as well as
+        the image itself, is drawn into it in place.
+
+        Args:
+            tile (Image): The resampled image returned by resample_tile.
+            position (Tuple[int, int]): The collage position of the tile.
+            transform (TileTransform): The placement of the tile.
+            source_has_alpha (bool): Whether the source image has transparent areas.
+
+        Returns:
+            Tuple[Image, Tuple[int, int]]: The final tile and its collage position.
+        """
+        active = [effect for effect in self.effects if effect.applies(source_has_alpha)]
+        if not active:
+            return tile, position
+
+        left, top, right, bottom = transform.bounds()
+        origin = (left, top)
+        canvas = Image.new('RGBA', (right - left, bottom - top), (0, 0, 0, 0))
+
+        for effect in active:
+            if effect.layer == 'under':
+                effect.draw(canvas, transform, origin)
+
+        dest = (position[0] - left, position[1] - top)
+        if tile.mode == 'RGBA':
+            canvas.alpha_composite(tile, dest=dest)
+        else:
+            canvas.paste(tile, dest)
+
+        for effect in active:
+            if effect.layer == 'over':
+                effect.draw(canvas, transform, origin)
+
+        return canvas, origin
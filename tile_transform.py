@@ -0,0 +1,282 @@
+"""Fused tile transform for the collage generator.
+
+This file folds the per-tile rotation and translation into a single affine matrix,
+so a tile is resized once with a proper downscaling filter and then rotated
+straight into its destination region on the canvas.
+- TileTransform: The geometry of one placed tile (scaled size, border, rotation and canvas position).
+- fit_scale: The downscale-only factor that fits a source inside a cell.
+- prepare_source: Cheaply shrinks a freshly opened source (JPEG draft / box reduce) before the final resample.
+- transform_settings: The resampling settings of a TRANSFORM_QUALITY preset, or custom ones.
+- resample_tile: Resamples a source into the destination region described by a TileTransform.
+"""
+import math
+from typing import List, Tuple
+
+from PIL import Image
+
+from config import TRANSFORM_QUALITY
+
+
+def fit_scale(source_size: Tuple[int, int], cell_size: Tuple[int, int]) -> float:
+    """Computes the scale factor that fits a source inside a cell.
+
+    Images are only ever scaled down, preserving their aspect ratio.
+
+    Args:
+        source_size (Tuple[int, int]): The width and height of the source image.
+        cell_size (Tuple[int, int]): The width and height available in the cell.
+
+    Returns:
+        float: The scale factor (at most 1.0).
+    """
+    width, height = source_size
+    cell_width, cell_height = max(1, cell_size[0]), max(1, cell_size[1])
+    return min(1.0, cell_width / width, cell_height / height)
+
+
+def has_alpha(image: Image.Image) -> bool:
+    """Checks whether an image carries transparency information.
+
+    Args:
+        image (Image): The image to check.
+
+    Returns:
+        bool: True if the image has an alpha channel or a transparent palette entry.
+    """
+    return image.mode in ('RGBA', 'LA', 'PA', 'RGBa', 'La') or \
+        (image.mode == 'P' and 'transparency' in image.info)
+
+
+class TileTransform:
+    """The geometry of a single tile placed on the collage canvas.
+
+    A tile is described in "frame space": a rectangle made of the scaled image plus
+    `border_size` pixels on every side. Frame space maps onto the canvas through a
+    rotation about the frame centre followed by a translation to `center`, so the
+    whole placement is one affine matrix.
+
+    Attributes:
+        tile_size (Tuple[int, int]): The size of the scaled image inside the frame.
+        border_size (int): The width of the border around the scaled image.
+        rotation (float): The counter-clockwise rotation in degrees.
+        center (Tuple[float, float]): The canvas position of the frame centre.
+    """
+    def __init__(self, tile_size: Tuple[int, int], border_size: int, rotation: float,
+                 center: Tuple[float, float]):
+        """Initializes the TileTransform.
+
+        Args:
+            tile_size (Tuple[int, int]): The size of the scaled image inside the frame.
+            border_size (int): The width of the border around the scaled image.
+            rotation (float): The counter-clockwise rotation in degrees.
+            center (Tuple[float, float]): The canvas position of the frame centre.
+        """
+        self.tile_size = tile_size
+        self.border_size = border_size
+        self.rotation = rotation
+        self.center = center
+
+        radians = math.radians(rotation)
+        self._cos = math.cos(radians)
+        self._sin = math.sin(radians)
+
+    @classmethod
+    def for_cell(cls, source_size: Tuple[int, int], cell: Tuple[int, int, int, int],
+                 border_size: int, rotation: float) -> 'TileTransform':
+        """Builds the transform that places a source inside a layout cell.
+
+        The tile is centred on the cell the same way the unrotated tile used to be
+        pasted, so unrotated tiles land on exactly the same pixels as before.
+
+        Args:
+            source_size (Tuple[int, int]): The width and height of the source image.
+            cell (Tuple[int, int, int, int]): The cell (x, y, w, h) in pixels, border excluded.
+            border_size (int): The width of the border around the scaled image.
+            rotation (float): The counter-clockwise rotation in degrees.
+
+        Returns:
+            TileTransform: The transform for the tile.
+        """
+        x, y, w, h = cell
+        scale = fit_scale(source_size, (w, h))
+        tile_size = (max(1, int(source_size[0] * scale)), max(1, int(source_size[1] * scale)))
+        frame_width = tile_size[0] + 2 * border_size
+        frame_height = tile_size[1] + 2 * border_size
+
+        left = x + (w - frame_width) // 2
+        top = y + (h - frame_height) // 2
+        return cls(tile_size, border_size, rotation,
+                   (left + frame_width / 2, top + frame_height / 2))
+
+    @property
+    def frame_size(self) -> Tuple[int, int]:
+        """Tuple[int, int]: The size of the frame (scaled image plus border)."""
+        return (self.tile_size[0] + 2 * self.border_size,
+                self.tile_size[1] + 2 * self.border_size)
+
+    @property
+    def is_axis_aligned(self) -> bool:
+        """bool: True if the tile is not rotated (or rotated by a multiple of 360 degrees)."""
+        return self.rotation % 360 == 0
+
+    def to_canvas(self, u: float, v: float) -> Tuple[float, float]:
+        """Maps a frame-space point onto the canvas.
+
+        Args:
+            u (float): The horizontal frame-space coordinate.
+            v (float): The vertical frame-space coordinate.
+
+        Returns:
+            Tuple[float, float]: The canvas coordinates of the point.
+        """
+        frame_width, frame_height = self.frame_size
+        du = u - frame_width / 2
+        dv = v - frame_height / 2
+        return (self.center[0] + self._cos * du + self._sin * dv,
+                self.center[1] - self._sin * du + self._cos * dv)
+
+    def corners(self, box: Tuple[float, float, float, float] = None,
+                origin: Tuple[int, int] = (0, 0)) -> List[Tuple[float, float]]:
+        """Maps the corners of a frame-space box onto the canvas.
+
+        Args:
+            box (Tuple[float, float, float, float], optional): The box (left, top, right, bottom)
+                in frame space. Defaults to the whole frame.
+            origin (Tuple[int, int], optional): A canvas offset subtracted from every corner, to
+                get coordinates local to a region. Defaults to (0, 0).
+
+        Returns:
+            List[Tuple[float, float]]: The four corners in drawing order.
+        """
+        if box is None:
+            box = (0, 0) + self.frame_size
+        left, top, right, bottom = box
+        points = [self.to_canvas(left, top), self.to_canvas(right, top),
+                  self.to_canvas(right, bottom), self.to_canvas(left, bottom)]
+        return [(px - origin[0], py - origin[1]) for px, py in points]
+
+    def bounds(self) -> Tuple[int, int, int, int]:
+        """Computes the integer canvas bounding box of the rotated frame.
+
+        Returns:
+            Tuple[int, int, int, int]: The bounding box (left, top, right, bottom).
+        """
+        points = self.corners()
+        xs = [px for px, _ in points]
+        ys = [py for _, py in points]
+        # Round before flooring so float noise on axis-aligned corners does not grow the box
+        return (math.floor(round(min(xs), 6)), math.floor(round(min(ys), 6)),
+                math.ceil(round(max(xs), 6)), math.ceil(round(max(ys), 6)))
+
+    def inverse_coefficients(self, source_size: Tuple[int, int],
+                             origin: Tuple[int, int]) -> Tuple[float, ...]:
+        """Computes the affine coefficients for `Image.transform`.
+
+        The coefficients map a pixel of an output region whose top-left corner sits at
+        `origin` on the canvas back to the source image, combining the inverse rotation,
+        the border offset and the source-to-tile scale.
+
+        Args:
+            source_size (Tuple[int, int]): The size of the (possibly pre-reduced) source.
+            origin (Tuple[int, int]): The canvas position of the output region.
+
+        Returns:
+            Tuple[float, ...]: The six affine coefficients (a, b, c, d, e, f).
+        """
+        scale_x = self.tile_size[0] / source_size[0]
+        scale_y = self.tile_size[1] / source_size[1]
+        frame_width, frame_height = self.frame_size
+        dx = origin[0] - self.center[0]
+        dy = origin[1] - self.center[1]
+        cos, sin = self._cos, self._sin
+
+        return (cos / scale_x, -sin / scale_x,
+                (cos * dx - sin * dy + frame_width / 2 - self.border_size) / scale_x,
+                sin / scale_y, cos / scale_y,
+                (sin * dx + cos * dy + frame_height / 2 - self.border_size) / scale_y)
+
+
+def prepare_source(image: Image.Image, target_size: Tuple[int, int],
+                   reducing_gap: float) -> Image.Image:
+    """Cheaply shrinks a source that is much larger than its target.
+
+    JPEG sources are decoded at a reduced DCT scale (this only works on images that
+    have not been loaded yet), other formats go through an integer box reduce. The
+    result stays at least `reducing_gap` times larger than the target so the final
+    resample still has enough detail to work with.
+
+    Args:
+        image (Image): The opened source image.
+        target_size (Tuple[int, int]): The size the image will finally be resampled to.
+        reducing_gap (float): How many times larger than the target the result must stay.
+
+    Returns:
+        Image: The reduced image (or the original if no reduction applies).
+    """
+    if not reducing_gap:
+        return image
+
+    wanted = (math.ceil(target_size[0] * reducing_gap), math.ceil(target_size[1] * reducing_gap))
+    if image.format == 'JPEG':
+        image.draft(image.mode, wanted)
+
+    factor = min(image.width // wanted[0], image.height // wanted[1])
+    if factor >= 2:
+        image = image.reduce(factor)
+    return image
+
+
+def transform_settings(quality) -> dict:
+    """Resolves the resampling settings of a tile.
+
+    Args:
+        quality (str or dict): A key of TRANSFORM_QUALITY, or settings with the same keys
+            (resize_filter, affine_filter, reducing_gap), such as those chosen for a
+            latency budget (see render_budget).
+
+    Returns:
+        dict: The settings.
+    """
+    return TRANSFORM_QUALITY[quality] if isinstance(quality, str) else quality
+
+
+def resample_tile(image: Image.Image, transform: TileTransform,
+                  quality='quality') -> Tuple[Image.Image, Tuple[int, int]]:
+    """Resamples a source image straight into its destination region.
+
+    Unrotated tiles are produced by a single resize. Rotated tiles are resized to the
+    tile size the same way, then rotated and translated by one affine transform sized
+    to the bounding box of the rotated frame. The affine pass samples its source
+    without any low-pass prefilter, so it must not also downscale: a source several
+    times larger than its tile would alias.
+
+    Args:
+        image (Image): The opened source image.
+        transform (TileTransform): The placement of the tile.
+        quality (str or dict, optional): A key of TRANSFORM_QUALITY, or custom settings
+            (see transform_settings). Defaults to 'quality'.
+
+    Returns:
+        Tuple[Image, Tuple[int, int]]: The resampled image and the canvas position of its
+        top-left corner. Rotated tiles are always RGBA so the corners stay transparent.
+    """
+    settings = transform_settings(quality)
+    image = prepare_source(image, transform.tile_size, settings['reducing_gap'])
+    transparent = has_alpha(image)
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if transparent else 'RGB')
+    if image.size != transform.tile_size:
+        image = image.resize(transform.tile_size, getattr(Image.Resampling, settings['resize_filter']))
+
+    if transform.is_axis_aligned:
+        left, top = transform.bounds()[:2]
+        return image, (left + transform.border_size, top + transform.border_size)
+
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+    left, top, right, bottom = transform.bounds()
+    tile = image.transform((right - left, bottom - top), Image.Transform.AFFINE,
+                           transform.inverse_coefficients(image.size, (left, top)),
+                           resample=getattr(Image.Resampling, settings['affine_filter']))
+    return tile, (left, top)
@@ -0,0 +1,273 @@
+"""Watch-folder mode for the collage generator.
+
+This file renders collages incrementally while images arrive in a directory, for
+example camera uploads. Only files that appear after the watch starts are touched,
+and each file is used at most once.
+- FolderWatcher: Debounces new arrivals and renders a collage whenever a group fills
+  up or a time window closes.
+- InotifySource: New-file notifications from Linux inotify (through libc, no extra dependency).
+- PollingSource: A fallback that only lists the directory when its mtime changes.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from typing import List
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.heic')
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = getattr(os, 'O_NONBLOCK', 0)
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifySource:
+    """Reports files that finish being written to, or are moved into, a directory.
+
+    Attributes:
+        directory (str): The watched directory.
+    """
+    def __init__(self, directory: str):
+        """Initializes the InotifySource.
+
+        Args:
+            directory (str): The directory to watch.
+
+        Raises:
+            OSError: If inotify is not available on this platform.
+        """
+        self.directory = directory
+        library = ctypes.util.find_library('c')
+        libc = ctypes.CDLL(library, use_errno=True) if library else None
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify is not available")
+
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self._fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout: float) -> List[str]:
+        """Waits for new files.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait.
+
+        Returns:
+            List[str]: The names of the files reported since the last call.
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        names, offset = [], 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if name:
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self):
+        """Stops watching."""
+        os.close(self._fd)
+
+
+class PollingSource:
+    """Reports new files by listing the directory, but only when it has changed.
+
+    Creating, renaming or deleting an entry updates the directory's mtime, so an
+    unchanged mtime means nothing new arrived and the listing is skipped.
+
+    Attributes:
+        directory (str): The watched directory.
+    """
+    def __init__(self, directory: str, known: set):
+        """Initializes the PollingSource.
+
+        Args:
+            directory (str): The directory to watch.
+            known (set): The names that are already known and must not be reported.
+        """
+        self.directory = directory
+        self._known = set(known)
+        self._mtime = os.stat(directory).st_mtime_ns
+
+    def wait(self, timeout: float) -> List[str]:
+        """Waits for new files.
+
+        Args:
+            timeout (float): The number of seconds to wait before checking.
+
+        Returns:
+            List[str]: The names of the files that appeared since the last call.
+        """
+        time.sleep(timeout)
+        mtime = os.stat(self.directory).st_mtime_ns
+        if mtime == self._mtime:
+            return []
+        self._mtime = mtime
+
+        names = [entry.name for entry in os.scandir(self.directory) if entry.name not in self._known]
+        self._known.update(names)
+        return names
+
+    def close(self):
+        """Stops watching."""
+
+
+class FolderWatcher:
+    """Renders collages from images as they arrive in the generator's images_dir.
+
+    A new file is considered complete once its size and mtime have not changed for
+    `debounce` seconds. Complete files are queued in arrival order; a collage is
+    rendered as soon as `group_size` files are queued, or when the oldest queued file
+    has waited `window` seconds.
+
+    Attributes:
+        generator (CollageGenerator): The generator used to render collages.
+        group_size (int): The number of images per collage.
+        window (float): The maximum number of seconds an image waits for its group to fill.
+        debounce (float): The number of seconds a file must stay unchanged.
+        render_options (dict): Keyword arguments passed to create_single_collage.
+    """
+    def __init__(self, generator, dimensions, style: dict, group_size: int = 6,
+                 window: float = 60.0, debounce: float = 2.0, poll_interval: float = 1.0,
+                 process_existing: bool = False, **render_options):
+        """Initializes the FolderWatcher.
+
+        Args:
+            generator (CollageGenerator): The generator; its images_dir is watched.
+            dimensions (Tuple[int, int]): A tuple containing the width and height of the collages.
+            style (dict): A dictionary containing the style properties for the collages.
+            group_size (int, optional): The number of images per collage. Defaults to 6.
+            window (float, optional): The maximum number of seconds an image waits for its
+                group to fill. Defaults to 60.0.
+            debounce (float, optional): The number of seconds a file must stay unchanged
+                before it is used. Defaults to 2.0.
+            poll_interval (float, optional): The wake-up interval in seconds. Defaults to 1.0.
+            process_existing (bool, optional): Whether images already in the directory are
+                queued too. Defaults to False (only new arrivals are used).
+            **render_options: Extra keyword arguments for create_single_collage.
+        """
+        self.generator = generator
+        self.dimensions = dimensions
+        self.style = style
+        self.group_size = group_size
+        self.window = window
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.render_options = render_options
+
+        self._pending = {}  # name -> (size, mtime_ns, last change time)
+        self._ready = []    # (name, ready time), in arrival order
+        self._stopped = False
+
+        existing = set(os.listdir(generator.images_dir))
+        self._seen = set()
+        if process_existing:
+            now = time.monotonic()
+            for name in sorted(existing):
+                self._track(name, now)
+        else:
+            self._seen.update(existing)
+
+        try:
+            self.source = InotifySource(generator.images_dir)
+        except OSError:
+            self.source = PollingSource(generator.images_dir, existing)
+
+    def _track(self, name: str, now: float):
+        """Starts debouncing a newly reported file."""
+        if name in self._seen or name.startswith('.') or not name.lower().endswith(IMAGE_EXTENSIONS):
+            return
+        self._seen.add(name)
+        self._pending[name] = (None, None, now)
+
+    def _settle(self, now: float):
+        """Moves pending files that stopped changing to the ready queue."""
+        for name, (size, mtime, changed_at) in list(self._pending.items()):
+            try:
+                stat = os.stat(os.path.join(self.generator.images_dir, name))
+            except FileNotFoundError:
+                del self._pending[name]
+                continue
+
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                self._pending[name] = (stat.st_size, stat.st_mtime_ns, now)
+            elif stat.st_size > 0 and now - changed_at >= self.debounce:
+                del self._pending[name]
+                # Skip copies of images that were already used (possibly by an earlier run)
+                if not self.generator.is_image_used(name):
+                    self._ready.append((name, now))
+
+    def _render(self, names: List[str]) -> str:
+        """Renders one collage and marks its images as used."""
+        try:
+            output_path = self.generator.create_single_collage(
+                names, self.dimensions, style=self.style, **self.render_options)
+        except Exception as e:
+            print(f"Error creating collage from {', '.join(names)}: {e}")
+            output_path = None
+        # Never retry these files, even if rendering failed
+        self.generator.mark_images_used(names, output_path, dimensions=self.dimensions)
+        return output_path
+
+    def poll(self) -> List[str]:
+        """Runs one iteration of the watch loop.
+
+        Returns:
+            List[str]: The paths of the collages rendered in this iteration.
+        """
+        names = self.source.wait(self.poll_interval)
+        now = time.monotonic()
+        for name in names:
+            self._track(name, now)
+        self._settle(now)
+
+        outputs = []
+        while len(self._ready) >= self.group_size:
+            group, self._ready = self._ready[:self.group_size], self._ready[self.group_size:]
+            outputs.append(self._render([name for name, _ in group]))
+
+        if self._ready and now - self._ready[0][1] >= self.window:
+            group, self._ready = self._ready, []
+            outputs.append(self._render([name for name, _ in group]))
+
+        return [output for output in outputs if output]
+
+    def run(self, max_collages: int = None):
+        """Watches until stop() is called or max_collages collages have been rendered.
+
+        Args:
+            max_collages (int, optional): Stop after this many collages. Defaults to None (forever).
+        """
+        source = type(self.source).__name__.replace('Source', '').lower()
+        print(f"Watching {self.generator.images_dir} ({source}) for new images...")
+        rendered = 0
+        try:
+            while not self._stopped:
+                rendered += len(self.poll())
+                if max_collages is not None and rendered >= max_collages:
+                    break
+        finally:
+            self.source.close()
+
+    def stop(self):
+        """Asks run() to return after the current iteration."""
+        self._stopped = True